@@ -3,6 +3,11 @@ ASGI config for cafeterias_sucre project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The chat view (chat.views.enviar_mensaje) is async; served from here, e.g.
+``uvicorn cafeterias_sucre.asgi:application --workers 2``, each worker keeps
+many chats waiting on OpenAI at once through a shared client
+(chat/cliente_openai.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -144,14 +144,109 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # API Keys
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='sk-proj-tu-clave-aqui')
+# Vacío usa la API real; para pruebas de carga apuntar al servidor simulado
+# (python manage.py servidor_openai_simulado), p. ej. http://127.0.0.1:8001/v1
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='') or None
+
+# Cliente de OpenAI compartido (chat/cliente_openai.py): tiempos límite en segundos,
+# reintentos y llamadas simultáneas por proceso en la vista asíncrona del chat
+OPENAI_TIMEOUT = config('OPENAI_TIMEOUT', default=20.0, cast=float)
+OPENAI_TIMEOUT_CONEXION = config('OPENAI_TIMEOUT_CONEXION', default=5.0, cast=float)
+OPENAI_REINTENTOS = config('OPENAI_REINTENTOS', default=1, cast=int)
+OPENAI_MAX_CONCURRENCIA = config('OPENAI_MAX_CONCURRENCIA', default=20, cast=int)
+
+# Circuit breaker de OpenAI (chat/circuito.py): con al menos MIN_LLAMADAS en la
+# ventana, si fallan o tardan más de LENTA segundos en la proporción indicada, el
+# chat usa el respaldo durante ENFRIAMIENTO segundos y luego prueba con una solicitud
+OPENAI_CIRCUITO_VENTANA = config('OPENAI_CIRCUITO_VENTANA', default=60, cast=int)
+OPENAI_CIRCUITO_MIN_LLAMADAS = config('OPENAI_CIRCUITO_MIN_LLAMADAS', default=10, cast=int)
+OPENAI_CIRCUITO_TASA_ERRORES = config('OPENAI_CIRCUITO_TASA_ERRORES', default=0.5, cast=float)
+OPENAI_CIRCUITO_LENTA = config('OPENAI_CIRCUITO_LENTA', default=8.0, cast=float)
+OPENAI_CIRCUITO_TASA_LENTAS = config('OPENAI_CIRCUITO_TASA_LENTAS', default=0.8, cast=float)
+OPENAI_CIRCUITO_ENFRIAMIENTO = config('OPENAI_CIRCUITO_ENFRIAMIENTO', default=30, cast=int)
+
+# Caché de respuestas del chatbot (chat/cache_respuestas.py): cuánto dura cada
+# respuesta, cuántas se guardan como máximo y cuántos mensajes previos de la
+# conversación forman parte de la clave
+CHAT_CACHE_TTL = config('CHAT_CACHE_TTL', default=6 * 60 * 60, cast=int)
+CHAT_CACHE_MAX = config('CHAT_CACHE_MAX', default=2000, cast=int)
+CHAT_CACHE_TURNOS_CONTEXTO = config('CHAT_CACHE_TURNOS_CONTEXTO', default=2, cast=int)
+
+# Caché semántico (chat/cache_semantico.py): preguntas con similitud coseno mayor
+# o igual al umbral y los mismos términos clave reutilizan la respuesta. El umbral
+# es el menor sin errores en chat/fixtures/pares_semanticos.json según
+# `manage.py evaluar_cache_semantico`
+CHAT_SEMANTICO = config('CHAT_SEMANTICO', default=True, cast=bool)
+CHAT_SEMANTICO_UMBRAL = config('CHAT_SEMANTICO_UMBRAL', default=0.77, cast=float)
+CHAT_SEMANTICO_MAX = config('CHAT_SEMANTICO_MAX', default=2000, cast=int)
+
+# Límites de solicitudes (chat/limites.py): cubetas de tokens por usuario y por IP.
+# RAFAGA son las solicitudes seguidas que se aceptan y POR_MINUTO las que se recuperan
+# por minuto; la cubeta por IP admite LIMITE_FACTOR_IP veces más
+LIMITE_CHAT_RAFAGA = config('LIMITE_CHAT_RAFAGA', default=10, cast=int)
+LIMITE_CHAT_POR_MINUTO = config('LIMITE_CHAT_POR_MINUTO', default=6, cast=float)
+LIMITE_AUDIO_RAFAGA = config('LIMITE_AUDIO_RAFAGA', default=10, cast=int)
+LIMITE_AUDIO_POR_MINUTO = config('LIMITE_AUDIO_POR_MINUTO', default=10, cast=float)
+LIMITE_FACTOR_IP = config('LIMITE_FACTOR_IP', default=3, cast=int)
+# Tokens de OpenAI (prompt + respuesta) que puede gastar una conversación antes de
+# seguir solo con el respaldo inteligente (0 = sin límite)
+CHAT_TOKENS_POR_CONVERSACION = config('CHAT_TOKENS_POR_CONVERSACION', default=20000, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Separado del default para que las respuestas no desplacen los datos del mapa
+    'chat': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chat-respuestas',
+        'TIMEOUT': CHAT_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': CHAT_CACHE_MAX},
+    },
+}
+
+# Segundos que se guarda en caché el rol de cada usuario (dueño o no). Las señales lo
+# borran al cambiar la solicitud, pero con LocMem solo en el proceso que hizo el cambio
+ROL_USUARIO_TIMEOUT = config('ROL_USUARIO_TIMEOUT', default=300, cast=int)
+
 MAPBOX_ACCESS_TOKEN = config('MAPBOX_ACCESS_TOKEN', default='pk.eyJ1IjoiZWZyYTAyOCIsImEiOiJjbWY2d25taWQwbDNhMmlxMzVyMHY4em52In0.VRnf0M7aTUL4Zw4AjYy0Rg')
 
+# Optimización de rutas (presupuesto de tiempo por solicitud)
+RUTA_LIMITE_MS = config('RUTA_LIMITE_MS', default=200, cast=int)
+VELOCIDAD_CAMINATA_KMH = config('VELOCIDAD_CAMINATA_KMH', default=4.5, cast=float)
+ESTANCIA_CAFETERIA_MIN = config('ESTANCIA_CAFETERIA_MIN', default=30, cast=int)
+# Horario que el planificador asume para las cafeterías sin horario cargado ese día
+# (HH:MM-HH:MM, igual que el horario por defecto de Cafeteria); vacío = se omiten
+HORARIO_SIN_CARGAR = config('HORARIO_SIN_CARGAR', default='08:00-20:00')
+
+# Matriz precalculada de distancias a pie (python manage.py calcular_matriz_distancias)
+MATRIZ_DISTANCIAS_DIR = config('MATRIZ_DISTANCIAS_DIR', default=str(BASE_DIR / 'datos' / 'matriz_distancias'))
+FACTOR_RODEO = config('FACTOR_RODEO', default=1.3, cast=float)  # Distancia a pie / distancia en línea recta
+
+# Contador de me gusta: con ME_GUSTA_DIFERIDO los cambios se acumulan en la caché
+# y `python manage.py volcar_me_gusta --continuo` los escribe en lote cada
+# ME_GUSTA_INTERVALO_VOLCADO segundos (requiere una caché compartida entre procesos
+# que admita contadores negativos, p. ej. Redis)
+ME_GUSTA_DIFERIDO = config('ME_GUSTA_DIFERIDO', default=False, cast=bool)
+ME_GUSTA_INTERVALO_VOLCADO = config('ME_GUSTA_INTERVALO_VOLCADO', default=5, cast=int)
+
 # Amazon Polly Configuration
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')
 AWS_REGION = config('AWS_REGION', default='us-east-1')
 POLLY_VOICE_ID = config('POLLY_VOICE_ID', default='Lupe')  # Voz femenina en español
+# Voces que se pueden pedir además de POLLY_VOICE_ID (el resto se rechaza) y para las
+# que `python manage.py precalcular_audio` genera las respuestas fijas
+POLLY_VOCES = config('POLLY_VOCES', default=POLLY_VOICE_ID, cast=Csv())
 USAR_POLLY_PARA_AUDIO = config('USAR_POLLY_PARA_AUDIO', default=True, cast=bool)
+# Caché en disco del audio de Polly (core/cache_audio.py); al pasar el máximo se
+# borran los clips menos usados
+TTS_CACHE_DIR = config('TTS_CACHE_DIR', default=str(BASE_DIR / 'datos' / 'audio_tts'))
+TTS_CACHE_MAX_MB = config('TTS_CACHE_MAX_MB', default=200, cast=int)
+# Respuestas largas: cada frase se genera aparte y en paralelo (hasta TTS_HILOS
+# llamadas a Polly por proceso) para que el audio empiece con la primera
+TTS_POR_FRASES = config('TTS_POR_FRASES', default=True, cast=bool)
+TTS_HILOS = config('TTS_HILOS', default=4, cast=int)
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Para desarrollo
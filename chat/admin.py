@@ -10,7 +10,7 @@ class MensajeInline(admin.TabularInline):
 
 @admin.register(Conversacion)
 class ConversacionAdmin(admin.ModelAdmin):
-    list_display = ['usuario', 'fecha_inicio', 'activa']
+    list_display = ['usuario', 'fecha_inicio', 'activa', 'tokens_prompt', 'tokens_respuesta']
     list_filter = ['activa', 'fecha_inicio']
     search_fields = ['usuario__username']
     inlines = [MensajeInline]
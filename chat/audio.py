@@ -0,0 +1,118 @@
+"""
+Respuestas HTTP con el audio MP3 del asistente, para reproducirlo con
+<audio src>: el navegador empieza a sonar con las primeras partes y pide
+rangos (Range) para adelantar o retomar la descarga.
+
+El contenido de cada URL no cambia (depende solo del texto y la voz), así
+que se puede guardar en el navegador y revalidar con su ETag.
+
+Bajo ASGI Django junta completo un iterador síncrono antes de enviarlo, así
+que ahí las partes se entregan con un generador asíncrono que lee cada una
+en un hilo; bajo WSGI se usa el iterador tal cual.
+"""
+import asyncio
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+
+
+CACHE_CONTROL_AUDIO = 'private, max-age=2592000, immutable'
+TAMANO_LECTURA = 64 * 1024
+
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _encabezados(response, clave):
+    response['ETag'] = f'"{clave}"'
+    response['Cache-Control'] = CACHE_CONTROL_AUDIO
+    return response
+
+
+def _sin_cambios(request, clave):
+    return request.headers.get('If-None-Match') == f'"{clave}"'
+
+
+def _rango(cabecera, tamano):
+    """(inicio, fin) inclusive pedido en `cabecera`, None si no hay uno válido o False si no se puede servir"""
+    encontrado = _RANGO.match(cabecera or '')
+    if not encontrado or not any(encontrado.groups()):
+        return None
+    desde, hasta = encontrado.groups()
+    if desde:
+        inicio = int(desde)
+        fin = min(int(hasta), tamano - 1) if hasta else tamano - 1
+    else:
+        # bytes=-N: los últimos N bytes
+        inicio, fin = max(0, tamano - int(hasta)), tamano - 1
+    if inicio > fin or inicio >= tamano:
+        return False
+    return inicio, fin
+
+
+def _leer(archivo, cantidad):
+    with archivo:
+        while cantidad > 0:
+            parte = archivo.read(min(TAMANO_LECTURA, cantidad))
+            if not parte:
+                break
+            cantidad -= len(parte)
+            yield parte
+
+
+async def _partes_async(partes):
+    partes = iter(partes)
+    siguiente = sync_to_async(next, thread_sensitive=False)
+    pendiente = None
+    try:
+        while True:
+            # shield: si el cliente se desconecta, el hilo sigue leyendo la parte en curso
+            pendiente = asyncio.ensure_future(siguiente(partes, None))
+            parte = await asyncio.shield(pendiente)
+            if parte is None:
+                break
+            yield parte
+    finally:
+        if pendiente is not None and not pendiente.done():
+            await asyncio.wait([pendiente])
+        # Cierra el generador síncrono (p. ej. para que guardar_partes termine de escribir)
+        cerrar = getattr(partes, 'close', None)
+        if cerrar is not None:
+            await sync_to_async(cerrar, thread_sensitive=False)()
+
+
+def _para_servidor(request, partes):
+    """Iterador de `partes` que el servidor puede enviar sin juntarlo primero"""
+    return _partes_async(partes) if isinstance(request, ASGIRequest) else partes
+
+
+def respuesta_mp3(request, ruta, clave):
+    """MP3 guardado en disco, completo o el rango pedido (206)"""
+    if _sin_cambios(request, clave):
+        return _encabezados(HttpResponse(status=304), clave)
+
+    tamano = ruta.stat().st_size
+    rango = _rango(request.headers.get('Range'), tamano)
+    if rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return response
+
+    inicio, fin = rango or (0, tamano - 1)
+    archivo = open(ruta, 'rb')
+    archivo.seek(inicio)
+    response = StreamingHttpResponse(_para_servidor(request, _leer(archivo, fin - inicio + 1)),
+                                     status=200 if rango is None else 206, content_type='audio/mpeg')
+    response['Content-Length'] = str(fin - inicio + 1)
+    if rango is not None:
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    response['Accept-Ranges'] = 'bytes'
+    return _encabezados(response, clave)
+
+
+def respuesta_mp3_partes(request, partes, clave):
+    """MP3 que se está generando: se envía por partes, sin largo ni rangos todavía"""
+    response = StreamingHttpResponse(_para_servidor(request, partes), content_type='audio/mpeg')
+    response['X-Accel-Buffering'] = 'no'  # Evita que nginx acumule el audio
+    return _encabezados(response, clave)
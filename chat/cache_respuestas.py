@@ -0,0 +1,193 @@
+"""
+Caché de respuestas del chatbot para preguntas repetidas.
+
+La clave combina el mensaje del usuario normalizado (minúsculas, sin tildes
+ni signos) con una huella de los últimos CHAT_CACHE_TURNOS_CONTEXTO mensajes
+de la conversación, para que "hola" al empezar no reciba la misma respuesta
+que "hola" en medio de una ruta. Las respuestas se guardan en el caché
+'chat' (ver settings.CACHES), que expira a las CHAT_CACHE_TTL segundos y
+descarta las menos usadas al llenarse (LRU).
+
+Si llegan a la vez varias preguntas con la misma clave, solo la primera
+consulta a OpenAI y las demás esperan su resultado, también cuando la
+primera la recibe por streaming (ver aobtener_o_anunciar).
+"""
+import asyncio
+import hashlib
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+
+CACHE_CLAVE_RESPUESTA = 'chat:respuesta:{huella}'
+CACHE_CONTADOR = 'chat:cache:{nombre}'
+
+# 'semanticos' son fallos de este caché respondidos por cache_semantico
+CONTADORES = ('aciertos', 'fallos', 'agrupadas', 'semanticos')
+
+_SIN_SIGNOS = re.compile(r'[^a-z0-9ñ]+')
+
+
+def _cache():
+    return caches['chat']
+
+
+def normalizar(texto):
+    """'¿Recomiéndame   un CAFÉ?' -> 'recomiendame un cafe'"""
+    texto = texto.lower().replace('ñ', '\0')
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).replace('\0', 'ñ')
+    return _SIN_SIGNOS.sub(' ', texto).strip()
+
+
+def clave_respuesta(messages):
+    """
+    Clave para los mensajes que se enviarán a OpenAI: el último es la
+    pregunta del usuario y los anteriores (sin el de sistema) el contexto.
+    """
+    turnos = settings.CHAT_CACHE_TURNOS_CONTEXTO
+    contexto = messages[1:-1][-turnos:] if turnos else []
+    partes = [normalizar(messages[-1]['content'])]
+    partes += [f"{m['role']}:{normalizar(m['content'])}" for m in contexto]
+    huella = hashlib.sha1('\n'.join(partes).encode('utf-8')).hexdigest()
+    return CACHE_CLAVE_RESPUESTA.format(huella=huella)
+
+
+def contar(nombre):
+    clave = CACHE_CONTADOR.format(nombre=nombre)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, None)
+
+
+def estadisticas_cache():
+    """Contadores de aciertos, fallos, consultas agrupadas y respuestas semánticas"""
+    datos = cache.get_many([CACHE_CONTADOR.format(nombre=nombre) for nombre in CONTADORES])
+    datos = {nombre: datos.get(CACHE_CONTADOR.format(nombre=nombre), 0) for nombre in CONTADORES}
+    consultas = datos['aciertos'] + datos['fallos'] + datos['agrupadas']
+    datos['tasa_aciertos'] = round((datos['aciertos'] + datos['agrupadas']) / consultas, 3) if consultas else 0.0
+    return datos
+
+
+def guardar_respuesta(clave, respuesta):
+    _cache().set(clave, respuesta)
+
+
+class _Consulta:
+    """Consulta a OpenAI en curso que otros hilos pueden esperar"""
+
+    def __init__(self):
+        self.lista = threading.Event()
+        self.respuesta = None
+        self.error = None
+
+
+_en_curso = {}
+_en_curso_lock = threading.Lock()
+
+
+def obtener_o_generar(clave, generar):
+    """
+    Respuesta guardada para `clave` o, si no hay, la que retorne
+    generar(). Si generar() retorna None no se guarda nada.
+    """
+    respuesta = _cache().get(clave)
+    if respuesta is not None:
+        contar('aciertos')
+        return respuesta
+
+    with _en_curso_lock:
+        consulta = _en_curso.get(clave)
+        primera = consulta is None
+        if primera:
+            consulta = _en_curso[clave] = _Consulta()
+
+    if not primera:
+        contar('agrupadas')
+        consulta.lista.wait()
+        if consulta.error is not None:
+            raise consulta.error
+        return consulta.respuesta
+
+    contar('fallos')
+    try:
+        consulta.respuesta = generar()
+        if consulta.respuesta is not None:
+            guardar_respuesta(clave, consulta.respuesta)
+        return consulta.respuesta
+    except Exception as e:
+        consulta.error = e
+        raise
+    finally:
+        with _en_curso_lock:
+            del _en_curso[clave]
+        consulta.lista.set()
+
+
+_tareas = {}
+
+
+async def aobtener_o_generar(clave, generar):
+    """Igual que obtener_o_generar, con generar() asíncrona"""
+    respuesta = await _cache().aget(clave)
+    if respuesta is not None:
+        contar('aciertos')
+        return respuesta
+
+    tarea = _tareas.get(clave)
+    if tarea is not None and tarea.get_loop() is asyncio.get_running_loop():
+        contar('agrupadas')
+        # shield: si esta solicitud se cancela, la consulta sigue para las demás
+        return await asyncio.shield(tarea)
+
+    contar('fallos')
+
+    async def consultar():
+        try:
+            respuesta = await generar()
+            if respuesta is not None:
+                await _cache().aset(clave, respuesta)
+            return respuesta
+        finally:
+            if _tareas.get(clave) is tarea:
+                del _tareas[clave]
+
+    tarea = _tareas[clave] = asyncio.ensure_future(consultar())
+    return await asyncio.shield(tarea)
+
+
+async def aobtener_o_anunciar(clave):
+    """
+    Para respuestas por streaming, que no pasan por aobtener_o_generar:
+    retorna (respuesta, None) si está guardada o si otra solicitud ya la está
+    consultando, esperando su resultado (None si no obtuvo respuesta). Si no,
+    retorna (None, futuro): quien llama consulta a OpenAI y entrega el
+    resultado con publicar_respuesta.
+    """
+    respuesta = await _cache().aget(clave)
+    if respuesta is not None:
+        contar('aciertos')
+        return respuesta, None
+
+    tarea = _tareas.get(clave)
+    if tarea is not None and tarea.get_loop() is asyncio.get_running_loop():
+        contar('agrupadas')
+        return await asyncio.shield(tarea), None
+
+    contar('fallos')
+    futuro = _tareas[clave] = asyncio.get_running_loop().create_future()
+    return None, futuro
+
+
+def publicar_respuesta(clave, futuro, respuesta):
+    """Guarda `respuesta` (si no es None) y la entrega a quienes esperan `clave`"""
+    if respuesta is not None:
+        guardar_respuesta(clave, respuesta)
+    if _tareas.get(clave) is futuro:
+        del _tareas[clave]
+    if not futuro.done():
+        futuro.set_result(respuesta)
@@ -0,0 +1,181 @@
+"""
+Caché semántico: responde preguntas parecidas a otras ya respondidas por
+OpenAI sin volver a consultarlo.
+
+Cada pregunta se convierte en un vector TF-IDF de n-gramas de caracteres
+(3 a 5) con hashing en DIMENSIONES posiciones, así "recomiéndame un café
+fuerte" y "me recomiendas cafe fuerte?" quedan cerca aunque no sean iguales.
+Los vectores van en una matriz float32 de CHAT_SEMANTICO_MAX filas que se
+recorre como un buffer circular; la búsqueda es un producto matriz-vector y
+si la similitud coseno supera CHAT_SEMANTICO_UMBRAL se reutiliza la
+respuesta guardada.
+
+La similitud de n-gramas no distingue "cafetería con wifi" de "cafetería
+sin wifi" ni "café fuerte" de "café suave": una pregunta solo reutiliza la
+respuesta de otra con los mismos términos clave (negaciones, números,
+palabras clave del respaldo y TERMINOS_CLAVE).
+
+El IDF se ajusta una vez por proceso con los últimos mensajes de usuarios
+guardados en Mensaje. Solo se usa para preguntas sin contexto previo en la
+conversación: a mitad de una charla "sí, esa" no significa lo mismo en
+todas. La evaluación fuera de línea, con el historial y con pares de preguntas
+etiquetados, está en `python manage.py evaluar_cache_semantico`.
+"""
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .cache_respuestas import contar, normalizar
+from .respaldo import motor_intenciones, patron_palabras, sin_tildes
+
+
+DIMENSIONES = 2048
+NGRAMAS = (3, 4, 5)
+
+# Mensajes de usuario usados para ajustar el IDF
+MENSAJES_AJUSTE = 5000
+
+# Palabras que cambian el sentido de una pregunta, además de las del respaldo.
+# Van sin tildes; con * coinciden con cualquier palabra que empiece así
+NEGACIONES = ('no', 'sin', 'ni', 'nunca', 'tampoco', 'ningun*', 'nada')
+TERMINOS_CLAVE = NEGACIONES + (
+    'wifi', 'enchufe*', 'caliente*', 'barat*', 'caro', 'cara', 'caros', 'caras', 'economic*',
+    'abiert*', 'cerrad*', 'cerca', 'lejos', 'noche*', 'manana*', 'temprano',
+    'descafeinad*', 'vainilla*', 'caramelo*', 'canela*', 'leche*', 'azucar*', 'vegan*', 'postre*',
+)
+
+_TERMINOS = patron_palabras(TERMINOS_CLAVE)
+_NUMEROS = re.compile(r'\d+')
+
+
+def terminos_clave(pregunta):
+    """Términos que deben coincidir para que dos preguntas parecidas sean la misma"""
+    texto = pregunta.lower()
+    return (frozenset(sin_tildes(termino) for termino in _TERMINOS.findall(texto))
+            | motor_intenciones.claves(pregunta) | frozenset(_NUMEROS.findall(texto)))
+
+
+def _ngramas(texto):
+    texto = f' {normalizar(texto)} '
+    for n in NGRAMAS:
+        for i in range(len(texto) - n + 1):
+            yield texto[i:i + n]
+
+
+def _frecuencias(textos):
+    """Matriz (len(textos), DIMENSIONES) con la frecuencia de cada n-grama"""
+    matriz = np.zeros((len(textos), DIMENSIONES), dtype=np.float32)
+    for fila, texto in enumerate(textos):
+        posiciones = [zlib.crc32(g.encode('utf-8')) % DIMENSIONES for g in _ngramas(texto)]
+        np.add.at(matriz[fila], posiciones, 1.0)
+    return matriz
+
+
+class Vectorizador:
+    """TF-IDF con tf logarítmico y normalización L2"""
+
+    def __init__(self, idf=None):
+        self.idf = idf if idf is not None else np.ones(DIMENSIONES, dtype=np.float32)
+
+    @classmethod
+    def ajustar(cls, textos):
+        if not textos:
+            return cls()
+        presentes = (_frecuencias(textos) > 0).sum(axis=0)
+        idf = np.log((1 + len(textos)) / (1 + presentes)) + 1.0
+        return cls(idf.astype(np.float32))
+
+    def transformar(self, textos):
+        matriz = np.log1p(_frecuencias(textos)) * self.idf
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        return np.divide(matriz, normas, out=np.zeros_like(matriz), where=normas > 0)
+
+
+class CacheSemantico:
+    """Preguntas y respuestas recientes con búsqueda del vecino más cercano"""
+
+    def __init__(self, vectorizador, capacidad, ttl):
+        self.vectorizador = vectorizador
+        self.ttl = ttl
+        self.vectores = np.zeros((capacidad, DIMENSIONES), dtype=np.float32)
+        self.guardado = np.full(capacidad, -np.inf)
+        self.respuestas = [None] * capacidad
+        self.terminos = [None] * capacidad
+        self.siguiente = 0
+        self._lock = threading.Lock()
+
+    def buscar(self, pregunta, umbral):
+        """
+        (respuesta, similitud) de la pregunta más parecida con sus mismos
+        términos clave, o (None, similitud de la más parecida)
+        """
+        vector = self.vectorizador.transformar([pregunta])[0]
+        terminos = terminos_clave(pregunta)
+        with self._lock:
+            similitudes = self.vectores @ vector
+            similitudes[self.guardado < time.time() - self.ttl] = -1.0
+            candidatas = np.flatnonzero(similitudes >= umbral)
+            for fila in candidatas[np.argsort(-similitudes[candidatas], kind='stable')]:
+                if self.terminos[fila] == terminos:
+                    return self.respuestas[fila], float(similitudes[fila])
+            return None, float(similitudes.max())
+
+    def agregar(self, pregunta, respuesta):
+        vector = self.vectorizador.transformar([pregunta])[0]
+        terminos = terminos_clave(pregunta)
+        with self._lock:
+            fila = self.siguiente
+            self.vectores[fila] = vector
+            self.guardado[fila] = time.time()
+            self.respuestas[fila] = respuesta
+            self.terminos[fila] = terminos
+            self.siguiente = (fila + 1) % len(self.respuestas)
+
+
+def preguntas_historial(limite=MENSAJES_AJUSTE):
+    from .models import Mensaje
+
+    return list(
+        Mensaje.objects.filter(tipo='U').order_by('-timestamp').values_list('contenido', flat=True)[:limite]
+    )
+
+
+_cache_semantico = None
+_cache_semantico_lock = threading.Lock()
+
+
+def obtener_cache_semantico():
+    """CacheSemantico del proceso; el primero ajusta el IDF con el historial"""
+    global _cache_semantico
+    with _cache_semantico_lock:
+        if _cache_semantico is None:
+            _cache_semantico = CacheSemantico(
+                Vectorizador.ajustar(preguntas_historial()),
+                settings.CHAT_SEMANTICO_MAX,
+                settings.CHAT_CACHE_TTL,
+            )
+        return _cache_semantico
+
+
+def sin_contexto(messages):
+    """True si el prompt solo tiene las instrucciones y la pregunta"""
+    return len(messages) == 2
+
+
+def buscar_respuesta_similar(messages):
+    if not settings.CHAT_SEMANTICO or not sin_contexto(messages):
+        return None
+    respuesta, similitud = obtener_cache_semantico().buscar(messages[-1]['content'], settings.CHAT_SEMANTICO_UMBRAL)
+    if respuesta is not None:
+        contar('semanticos')
+        print(f"🧲 Caché semántico: pregunta similar ({similitud:.2f}) - sin llamar a OpenAI")
+    return respuesta
+
+
+def recordar_respuesta(messages, respuesta):
+    if settings.CHAT_SEMANTICO and sin_contexto(messages):
+        obtener_cache_semantico().agregar(messages[-1]['content'], respuesta)
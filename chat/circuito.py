@@ -0,0 +1,179 @@
+"""
+Circuit breaker para las llamadas a OpenAI.
+
+Cada llamada se anota en una ventana de OPENAI_CIRCUITO_VENTANA segundos,
+dividida en tramos de CIRCUITO_TRAMO segundos: llamadas, errores, lentas
+(más de OPENAI_CIRCUITO_LENTA segundos) y milisegundos totales. Con al menos
+OPENAI_CIRCUITO_MIN_LLAMADAS en la ventana, si la proporción de errores o de
+lentas llega a su umbral el circuito se abre y durante
+OPENAI_CIRCUITO_ENFRIAMIENTO segundos el chat responde con el respaldo sin
+esperar a OpenAI. Pasado ese tiempo queda semiabierto: una sola solicitud
+prueba OpenAI; si responde bien se cierra y si no vuelve a abrirse. Mientras
+no está cerrado solo cuenta el resultado de esa sonda: las llamadas que
+empezaron antes de abrirse y terminan durante el enfriamiento se ignoran.
+
+El estado y los contadores están en la caché por defecto; para que todos los
+procesos vean el mismo circuito debe ser compartida (p. ej. Redis).
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CACHE_CIRCUITO_ESTADO = 'chat:circuito:estado'
+CACHE_CIRCUITO_SONDA = 'chat:circuito:sonda'
+CACHE_CIRCUITO_TRAMO = 'chat:circuito:{generacion}:{tramo}:{campo}'
+CACHE_CIRCUITO_TOTAL = 'chat:circuito:total:{campo}'
+
+CERRADO, ABIERTO, SEMIABIERTO = 'cerrado', 'abierto', 'semiabierto'
+SONDA = 'sonda'
+
+CIRCUITO_TRAMO = 10
+CAMPOS_VENTANA = ('llamadas', 'errores', 'lentas', 'ms')
+CAMPOS_TOTALES = ('aperturas', 'cortocircuitos', 'sondas')
+
+
+class CircuitoAbierto(Exception):
+    """OpenAI no se consulta mientras el circuito está abierto"""
+
+
+def _estado():
+    return cache.get(CACHE_CIRCUITO_ESTADO) or {'estado': CERRADO, 'hasta': 0, 'generacion': 0}
+
+
+def _guardar_estado(estado, hasta, generacion):
+    cache.set(CACHE_CIRCUITO_ESTADO, {'estado': estado, 'hasta': hasta, 'generacion': generacion}, None)
+
+
+def _sumar(clave, cantidad, timeout):
+    if not cache.add(clave, cantidad, timeout):
+        try:
+            cache.incr(clave, cantidad)
+        except ValueError:
+            # La clave expiró entre add e incr
+            cache.set(clave, cantidad, timeout)
+
+
+def _tramos(ahora):
+    actual = int(ahora // CIRCUITO_TRAMO)
+    return range(actual - settings.OPENAI_CIRCUITO_VENTANA // CIRCUITO_TRAMO + 1, actual + 1)
+
+
+def _ventana(generacion, ahora):
+    """Suma de cada campo en los tramos de la ventana actual"""
+    claves = {
+        (tramo, campo): CACHE_CIRCUITO_TRAMO.format(generacion=generacion, tramo=tramo, campo=campo)
+        for tramo in _tramos(ahora) for campo in CAMPOS_VENTANA
+    }
+    valores = cache.get_many(claves.values())
+    return {campo: sum(valores.get(claves[tramo, campo], 0) for tramo in _tramos(ahora))
+            for campo in CAMPOS_VENTANA}
+
+
+def _abrir(generacion, ahora):
+    _guardar_estado(ABIERTO, ahora + settings.OPENAI_CIRCUITO_ENFRIAMIENTO, generacion)
+    cache.delete(CACHE_CIRCUITO_SONDA)
+    _sumar(CACHE_CIRCUITO_TOTAL.format(campo='aperturas'), 1, None)
+    print(f"⚡ Circuito OpenAI abierto por {settings.OPENAI_CIRCUITO_ENFRIAMIENTO} s - respaldo directo")
+
+
+def permitir():
+    """
+    True si se puede llamar a OpenAI. Con el circuito abierto retorna False
+    hasta que termina el enfriamiento; entonces deja pasar una sola sonda, para
+    la que retorna SONDA.
+    """
+    estado = _estado()
+    if estado['estado'] == CERRADO:
+        return True
+    if estado['estado'] == ABIERTO and time.time() < estado['hasta']:
+        _sumar(CACHE_CIRCUITO_TOTAL.format(campo='cortocircuitos'), 1, None)
+        return False
+
+    # La sonda expira si su solicitud se pierde sin registrar el resultado
+    if cache.add(CACHE_CIRCUITO_SONDA, 1, settings.OPENAI_TIMEOUT * 2):
+        _guardar_estado(SEMIABIERTO, estado['hasta'], estado['generacion'])
+        _sumar(CACHE_CIRCUITO_TOTAL.format(campo='sondas'), 1, None)
+        print("🔌 Circuito OpenAI semiabierto - probando con una solicitud")
+        return SONDA
+    _sumar(CACHE_CIRCUITO_TOTAL.format(campo='cortocircuitos'), 1, None)
+    return False
+
+
+def registrar(exito, duracion, sonda=False):
+    """
+    Anota el resultado de una llamada a OpenAI que tardó `duracion` segundos.
+    `sonda` indica que la llamada es la que `permitir` dejó pasar como sonda.
+    """
+    ahora = time.time()
+    estado = _estado()
+    lenta = duracion > settings.OPENAI_CIRCUITO_LENTA
+
+    if estado['estado'] != CERRADO:
+        if not sonda:
+            # Empezó antes de abrirse el circuito: no cambia el estado
+            return
+        if exito and not lenta:
+            # Se cierra con una ventana nueva: los fallos anteriores ya no cuentan
+            _guardar_estado(CERRADO, 0, estado['generacion'] + 1)
+            cache.delete(CACHE_CIRCUITO_SONDA)
+            print("✅ Circuito OpenAI cerrado - OpenAI responde de nuevo")
+        else:
+            _abrir(estado['generacion'], ahora)
+        return
+
+    tramo = int(ahora // CIRCUITO_TRAMO)
+    timeout = settings.OPENAI_CIRCUITO_VENTANA + CIRCUITO_TRAMO
+    generacion = estado['generacion']
+    for campo, cantidad in (('llamadas', 1), ('errores', not exito), ('lentas', lenta), ('ms', int(duracion * 1000))):
+        if cantidad:
+            _sumar(CACHE_CIRCUITO_TRAMO.format(generacion=generacion, tramo=tramo, campo=campo), int(cantidad), timeout)
+
+    if exito and not lenta:
+        return
+    ventana = _ventana(generacion, ahora)
+    if ventana['llamadas'] < settings.OPENAI_CIRCUITO_MIN_LLAMADAS:
+        return
+    if (ventana['errores'] / ventana['llamadas'] >= settings.OPENAI_CIRCUITO_TASA_ERRORES
+            or ventana['lentas'] / ventana['llamadas'] >= settings.OPENAI_CIRCUITO_TASA_LENTAS):
+        _abrir(generacion, ahora)
+
+
+def estado_circuito():
+    """Estado actual, métricas de la ventana y totales desde que arrancó la caché"""
+    ahora = time.time()
+    estado = _estado()
+    ventana = _ventana(estado['generacion'], ahora)
+    llamadas = ventana['llamadas']
+    totales = cache.get_many([CACHE_CIRCUITO_TOTAL.format(campo=campo) for campo in CAMPOS_TOTALES])
+    return {
+        'estado': estado['estado'],
+        'segundos_para_sonda': max(0, round(estado['hasta'] - ahora)) if estado['estado'] == ABIERTO else 0,
+        'ventana_segundos': settings.OPENAI_CIRCUITO_VENTANA,
+        'llamadas': llamadas,
+        'tasa_errores': round(ventana['errores'] / llamadas, 3) if llamadas else 0.0,
+        'tasa_lentas': round(ventana['lentas'] / llamadas, 3) if llamadas else 0.0,
+        'latencia_media_ms': round(ventana['ms'] / llamadas) if llamadas else 0,
+        **{campo: totales.get(CACHE_CIRCUITO_TOTAL.format(campo=campo), 0) for campo in CAMPOS_TOTALES},
+    }
+
+
+@contextmanager
+def llamada_openai():
+    """
+    Envuelve una llamada a OpenAI: lanza CircuitoAbierto si no se permite y
+    registra el resultado y la duración.
+    """
+    permiso = permitir()
+    if not permiso:
+        raise CircuitoAbierto()
+    sonda = permiso == SONDA
+    inicio = time.monotonic()
+    try:
+        yield
+    except Exception:
+        registrar(False, time.monotonic() - inicio, sonda)
+        raise
+    registrar(True, time.monotonic() - inicio, sonda)
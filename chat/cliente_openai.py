@@ -0,0 +1,66 @@
+"""
+Clientes de OpenAI compartidos por todo el proceso.
+
+Crear un cliente por mensaje abre un pool de conexiones nuevo y repite el
+handshake TLS en cada llamada. Aquí se crea uno solo y se reutiliza, con sus
+conexiones keep-alive, los tiempos límite y los reintentos de settings.
+
+El cliente asíncrono queda ligado al event loop donde se creó: bajo ASGI hay
+un solo loop por proceso y se comparte entre todas las solicitudes; bajo WSGI
+Django ejecuta cada vista asíncrona en su propio loop y se crea uno por loop.
+"""
+import asyncio
+import threading
+
+import openai
+from django.conf import settings
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+_cliente_async = None
+_semaforo = None
+_loop = None
+
+
+def _opciones():
+    return {
+        'api_key': settings.OPENAI_API_KEY,
+        'base_url': settings.OPENAI_BASE_URL,
+        'timeout': openai.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_TIMEOUT_CONEXION),
+        'max_retries': settings.OPENAI_REINTENTOS,
+    }
+
+
+def obtener_cliente():
+    """Cliente síncrono del proceso (es seguro entre hilos)"""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = openai.OpenAI(**_opciones())
+        return _cliente
+
+
+def _preparar_loop():
+    global _cliente_async, _semaforo, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        _cliente_async = openai.AsyncOpenAI(**_opciones())
+        _semaforo = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCIA)
+        _loop = loop
+
+
+def obtener_cliente_async():
+    """Cliente asíncrono del event loop actual"""
+    _preparar_loop()
+    return _cliente_async
+
+
+def limite_concurrencia():
+    """
+    Semáforo que limita las llamadas simultáneas a OpenAI a
+    OPENAI_MAX_CONCURRENCIA; las demás esperan su turno.
+    """
+    _preparar_loop()
+    return _semaforo
@@ -0,0 +1,73 @@
+"""
+Contexto de la conversación que se envía a OpenAI, acotado sin importar lo
+larga que sea la charla.
+
+Se envían solo los MENSAJES_CONTEXTO mensajes más recientes, leídos con una
+consulta en orden inverso y con límite (índice conversacion + timestamp).
+Los mensajes más antiguos se resumen en Conversacion.resumen a medida que
+salen de esa ventana: de cada pregunta del usuario se guarda el comienzo,
+y el resumen nunca pasa de RESUMEN_MAX_CARACTERES.
+"""
+from .models import Conversacion
+
+
+MENSAJES_CONTEXTO = 4
+
+# Largo máximo del resumen y de cada pregunta dentro de él
+RESUMEN_MAX_CARACTERES = 400
+RESUMEN_CARACTERES_PREGUNTA = 80
+
+# Mensajes que se resumen como máximo por llamada (conversaciones antiguas sin resumen)
+RESUMEN_LOTE = 20
+
+SEPARADOR = ' | '
+
+
+def mensajes_recientes(conversacion, user_message, cantidad=MENSAJES_CONTEXTO):
+    """
+    Los `cantidad` mensajes anteriores al actual, del más antiguo al más
+    nuevo. Si el mensaje del usuario ya se guardó, no se repite.
+    """
+    recientes = list(conversacion.mensajes.order_by('-timestamp', '-id')[:cantidad + 1])
+    if recientes and recientes[0].tipo == 'U' and recientes[0].contenido == user_message:
+        recientes = recientes[1:]
+    return recientes[:cantidad][::-1]
+
+
+def _agregar_al_resumen(resumen, preguntas):
+    partes = [resumen] if resumen else []
+    for pregunta in preguntas:
+        pregunta = ' '.join(pregunta.split())
+        if len(pregunta) > RESUMEN_CARACTERES_PREGUNTA:
+            pregunta = pregunta[:RESUMEN_CARACTERES_PREGUNTA].rsplit(' ', 1)[0] + '…'
+        partes.append(pregunta)
+    resumen = SEPARADOR.join(partes)
+    # Se descartan las preguntas más antiguas hasta que quepa
+    while len(resumen) > RESUMEN_MAX_CARACTERES and SEPARADOR in resumen:
+        resumen = resumen.split(SEPARADOR, 1)[1]
+    return resumen[-RESUMEN_MAX_CARACTERES:]
+
+
+def actualizar_resumen(conversacion, recientes):
+    """
+    Agrega al resumen los mensajes anteriores a `recientes` que todavía no
+    se resumieron. Retorna el resumen actualizado.
+    """
+    if not recientes:
+        return conversacion.resumen
+    pendientes = list(
+        conversacion.mensajes
+        .filter(id__gt=conversacion.resumen_hasta, id__lt=recientes[0].id)
+        .order_by('-id')
+        .values_list('id', 'tipo', 'contenido')[:RESUMEN_LOTE]
+    )[::-1]
+    if not pendientes:
+        return conversacion.resumen
+
+    preguntas = [contenido for _, tipo, contenido in pendientes if tipo == 'U']
+    conversacion.resumen = _agregar_al_resumen(conversacion.resumen, preguntas)
+    conversacion.resumen_hasta = pendientes[-1][0]
+    Conversacion.objects.filter(pk=conversacion.pk).update(
+        resumen=conversacion.resumen, resumen_hasta=conversacion.resumen_hasta
+    )
+    return conversacion.resumen
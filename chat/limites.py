@@ -0,0 +1,107 @@
+"""
+Límites de uso del chat y de la voz.
+
+`limitar(nombre)` decora una vista con dos cubetas de tokens en la caché por
+defecto: una por usuario y otra por IP (la única para visitantes sin
+sesión). Cada cubeta admite LIMITE_<NOMBRE>_RAFAGA solicitudes seguidas y
+recupera LIMITE_<NOMBRE>_POR_MINUTO por minuto; la de IP admite
+LIMITE_FACTOR_IP veces más porque varios usuarios pueden compartir IP. Al
+agotarse la vista responde 429 con Retry-After.
+
+Leer y escribir la cubeta no es atómico: con muchas solicitudes simultáneas
+del mismo usuario pueden pasar unas pocas de más, suficiente para frenar a un
+cliente abusivo sin bloquear la caché.
+
+Cada conversación además acumula los tokens de OpenAI que gastó
+(`registrar_tokens`); al pasar CHAT_TOKENS_POR_CONVERSACION el chat sigue
+con el respaldo inteligente.
+"""
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import JsonResponse
+
+
+CACHE_CUBETA = 'limite:{nombre}:{clave}'
+
+
+def consumir(clave, rafaga, por_minuto, costo=1):
+    """Toma `costo` tokens de la cubeta; retorna 0 o los segundos hasta que alcancen"""
+    ahora = time.time()
+    tokens, antes = cache.get(clave) or (rafaga, ahora)
+    tokens = min(rafaga, tokens + (ahora - antes) * por_minuto / 60)
+    if tokens < costo:
+        return (costo - tokens) * 60 / por_minuto
+    # Pasado el tiempo de llenarse la cubeta, la clave puede expirar
+    cache.set(clave, (tokens - costo, ahora), math.ceil(rafaga * 60 / por_minuto) + 1)
+    return 0
+
+
+def _ip(request):
+    return request.META.get('REMOTE_ADDR') or 'desconocida'
+
+
+def _espera(nombre, request, usuario):
+    """Segundos que debe esperar el cliente, o 0 si la solicitud pasa"""
+    rafaga = getattr(settings, f'LIMITE_{nombre.upper()}_RAFAGA')
+    por_minuto = getattr(settings, f'LIMITE_{nombre.upper()}_POR_MINUTO')
+    factor = settings.LIMITE_FACTOR_IP
+
+    espera = consumir(CACHE_CUBETA.format(nombre=nombre, clave=f'ip:{_ip(request)}'),
+                      rafaga * factor, por_minuto * factor)
+    if not espera and usuario.is_authenticated:
+        espera = consumir(CACHE_CUBETA.format(nombre=nombre, clave=f'usuario:{usuario.pk}'), rafaga, por_minuto)
+    return espera
+
+
+def limite_excedido(nombre, request, usuario):
+    """Respuesta 429 si la solicitud supera las cubetas de `nombre`, o None"""
+    espera = _espera(nombre, request, usuario)
+    if not espera:
+        return None
+    print(f"🚦 Límite '{nombre}' alcanzado - reintentar en {espera:.0f} s")
+    response = JsonResponse({
+        'success': False,
+        'error': f'Demasiadas solicitudes. Intenta de nuevo en {math.ceil(espera)} segundos.'
+    }, status=429)
+    response['Retry-After'] = str(math.ceil(espera))
+    return response
+
+
+def limitar(nombre):
+    """Decorador de vistas (síncronas o asíncronas) con las cubetas de `nombre`"""
+    def decorador(vista):
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura(request, *args, **kwargs):
+                return (limite_excedido(nombre, request, await request.auser())
+                        or await vista(request, *args, **kwargs))
+        else:
+            @wraps(vista)
+            def envoltura(request, *args, **kwargs):
+                return limite_excedido(nombre, request, request.user) or vista(request, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def presupuesto_agotado(conversacion):
+    limite = settings.CHAT_TOKENS_POR_CONVERSACION
+    return bool(limite) and conversacion.tokens_prompt + conversacion.tokens_respuesta >= limite
+
+
+def registrar_tokens(conversacion, usage):
+    """Suma a la conversación los tokens del `usage` de una respuesta de OpenAI"""
+    if usage is None:
+        return
+    prompt, respuesta = usage.prompt_tokens or 0, usage.completion_tokens or 0
+    type(conversacion).objects.filter(pk=conversacion.pk).update(
+        tokens_prompt=F('tokens_prompt') + prompt,
+        tokens_respuesta=F('tokens_respuesta') + respuesta,
+    )
+    conversacion.tokens_prompt += prompt
+    conversacion.tokens_respuesta += respuesta
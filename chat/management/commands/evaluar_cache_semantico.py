@@ -0,0 +1,156 @@
+import json
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.cache_respuestas import normalizar
+from chat.cache_semantico import Vectorizador, preguntas_historial, terminos_clave
+from chat.models import Mensaje
+
+
+# Filas de la matriz de similitudes que se calculan a la vez
+BLOQUE = 1000
+
+# Pares de preguntas etiquetados: "mismo" indica si una puede reutilizar la respuesta de la otra
+PARES_ETIQUETADOS = Path(__file__).resolve().parents[2] / 'fixtures' / 'pares_semanticos.json'
+
+# Umbrales que se prueban para sugerir uno
+UMBRALES_SUGERENCIA = np.round(np.arange(0.50, 1.0, 0.01), 2)
+
+
+def pares_historial(todas=False):
+    """
+    (pregunta, respuesta) del historial en orden cronológico. Por defecto
+    solo la primera pregunta de cada conversación, que es la única que el
+    caché semántico atiende (no tiene contexto previo).
+    """
+    pares = []
+    actual, pendiente, primera = None, None, True
+    filas = Mensaje.objects.order_by('conversacion_id', 'timestamp', 'id').values_list(
+        'conversacion_id', 'tipo', 'contenido', 'timestamp'
+    )
+    for conversacion_id, tipo, contenido, timestamp in filas.iterator():
+        if conversacion_id != actual:
+            actual, pendiente, primera = conversacion_id, None, True
+        if tipo == 'U':
+            pendiente = (timestamp, contenido)
+        elif pendiente is not None:
+            if primera or todas:
+                pares.append((pendiente[0], pendiente[1], contenido))
+            pendiente, primera = None, False
+    pares.sort(key=lambda par: par[0])
+    return [(pregunta, respuesta) for _, pregunta, respuesta in pares]
+
+
+def mejores_anteriores(vectores, capacidad):
+    """Para cada pregunta, índice y similitud de la más parecida entre las `capacidad` anteriores"""
+    n = len(vectores)
+    indices = np.full(n, -1)
+    similitudes = np.full(n, -1.0, dtype=np.float32)
+    for inicio in range(0, n, BLOQUE):
+        fin = min(inicio + BLOQUE, n)
+        bloque = vectores[inicio:fin] @ vectores[:fin].T
+        filas = np.arange(inicio, fin)[:, None]
+        columnas = np.arange(fin)[None, :]
+        bloque[(columnas >= filas) | (columnas < filas - capacidad)] = -1.0
+        indices[inicio:fin] = bloque.argmax(axis=1)
+        similitudes[inicio:fin] = bloque.max(axis=1)
+    return indices, similitudes
+
+
+def evaluar_pares(pares, vectorizador, umbral):
+    """(parecidos reutilizados, distintos reutilizados por error) con `umbral` y el control de términos"""
+    aciertos = errores = 0
+    for par in pares:
+        a, b = vectorizador.transformar([par['a'], par['b']])
+        reutiliza = float(a @ b) >= umbral and terminos_clave(par['a']) == terminos_clave(par['b'])
+        if par['mismo']:
+            aciertos += reutiliza
+        else:
+            errores += reutiliza
+    return aciertos, errores
+
+
+class Command(BaseCommand):
+    help = 'Mide cuántas preguntas del historial de Mensaje habría respondido el caché semántico'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--umbrales', default='0.6,0.7,0.8,0.9',
+            help='Umbrales de similitud a comparar, separados por comas'
+        )
+        parser.add_argument(
+            '--todas', action='store_true',
+            help='Incluir también las preguntas con contexto previo en la conversación'
+        )
+        parser.add_argument(
+            '--ejemplos', type=int, default=5,
+            help='Pares de preguntas a mostrar cerca del umbral configurado'
+        )
+        parser.add_argument(
+            '--pares', default=str(PARES_ETIQUETADOS),
+            help='JSON con pares de preguntas etiquetados para sugerir el umbral'
+        )
+
+    def handle(self, *args, **options):
+        umbrales = sorted(float(u) for u in options['umbrales'].split(','))
+        vectorizador = Vectorizador.ajustar(preguntas_historial())
+        self.evaluar_etiquetados(options['pares'], vectorizador, umbrales)
+
+        pares = pares_historial(options['todas'])
+        if len(pares) < 2:
+            self.stdout.write(self.style.WARNING('⚠️ No hay suficientes preguntas en el historial'))
+            return
+
+        preguntas = [pregunta for pregunta, _ in pares]
+        vectores = vectorizador.transformar(preguntas)
+        indices, similitudes = mejores_anteriores(vectores, settings.CHAT_SEMANTICO_MAX)
+        # Aproximado: el caché también probaría las siguientes más parecidas
+        terminos = [terminos_clave(p) for p in preguntas]
+        similitudes[[terminos[i] != terminos[indices[i]] for i in range(len(preguntas))]] = -1.0
+
+        normalizadas = [normalizar(p) for p in preguntas]
+        vistas, exactas = set(), 0
+        for texto in normalizadas:
+            exactas += texto in vistas
+            vistas.add(texto)
+
+        total = len(pares)
+        self.stdout.write(f'📚 {total} preguntas evaluadas')
+        self.stdout.write(f'   Coincidencia exacta (cache_respuestas): {exactas / total:.1%}')
+        for umbral in umbrales:
+            aciertos = int((similitudes >= umbral).sum())
+            self.stdout.write(f'   Umbral {umbral:.2f}: {aciertos / total:.1%} ({aciertos} sin llamar a OpenAI)')
+
+        # Los aciertos más dudosos del umbral configurado, para revisar a mano
+        umbral = settings.CHAT_SEMANTICO_UMBRAL
+        dudosos = [i for i in np.argsort(similitudes) if similitudes[i] >= umbral
+                   and normalizadas[i] != normalizadas[indices[i]]]
+        if dudosos and options['ejemplos']:
+            self.stdout.write(f'\n🔍 Aciertos menos parecidos con umbral {umbral:.2f}:')
+            for i in dudosos[:options['ejemplos']]:
+                self.stdout.write(f'   {similitudes[i]:.2f}  "{preguntas[i][:60]}"  ~  "{preguntas[indices[i]][:60]}"')
+
+        self.stdout.write(self.style.SUCCESS('✅ Evaluación terminada'))
+
+    def evaluar_etiquetados(self, ruta, vectorizador, umbrales):
+        pares = json.loads(Path(ruta).read_text(encoding='utf-8'))
+        parecidos = sum(par['mismo'] for par in pares)
+        self.stdout.write(f'🏷️ {len(pares)} pares etiquetados ({parecidos} parecidos, {len(pares) - parecidos} distintos)')
+        for umbral in umbrales:
+            aciertos, errores = evaluar_pares(pares, vectorizador, umbral)
+            self.stdout.write(f'   Umbral {umbral:.2f}: {aciertos}/{parecidos} parecidos reutilizados, '
+                              f'{errores} distintos reutilizados por error')
+
+        # El menor umbral sin errores reutiliza más respuestas sin mezclar preguntas distintas
+        sugerido = next((umbral for umbral in UMBRALES_SUGERENCIA
+                         if evaluar_pares(pares, vectorizador, umbral)[1] == 0), None)
+        if sugerido is None:
+            self.stdout.write(self.style.WARNING('⚠️ Ningún umbral evita reutilizar respuestas de preguntas distintas'))
+        else:
+            aciertos, _ = evaluar_pares(pares, vectorizador, sugerido)
+            self.stdout.write(f'   Umbral sugerido: {sugerido:.2f} ({aciertos}/{parecidos} parecidos, sin errores; '
+                              f'configurado: {settings.CHAT_SEMANTICO_UMBRAL:.2f})')
+        self.stdout.write('')
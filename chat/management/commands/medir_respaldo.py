@@ -0,0 +1,53 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from chat.respaldo import INTENCIONES, motor_intenciones
+
+
+# Mensajes de ejemplo con su intención esperada
+CASOS = Path(__file__).resolve().parents[2] / 'fixtures' / 'intenciones_respaldo.json'
+
+
+def clasificar_lineal(mensaje):
+    """Búsqueda anterior: una pasada de subcadenas por palabra, gana la primera intención"""
+    mensaje_lower = mensaje.lower()
+    for nombre, palabras, _ in INTENCIONES:
+        if any(palabra.rstrip('*') in mensaje_lower for palabra in palabras):
+            return nombre
+    return None
+
+
+def medir(clasificar, mensajes, intentos):
+    """Mejor tiempo de varios intentos: descarta pausas de la máquina"""
+    tiempos = []
+    for _ in range(intentos):
+        inicio = time.perf_counter()
+        for mensaje in mensajes:
+            clasificar(mensaje)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+class Command(BaseCommand):
+    help = 'Mide el clasificador de intenciones del respaldo contra la búsqueda lineal anterior'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=200,
+                            help='Veces que se repiten los mensajes del fixture')
+        parser.add_argument('--intentos', type=int, default=5, help='Intentos por clasificador (se toma el mejor)')
+
+    def handle(self, *args, **options):
+        casos = json.loads(CASOS.read_text(encoding='utf-8'))
+        mensajes = [caso['mensaje'] for caso in casos] * options['repeticiones']
+        self.stdout.write(f'🧪 {len(mensajes)} mensajes, mejor de {options["intentos"]} intentos')
+
+        motor = medir(motor_intenciones.clasificar, mensajes, options['intentos'])
+        lineal = medir(clasificar_lineal, mensajes, options['intentos'])
+        for nombre, segundos in (('Motor de intenciones', motor), ('Búsqueda lineal', lineal)):
+            por_mensaje = segundos / len(mensajes) * 1e6
+            self.stdout.write(f'   {nombre}: {segundos * 1000:.1f} ms ({por_mensaje:.2f} µs por mensaje)')
+        self.stdout.write(f'   El motor es {lineal / motor:.1f}x más rápido')
+        self.stdout.write(self.style.SUCCESS('✅ Medición terminada'))
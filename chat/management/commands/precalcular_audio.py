@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.models import Mensaje
+from chat.respaldo import respuestas_fijas
+from chat.views import limpiar_texto_para_voz
+from core.cache_audio import clave_audio, obtener_cache_audio
+from core.voice_service import MOTOR_POLLY, voice_service
+
+
+def textos_fijos():
+    """Respuestas del respaldo tal como llegan a Polly"""
+    return list(dict.fromkeys(filter(None, (limpiar_texto_para_voz(t) for t in respuestas_fijas()))))
+
+
+def en_cache(texto, voz):
+    return obtener_cache_audio().ruta(clave_audio(texto, voz, MOTOR_POLLY)) is not None
+
+
+class Command(BaseCommand):
+    help = 'Genera con Polly el audio de las respuestas fijas del chatbot y lo guarda en el caché de audio'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voces', default=','.join(settings.POLLY_VOCES),
+                            help='Voces separadas por comas (por defecto POLLY_VOCES)')
+        parser.add_argument('--hilos', type=int, default=4, help='Llamadas simultáneas a Polly')
+        parser.add_argument('--solo-reporte', action='store_true', help='Mostrar la cobertura sin generar audio')
+        parser.add_argument('--historial', type=int, default=1000,
+                            help='Respuestas recientes del bot usadas para medir la cobertura')
+
+    def handle(self, *args, **options):
+        voces = [voz.strip() for voz in options['voces'].split(',') if voz.strip()]
+        textos = textos_fijos()
+        pendientes = [(texto, voz) for voz in voces for texto in textos if not en_cache(texto, voz)]
+        self.stdout.write(f'🎙️ {len(textos)} respuestas fijas x {len(voces)} voces: {len(pendientes)} sin audio')
+
+        if pendientes and not options['solo_reporte']:
+            if not voice_service.is_available():
+                self.stdout.write(self.style.WARNING('⚠️ Amazon Polly no está configurado, no se genera audio'))
+            else:
+                self.generar(pendientes, options['hilos'])
+
+        self.reporte(textos, voces, options['historial'])
+
+    def generar(self, pendientes, hilos):
+        inicio = time.perf_counter()
+        generados, errores = 0, 0
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            futuros = {ejecutor.submit(voice_service.audio_mp3, texto, voz): (texto, voz)
+                       for texto, voz in pendientes}
+            for futuro in as_completed(futuros):
+                texto, voz = futuros[futuro]
+                try:
+                    audio = futuro.result()
+                except Exception as e:
+                    audio = None
+                    self.stdout.write(self.style.ERROR(f'❌ {voz}: {e}'))
+                if audio:
+                    generados += 1
+                else:
+                    errores += 1
+                    self.stdout.write(self.style.WARNING(f'⚠️ Sin audio ({voz}): "{texto[:50]}"'))
+        self.stdout.write(f'⏱️ {generados} clips generados en {time.perf_counter() - inicio:.1f} s, {errores} errores')
+
+    def reporte(self, textos, voces, historial):
+        self.stdout.write('\n📊 Cobertura del caché de audio:')
+        for voz in voces:
+            cubiertos = sum(en_cache(texto, voz) for texto in textos)
+            self.stdout.write(f'   {voz}: {cubiertos}/{len(textos)} respuestas fijas')
+
+        # Qué parte de lo que el bot respondió de verdad ya sonaría sin esperar a Polly
+        respuestas = Mensaje.objects.filter(tipo='B').order_by('-timestamp').values_list('contenido', flat=True)
+        respuestas = [limpiar_texto_para_voz(r) for r in respuestas[:historial]]
+        respuestas = [r for r in respuestas if r]
+        if respuestas:
+            voz = settings.POLLY_VOICE_ID
+            fijas = set(textos)
+            de_respaldo = sum(r in fijas for r in respuestas)
+            cubiertas = sum(en_cache(r, voz) for r in respuestas)
+            self.stdout.write(
+                f'   Últimas {len(respuestas)} respuestas del bot: {de_respaldo / len(respuestas):.1%} fijas, '
+                f'{cubiertas / len(respuestas):.1%} con audio en caché ({voz})'
+            )
+        estadisticas = obtener_cache_audio().estadisticas()
+        self.stdout.write(
+            f"   Caché: {estadisticas['archivos']} archivos, {estadisticas['bytes'] / 1024 / 1024:.1f} "
+            f"de {estadisticas['max_bytes'] / 1024 / 1024:.0f} MB"
+        )
+        self.stdout.write(self.style.SUCCESS('✅ Precálculo de audio terminado'))
@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.models import Cafeteria, Recorrido
+
+
+PREFIJO_USUARIO = 'carga_'
+
+PREGUNTAS = [
+    "Hola, ¿qué cafetería me recomiendas?",
+    "Quiero un café fuerte para empezar el día",
+    "¿Dónde tomo un buen cappuccino en el centro?",
+    "Busco un lugar tranquilo con wifi para trabajar",
+    "Recomiéndame una ruta de cafeterías para la tarde",
+    "¿Qué diferencia hay entre un latte y un mocha?",
+    "Algo dulce y frío, un frappé",
+    "¿Cuál es la cafetería mejor calificada?",
+]
+
+
+class Resultados:
+    """Latencias y estados HTTP por endpoint, compartidos entre hilos"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def medir(self, endpoint, pedir, ok=lambda r: r.status_code < 400):
+        inicio = time.perf_counter()
+        try:
+            respuesta = pedir()
+            exito = ok(respuesta)
+        except requests.RequestException:
+            respuesta, exito = None, False
+        with self._lock:
+            self.latencias[endpoint].append(time.perf_counter() - inicio)
+            if not exito:
+                self.errores[endpoint] += 1
+        return respuesta if exito else None
+
+
+def _json_exitoso(respuesta):
+    return respuesta.status_code == 200 and respuesta.json().get('success', False)
+
+
+def simular_usuario(url, username, contrasena, mensajes, resultados, ids_cafeterias):
+    """Login -> chat -> `mensajes` preguntas -> crear recorrido"""
+    sesion = requests.Session()
+    sesion.get(f'{url}/login/')
+    login = resultados.medir('login', lambda: sesion.post(f'{url}/login/', data={
+        'username': username,
+        'password': contrasena,
+        'csrfmiddlewaretoken': sesion.cookies.get('csrftoken', ''),
+    }, allow_redirects=False), ok=lambda r: r.status_code == 302)
+    if login is None:
+        return
+
+    resultados.medir('chat_view', lambda: sesion.get(f'{url}/chat/'))
+
+    recomendadas = []
+    for pregunta in random.sample(PREGUNTAS, min(mensajes, len(PREGUNTAS))) + \
+            random.choices(PREGUNTAS, k=max(0, mensajes - len(PREGUNTAS))):
+        respuesta = resultados.medir('enviar_mensaje', lambda: sesion.post(
+            f'{url}/chat/enviar-mensaje/', json={'mensaje': pregunta}
+        ), ok=_json_exitoso)
+        if respuesta is not None:
+            recomendadas = [c['id'] for c in respuesta.json().get('cafeterias_recomendadas', [])] or recomendadas
+
+    ids = recomendadas[:4] if len(recomendadas) >= 4 else random.sample(ids_cafeterias, 4)
+    resultados.medir('crear_recorrido', lambda: sesion.post(
+        f'{url}/chat/crear-recorrido/', json={'cafeterias_ids': ids},
+        headers={'X-CSRFToken': sesion.cookies.get('csrftoken', '')},
+    ), ok=_json_exitoso)
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga del chat: N usuarios simultáneos hacen login, abren el chat, '
+            'envían mensajes y crean un recorrido (ver servidor_openai_simulado)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor Django a probar')
+        parser.add_argument('--usuarios', type=int, default=10, help='Usuarios simultáneos')
+        parser.add_argument('--mensajes', type=int, default=3, help='Mensajes por usuario')
+        parser.add_argument('--contrasena', default='carga-chat-123')
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Borrar los usuarios y recorridos de prueba y salir')
+
+    def handle(self, *args, **options):
+        if options['limpiar']:
+            recorridos = Recorrido.objects.filter(nombre__startswith=f'Recorrido personalizado - {PREFIJO_USUARIO}')
+            usuarios = User.objects.filter(username__startswith=PREFIJO_USUARIO)
+            self.stdout.write(f'🧹 {usuarios.count()} usuarios y {recorridos.count()} recorridos de prueba')
+            recorridos.delete()
+            usuarios.delete()
+            self.stdout.write(self.style.SUCCESS('✅ Datos de prueba borrados'))
+            return
+
+        ids_cafeterias = list(Cafeteria.objects.values_list('id', flat=True))
+        if len(ids_cafeterias) < 4:
+            self.stdout.write(self.style.WARNING('⚠️ Se necesitan al menos 4 cafeterías'))
+            return
+
+        usernames = [f'{PREFIJO_USUARIO}{i}' for i in range(options['usuarios'])]
+        for username in usernames:
+            usuario, _ = User.objects.get_or_create(username=username)
+            usuario.set_password(options['contrasena'])
+            usuario.save()
+
+        url = options['url'].rstrip('/')
+        resultados = Resultados()
+        self.stdout.write(f"🚀 {len(usernames)} usuarios x {options['mensajes']} mensajes contra {url}")
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(usernames)) as ejecutor:
+            for username in usernames:
+                ejecutor.submit(simular_usuario, url, username, options['contrasena'],
+                                options['mensajes'], resultados, ids_cafeterias)
+        duracion = time.perf_counter() - inicio
+
+        total = sum(len(l) for l in resultados.latencias.values())
+        self.stdout.write(f'\n{"endpoint":<16}{"n":>6}{"errores":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"máx":>9}  (ms)')
+        for endpoint in ('login', 'chat_view', 'enviar_mensaje', 'crear_recorrido'):
+            latencias = np.array(resultados.latencias.get(endpoint, [])) * 1000
+            if not len(latencias):
+                continue
+            p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+            self.stdout.write(
+                f'{endpoint:<16}{len(latencias):>6}{resultados.errores[endpoint]:>9}'
+                f'{p50:>9.0f}{p95:>9.0f}{p99:>9.0f}{latencias.max():>9.0f}'
+            )
+        mensajes = len(resultados.latencias.get('enviar_mensaje', []))
+        self.stdout.write(
+            f'\n⏱️ {duracion:.1f} s: {total / duracion:.1f} solicitudes/s, '
+            f'{mensajes / duracion:.1f} mensajes/s'
+        )
+        self.stdout.write(self.style.SUCCESS('✅ Prueba de carga terminada (--limpiar para borrar los usuarios)'))
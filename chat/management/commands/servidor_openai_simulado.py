@@ -0,0 +1,196 @@
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+RESPUESTAS = [
+    "Te recomiendo una ruta por el centro histórico: empieza con un americano en una cafetería "
+    "de la Plaza 25 de Mayo, sigue con un cappuccino cerca de San Felipe Neri y termina con un "
+    "mocha en La Recoleta al atardecer.",
+    "Para un café fuerte busca lugares con tueste propio; un espresso doble por la mañana y un "
+    "americano a media tarde. ¿Prefieres un ambiente tranquilo para trabajar o uno animado?",
+    "Si buscas algo suave, un latte con leche de altura es ideal. Puedo armarte una ruta de 4 "
+    "cafeterías con wifi y terraza cerca de tu ubicación.",
+]
+
+
+class Simulacion:
+    """Parámetros del servidor y contadores de solicitudes atendidas"""
+
+    def __init__(self, opciones):
+        self.latencia = opciones['latencia'] / 1000.0
+        self.dispersion = opciones['dispersion']
+        self.tokens_por_segundo = opciones['tokens_por_segundo']
+        self.errores = [
+            ('429', opciones['error_429']),
+            ('401', opciones['error_401']),
+            ('timeout', opciones['error_timeout']),
+        ]
+        self.espera_timeout = opciones['espera_timeout']
+        self.respuestas = RESPUESTAS
+        if opciones['respuestas']:
+            with open(opciones['respuestas'], encoding='utf-8') as archivo:
+                self.respuestas = json.load(archivo)
+        self.contadores = {'ok': 0, '429': 0, '401': 0, 'timeout': 0}
+        self._lock = threading.Lock()
+
+    def contar(self, resultado):
+        with self._lock:
+            self.contadores[resultado] += 1
+
+    def demora(self):
+        """Tiempo hasta el primer token: log-normal con mediana `latencia`"""
+        if not self.dispersion:
+            return self.latencia
+        return self.latencia * math.exp(random.gauss(0.0, self.dispersion))
+
+    def error(self):
+        azar = random.random()
+        for nombre, probabilidad in self.errores:
+            if azar < probabilidad:
+                return nombre
+            azar -= probabilidad
+        return None
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Muchos usuarios simulados conectan a la vez
+
+
+def _manejador(simulacion):
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, estado, datos):
+            cuerpo = json.dumps(datos).encode('utf-8')
+            self.send_response(estado)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def _error(self, estado, tipo, mensaje):
+            self._json(estado, {'error': {'message': mensaje, 'type': tipo, 'code': tipo}})
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/models'):
+                self._json(200, {'object': 'list', 'data': [{'id': 'gpt-4o-mini', 'object': 'model'}]})
+            else:
+                self._error(404, 'not_found', 'Ruta no encontrada')
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._error(404, 'not_found', 'Ruta no encontrada')
+                return
+            pedido = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+            error = simulacion.error()
+            if error:
+                simulacion.contar(error)
+            if error == '429':
+                self._error(429, 'rate_limit_exceeded', 'Rate limit reached (simulado)')
+                return
+            if error == '401':
+                self._error(401, 'invalid_api_key', 'Incorrect API key provided (simulado)')
+                return
+            if error == 'timeout':
+                time.sleep(simulacion.espera_timeout)
+                self.close_connection = True
+                return
+
+            time.sleep(simulacion.demora())
+            texto = random.choice(simulacion.respuestas)
+            prompt = sum(len(m.get('content') or '') for m in pedido.get('messages', []))
+            uso = {
+                'prompt_tokens': prompt // 4,
+                'completion_tokens': len(texto) // 4,
+                'total_tokens': prompt // 4 + len(texto) // 4,
+            }
+            base = {'id': f'chatcmpl-{uuid.uuid4().hex[:12]}', 'created': int(time.time()),
+                    'model': pedido.get('model', 'gpt-4o-mini')}
+
+            if pedido.get('stream'):
+                self._stream(base, texto, uso)
+            else:
+                self._json(200, {
+                    **base, 'object': 'chat.completion', 'usage': uso,
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': texto}}],
+                })
+            simulacion.contar('ok')
+
+        def _stream(self, base, texto, uso):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.close_connection = True
+            pausa = 1.0 / simulacion.tokens_por_segundo if simulacion.tokens_por_segundo else 0
+            # Un "token" por palabra, con el espacio incluido
+            palabras = texto.split(' ')
+            for i, palabra in enumerate(palabras):
+                fragmento = palabra if i == len(palabras) - 1 else palabra + ' '
+                self._evento({**base, 'object': 'chat.completion.chunk', 'choices': [
+                    {'index': 0, 'finish_reason': None, 'delta': {'content': fragmento}}
+                ]})
+                time.sleep(pausa)
+            self._evento({**base, 'object': 'chat.completion.chunk', 'usage': uso, 'choices': [
+                {'index': 0, 'finish_reason': 'stop', 'delta': {}}
+            ]})
+            self.wfile.write(b'data: [DONE]\n\n')
+
+        def _evento(self, datos):
+            self.wfile.write(f'data: {json.dumps(datos)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+
+    return Manejador
+
+
+class Command(BaseCommand):
+    help = ('Servidor local compatible con la API de chat de OpenAI para pruebas de carga '
+            '(usar con OPENAI_BASE_URL=http://127.0.0.1:<puerto>/v1)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8001)
+        parser.add_argument('--latencia', type=float, default=800,
+                            help='Mediana del tiempo hasta el primer token, en ms')
+        parser.add_argument('--dispersion', type=float, default=0.4,
+                            help='Sigma de la distribución log-normal de la latencia (0 = constante)')
+        parser.add_argument('--tokens-por-segundo', type=float, default=40,
+                            help='Velocidad del streaming (0 = sin pausa)')
+        parser.add_argument('--error-429', type=float, default=0.0, help='Probabilidad de responder 429')
+        parser.add_argument('--error-401', type=float, default=0.0, help='Probabilidad de responder 401')
+        parser.add_argument('--error-timeout', type=float, default=0.0,
+                            help='Probabilidad de no responder durante --espera-timeout segundos')
+        parser.add_argument('--espera-timeout', type=float, default=60.0)
+        parser.add_argument('--respuestas', default=None,
+                            help='Archivo JSON con una lista de respuestas predefinidas')
+
+    def handle(self, *args, **options):
+        if options['error_429'] + options['error_401'] + options['error_timeout'] > 1:
+            raise CommandError('La suma de las probabilidades de error no puede pasar de 1')
+
+        simulacion = Simulacion(options)
+        servidor = _Servidor(('127.0.0.1', options['puerto']), _manejador(simulacion))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ OpenAI simulado en http://127.0.0.1:{options['puerto']}/v1 "
+            f"(latencia {options['latencia']:.0f} ms, {options['tokens_por_segundo']:.0f} tokens/s)"
+        ))
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f'📊 Solicitudes atendidas: {simulacion.contadores}')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_contexto_conversacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversacion',
+            name='tokens_prompt',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='tokens_respuesta',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
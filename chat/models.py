@@ -6,6 +6,12 @@ class Conversacion(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     fecha_inicio = models.DateTimeField(auto_now_add=True)
     activa = models.BooleanField(default=True)
+    # Resumen de los mensajes que ya salieron del contexto enviado a OpenAI (ver contexto.py)
+    resumen = models.TextField(blank=True, default='')
+    resumen_hasta = models.PositiveBigIntegerField(default=0)  # id del último mensaje resumido
+    # Tokens de OpenAI gastados en la conversación (ver limites.py)
+    tokens_prompt = models.PositiveIntegerField(default=0)
+    tokens_respuesta = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"Conversación de {self.usuario.username} - {self.fecha_inicio}"
@@ -24,6 +30,9 @@ class Mensaje(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['conversacion', 'timestamp'], name='mensaje_conversacion_fecha'),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_display()}: {self.contenido[:50]}..."
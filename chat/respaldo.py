@@ -0,0 +1,392 @@
+"""
+Respuestas de respaldo del chatbot cuando OpenAI no está disponible.
+
+Cada intención tiene palabras clave con un peso. Todas las palabras se
+compilan una sola vez en una expresión regular; el mensaje se recorre una
+sola vez, se suman los pesos de cada intención (cada palabra clave cuenta
+una vez) y gana la de mayor puntaje. En un empate gana la que aparece
+primero en INTENCIONES. Sin coincidencias se usa RESPUESTA_GENERAL.
+`python manage.py medir_respaldo` compara su tiempo con la búsqueda lineal
+anterior.
+"""
+import re
+import unicodedata
+
+
+# Cada vocal (y la n) de una palabra clave también coincide con su versión con tilde
+_TILDES = {'a': '[aá]', 'e': '[eé]', 'i': '[ií]', 'o': '[oó]', 'u': '[uúü]', 'n': '[nñ]'}
+
+
+def sin_tildes(texto):
+    """Minúsculas sin tildes; las palabras clave no usan ñ"""
+    return unicodedata.normalize('NFKD', texto.lower()).encode('ascii', 'ignore').decode('ascii')
+
+
+def patron_palabras(palabras):
+    """
+    Expresión regular con las palabras clave como árbol de prefijos: en cada
+    letra el motor sigue una sola rama. Las palabras exactas terminan en
+    límite de palabra; las raíces (con *) no, así coinciden con el comienzo
+    de cualquier palabra.
+    """
+    arbol = {}
+    for palabra in palabras:
+        nodo = arbol
+        for letra in palabra:
+            nodo = nodo.setdefault(letra, {})
+        nodo[''] = {}
+
+    def rama(nodo):
+        opciones = [_TILDES.get(letra, re.escape(letra)) + rama(hijo)
+                    for letra, hijo in sorted(nodo.items()) if letra not in ('', '*')]
+        if '*' in nodo:
+            opciones.append('')
+        elif '' in nodo:
+            opciones.append(r'\b')
+        return opciones[0] if len(opciones) == 1 else f"(?:{'|'.join(opciones)})"
+
+    return re.compile(r'\b' + rama(arbol))
+
+
+RESPUESTA_SALUDO = """¡Hola! 👋 **Tu asistente especializado en cafeterías de Sucre está aquí**
+
+🧠 **MI PROCESO DE ANÁLISIS:**
+1️⃣ Escucho tus preferencias de café 
+2️⃣ Analizo tu perfil y ubicación
+3️⃣ Evalúo calidad, ambiente y especialidades
+4️⃣ Diseño ruta optimizada de 4 cafeterías
+5️⃣ Explico el razonamiento detrás de cada recomendación
+
+**¿QUÉ EXPERIENCIA BUSCAS?**
+☕ **AMERICANO** → Puristas del sabor auténtico
+☕ **ESPRESSO** → Intensidad máxima para expertos
+☕ **CAPPUCCINO** → Equilibrio perfecto café-leche
+☕ **LATTE** → Suavidad cremosa y delicada
+☕ **MOCHA** → Indulgencia café-chocolate
+☕ **FRAPPÉ** → Frescura para días cálidos
+
+💡 **Cuéntame:** ¿Qué tipo prefieres? ¿Zona específica de Sucre? ¿Ambiente tranquilo o animado?"""
+
+RESPUESTA_AMERICANO = """🧠 **ANÁLISIS INTELIGENTE:** Americano detectado - ¡Excelente para apreciar el grano puro!
+
+**MI RAZONAMIENTO:** El americano revela la verdadera calidad del café. Sin leche que enmascare, cada defecto o virtud se amplifica. He seleccionado places que dominan el arte del tueste y extracción.
+
+☕ **TU RUTA PERSONALIZADA - AMERICANO PREMIUM:**
+
+🏆 **CAFÉ HERITAGE** - Aniceto Arce 25
+⭐ 4.8/5 | **¿Por qué?** Granos premium Yungas, tostado diario artesanal
+⏰ Óptimo: 8-10 AM (máxima frescura)
+
+🏆 **ESPRESSO MAESTRO** - Plaza 25 de Mayo  
+⭐ 4.9/5 | **¿Por qué?** 30 años perfeccionando técnica, método goteo tradicional
+🎯 Ambiente histórico, ritual completo
+
+🏆 **CAFÉ ORIGIN** - Potosí 45
+⭐ 4.7/5 | **¿Por qué?** Contacto directo productores, trazabilidad completa
+💡 Bonus: Explicación origen cada lote
+
+🏆 **PURE BEANS** - España 78  
+⭐ 4.6/5 | **¿Por qué?** Tuestan in-situ, proceso visible, frescura máxima
+🎁 Cata gratuita diferentes perfiles
+
+🗺️ **RUTA:** Centro→Norte→Sur→Oeste (2.5h caminando)"""
+
+RESPUESTA_ESPRESSO = """🧠 **ANÁLISIS EXPERTO:** Espresso - ¡Verdadero conocedor detectado!
+
+**RAZONAMIENTO TÉCNICO:** El espresso perfecto requiere: máquina profesional 9 bares, barista maestro, granos específicos, extracción 25-30 segundos, crema dorada persistente.
+
+☕ **RUTA ESPRESSO MAGISTRAL:**
+
+⚡ **ITALIAN CORNER** - San Alberto 34
+⭐ 4.9/5 | **¿Por qué?** Máquina italiana original, barista certificado Roma
+🎯 Shot perfecto: 30ml, 25 segundos exactos
+
+⚡ **CAFÉ INTENSO** - Bolívar 67
+⭐ 4.8/5 | **¿Por qué?** Blend exclusivo 7 orígenes, tueste dark city+
+💪 Intensidad 9/10, crema espesa 2 minutos
+
+⚡ **MAESTROS DEL CAFÉ** - Junín 89  
+⭐ 4.7/5 | **¿Por qué?** Competencia nacional baristas, técnica impecable
+🏆 Campeones bolivianos 2024
+
+⚡ **ESPRESSO BAR** - Ravelo 45
+⭐ 4.6/5 | **¿Por qué?** Ambiente italiano auténtico, ritual completo
+🇮🇹 Como en Roma: standing bar, rápido, intenso
+
+🔥 **CONSEJO PRO:** Pídelo "ristretto" para máxima intensidad"""
+
+RESPUESTA_CAPPUCCINO = """🧠 **ANÁLISIS CREMOSO:** Cappuccino - ¡El equilibrio perfecto en tu radar!
+
+**CIENCIA DEL CAPPUCCINO:** 1/3 espresso + 1/3 leche caliente + 1/3 espuma microtexturizada. Temperatura 65-70°C, arte latte opcional, taza precalentada.
+
+☕ **RUTA CAPPUCCINO SUBLIME:**
+
+🥛 **MILK & COFFEE** - Campero 56
+⭐ 4.9/5 | **¿Por qué?** Espuma de seda, temperatura perfecta, arte magistral
+🎨 Latte art: cisne, rosetta, corazón personalizado
+
+🥛 **CREMOSO CAFÉ** - Azurduy 78
+⭐ 4.8/5 | **¿Por qué?** Leche orgánica local, vaporizador profesional
+🏔️ Leche de vaca lechera altura, cremosidad natural
+
+🥛 **ITALIANO SUCRE** - Colon 43
+⭐ 4.7/5 | **¿Por qué?** Receta milanesa tradicional, barista italiano
+🇮🇹 Auténtico: taza 150ml, perfecto equilibrio
+
+🥛 **CAFÉ VELVET** - Hernando Siles 92
+⭐ 4.6/5 | **¿Por qué?** Espuma perfecta densidad, nunca se deshace
+✨ Textura "velvet" - cremosidad que perdura
+
+☁️ **SECRETO:** Pide que calienten la taza primero - diferencia abismal"""
+
+RESPUESTA_LATTE = """🧠 **ANÁLISIS SUAVE:** Latte - ¡Perfecto para paladares que buscan delicadeza!
+
+**FILOSOFÍA LATTE:** 1/4 espresso + 3/4 leche vaporizada suavemente. El café abraza la leche, no la domina. Temperatura ideal: 60-65°C para preservar dulzura natural.
+
+☕ **RUTA LATTE PERFECTION:**
+
+🌸 **CAFÉ DULCE** - Loa 67
+⭐ 4.8/5 | **¿Por qué?** Leche descremada artesanal, dulzura natural realzada
+💖 Especialidad: Vanilla latte con extracto real
+
+🌸 **SMOOTH COFFEE** - Audiencias 89
+⭐ 4.7/5 | **¿Por qué?** Técnica de vaporizado suave, sin quemar leche
+🎯 Perfecta temperatura, nunca amargo
+
+🌸 **CAFÉ HARMONY** - Colón 34  
+⭐ 4.6/5 | **¿Por qué?** Balance magistral, espresso suave blend especial
+🎼 Como sinfonía: cada nota en su lugar
+
+🌸 **DELICATE BREW** - San Alberto 78
+⭐ 4.5/5 | **¿Por qué?** Leche orgánica, proceso lento, amor en cada taza
+🕊️ Tranquilidad absoluta, ritual de relajación
+
+🌿 **PLUS:** Opciones plant-based (avena, almendra) disponibles"""
+
+RESPUESTA_MOCHA = """🧠 **ANÁLISIS INDULGENTE:** Mocha - ¡La perfecta fusión café-chocolate!
+
+**ALQUIMIA MOCHA:** Espresso + chocolate premium + leche vaporizada + toque de crema. El chocolate debe complementar, no dominar el café. Cacao 70% mínimo para sofisticación.
+
+☕ **RUTA MOCHA SUPREMA:**
+
+🍫 **CHOCO CAFÉ** - Mercado Central
+⭐ 4.9/5 | **¿Por qué?** Chocolate boliviano Para Ti, combinación nacional perfecta
+🇧🇴 Orgullo local: café + chocolate de altura
+
+🍫 **SWEET ESPRESSO** - Plaza Libertad 45
+⭐ 4.7/5 | **¿Por qué?** Ganache casero, temperatura precisa, equilibrio sublime
+👨‍🍳 Chef chocolatero + barista maestro
+
+🍫 **MOCHA ROYAL** - Estudiantes 67
+⭐ 4.6/5 | **¿Por qué?** 3 tipos chocolate: blanco, leche, bitter - personalizable
+🎨 Crea tu mocha ideal, experiencia única
+
+🍫 **CAFÉ INDULGENCE** - Ravelo 89  
+⭐ 4.5/5 | **¿Por qué?** Marshmallows artesanales, cacao en polvo francés
+✨ Experiencia completa: sabor + presentación
+
+🎁 **SECRETO:** Pide chocolate extra hot - se integra mejor"""
+
+RESPUESTA_FRAPPE = """🧠 **ANÁLISIS REFRESCANTE:** Frappé - ¡Perfecto para el clima cálido de Sucre!
+
+**CIENCIA DEL FRAPPÉ:** Café concentrado frío + hielo + leche + azúcar + licuadora. La clave: café fuerte que no se diluya, hielo de calidad, textura cremosa sin ser aguado.
+
+☕ **RUTA FRAPPÉ PARADISE:**
+
+🧊 **ICE COFFEE** - Arenales 34
+⭐ 4.8/5 | **¿Por qué?** Cold brew 12 horas, base perfecta para frappé
+❄️ Nunca amargo, concentración ideal
+
+🧊 **FROZEN CAFÉ** - Plaza 25 de Mayo
+⭐ 4.7/5 | **¿Por qué?** Hielo purificado, licuadora profesional, consistencia perfecta
+🌪️ Textura cremosa, burbujas finas
+
+🧊 **CAFÉ FRESCO** - Potosí 67
+⭐ 4.6/5 | **¿Por qué?** Syrups artesanales, personalización infinita
+🎨 Sabores: vainilla, caramelo, chocolate, coco
+
+🧊 **REFRESH STATION** - Bolívar 45
+⭐ 4.5/5 | **¿Por qué?** Toppings premium: whipped cream, chocolate chips
+☀️ Perfecto para tardes calurosas
+
+🌡️ **PRO TIP:** Mejor entre 2-5 PM cuando el sol está fuerte"""
+
+RESPUESTA_CENTRO = """🧠 **ANÁLISIS GEOGRÁFICO:** Centro de Sucre - ¡Corazón histórico cafetero!
+
+**VENTAJA ESTRATÉGICA:** Máxima concentración de cafeterías premium, fácil acceso peatonal, ambiente colonial único, perfecta para ruta completa.
+
+☕ **RUTA CENTRO HISTÓRICO:**
+
+🏛️ **CAFÉ COLONIAL** - Plaza 25 de Mayo
+⭐ 4.9/5 | **¿Por qué?** Vista única a la plaza, ambiente histórico incomparable
+🎭 Perfecto para observar vida sucreña
+
+🏛️ **HERITAGE COFFEE** - Calle Audiencias 45  
+⭐ 4.8/5 | **¿Por qué?** Casona restaurada, arquitectura colonial + café moderno
+📸 Instagram-worthy, historia viva
+
+🏛️ **MERCADO CAFÉ** - Mercado Central
+⭐ 4.7/5 | **¿Por qué?** Autenticidad total, precios locales, sabor tradicional
+🏪 Experiencia cultural completa
+
+🏛️ **PLAZA COFFEE** - San Alberto esquina Colón
+⭐ 4.6/5 | **¿Por qué?** Terraza con vista, brisa natural, ubicación estratégica
+🌤️ Perfecto para cualquier hora del día
+
+🚶‍♂️ **RUTA:** Todo caminando, máximo 15 min entre lugares"""
+
+RESPUESTA_TRANQUILO = """🧠 **ANÁLISIS AMBIENTAL:** Tranquilidad - ¡Espacios perfectos para concentración!
+
+**FACTORES CLAVE:** Ruido <50dB, WiFi estable, enchufes disponibles, mesas amplias, iluminación natural, ambiente sereno que invite a la productividad.
+
+☕ **RUTA TRANQUILITY:**
+
+🤫 **SILENT CAFÉ** - Calvo 67 (2° piso)
+⭐ 4.8/5 | **¿Por qué?** Biblioteca-café, susurros obligatorios, concentración máxima
+📚 Mesa individual, lámpara personal, silencio sagrado
+
+🤫 **CAFÉ ZEN** - Hernando Siles 45
+⭐ 4.7/5 | **¿Por qué?** Música suave, plantas naturales, aire purificado
+🧘‍♀️ Ambiente meditativo, stress-free zone
+
+🤫 **STUDY COFFEE** - Universitaria 89
+⭐ 4.6/5 | **¿Por qué?** WiFi premium, enchufes en cada mesa, estudiantes serios
+💻 Co-working natural, energía productiva
+
+🤫 **PEACEFUL BREW** - Aniceto Arce 34  
+⭐ 4.5/5 | **¿Por qué?** Jardín interior, sonidos naturales, alejado del tráfico
+🌿 Oasis urbano, creatividad flowstate
+
+⚡ **BONUS:** Todos con WiFi 50+ Mbps y política "laptop-friendly\""""
+
+RESPUESTA_RECOMENDACION = """🧠 **ANÁLISIS INTEGRAL:** ¡Vamos a encontrar TU lugar perfecto!
+
+**MI METODOLOGÍA:** Evalúo 47 factores: calidad del grano, skill del barista, ambiente, ubicación, precio, experiencia completa, reviews reales, y tu perfil personal.
+
+☕ **TOP 4 UNIVERSAL - ALGO PARA TODOS:**
+
+🏆 **CAFÉ EXCELLENCE** - Aniceto Arce 25  
+⭐ 4.9/5 | **¿Por qué?** Consistencia absoluta, nunca falla, staff experto
+✅ Perfecto si no sabes qué elegir
+
+🏆 **MAESTROS COFFEE** - Plaza 25 de Mayo
+⭐ 4.8/5 | **¿Por qué?** Variedad completa, ambiente versátil, horario extendido  
+🕐 6 AM - 11 PM, siempre abierto
+
+🏆 **PREMIUM BEANS** - Bolívar 67
+⭐ 4.7/5 | **¿Por qué?** Relación calidad-precio imbatible, porciones generosas
+💰 Lujo accesible, valor excepcional
+
+🏆 **SUCRE COFFEE** - San Alberto 45
+⭐ 4.6/5 | **¿Por qué?** Identidad local fuerte, productos regionales, orgullo sucreño  
+🇧🇴 Auténtica experiencia boliviana
+
+💡 **PARA PERSONALIZAR:** ¿Qué tipo de café prefieres? ¿Ambiente específico? ¿Presupuesto? ¿Zona preferida?"""
+
+RESPUESTA_GENERAL = """🧠 **ANALIZANDO TU CONSULTA...** 
+
+**¿QUÉ BUSCA TU PALADAR?**
+
+🔥 **INTENSIDAD MÁXIMA:** Americano o Espresso
+🥛 **CREMOSIDAD:** Cappuccino o Latte  
+🍫 **INDULGENCIA:** Mocha o Frappé
+
+**TAMBIÉN PUEDES DECIRME:**
+- "Busco un lugar tranquilo para trabajar"
+- "Quiero probar algo diferente"  
+- "Recomiéndame según mi ubicación"
+
+💡 **Mi especialidad:** Crear rutas personalizadas analizando tu perfil, preferencias y contexto específico.
+
+¿Qué información puedes darme para personalizar tu experiencia perfecta? 🗺️"""
+
+
+# (nombre, {palabra: peso}, respuesta). Las palabras van sin tildes; una
+# palabra terminada en * coincide con cualquier palabra que empiece así
+# (plurales, femeninos, diminutivos). Una misma palabra no puede estar como
+# exacta y como raíz, ni ser raíz de otra palabra clave.
+INTENCIONES = [
+    ('saludo', {'hola': 1, 'hi': 1, 'hello': 1, 'buenos': 1, 'buenas': 1, 'saludo*': 1}, RESPUESTA_SALUDO),
+    ('americano', {'americano*': 3, 'negro*': 2, 'puro*': 1, 'fuerte*': 1}, RESPUESTA_AMERICANO),
+    ('espresso', {'espresso*': 3, 'expreso*': 3, 'ristretto*': 3, 'intens*': 2, 'concentrad*': 2, 'fuerte*': 1},
+     RESPUESTA_ESPRESSO),
+    ('cappuccino', {'cappuccino*': 3, 'capuccino*': 3, 'capuchino*': 3, 'cremos*': 2}, RESPUESTA_CAPPUCCINO),
+    ('latte', {'latte*': 3, 'suave*': 2, 'delicad*': 2}, RESPUESTA_LATTE),
+    ('mocha', {'mocha*': 3, 'moka*': 3, 'chocolate*': 2, 'dulce*': 1}, RESPUESTA_MOCHA),
+    ('frappe', {'frapp*': 3, 'frape*': 3, 'frio': 2, 'fria': 2, 'frios': 2, 'frias': 2, 'helad*': 2,
+                'refrescante*': 2}, RESPUESTA_FRAPPE),
+    ('centro', {'centro*': 2, 'plaza*': 1, 'mercado*': 1}, RESPUESTA_CENTRO),
+    ('tranquilo', {'tranquil*': 2, 'relaj*': 2, 'estudi*': 2, 'trabaj*': 2}, RESPUESTA_TRANQUILO),
+    ('recomendacion', {'recomend*': 1, 'recomiend*': 1, 'suger*': 1, 'sugier*': 1, 'mejor*': 1, 'top': 1,
+                       'bueno': 1, 'buena': 1}, RESPUESTA_RECOMENDACION),
+]
+
+
+class MotorIntenciones:
+    """
+    Clasificador de intenciones compilado: todas las palabras clave forman
+    una sola expresión regular, así el mensaje se recorre una sola vez sin
+    separarlo en palabras en Python. La intención ganadora de cada
+    combinación de palabras clave encontradas se recuerda (hasta
+    MAX_DECISIONES combinaciones).
+    """
+
+    MAX_DECISIONES = 4096
+
+    def __init__(self, intenciones):
+        self.intenciones = intenciones
+        self.respuestas = {nombre: respuesta for nombre, _, respuesta in intenciones}
+        # palabra o raíz (sin *) -> [(índice de la intención, peso)]
+        self.pesos = {}
+        for indice, (_, palabras, _) in enumerate(intenciones):
+            for palabra, peso in palabras.items():
+                self.pesos.setdefault(palabra.rstrip('*'), []).append((indice, peso))
+        self.patron = patron_palabras({palabra for _, palabras, _ in intenciones for palabra in palabras})
+        self._decisiones = {}
+
+    def _coincidencias(self, mensaje):
+        """Texto de cada palabra clave presente en el mensaje, tal como aparece"""
+        return frozenset(self.patron.findall(mensaje.lower()))
+
+    def claves(self, mensaje):
+        """Palabras clave (raíces sin *) presentes en el mensaje"""
+        # 'café' y 'cafe' son la misma palabra clave: cuenta una vez
+        return frozenset(sin_tildes(texto) for texto in self._coincidencias(mensaje))
+
+    def _puntajes(self, encontradas):
+        puntajes = [0] * len(self.intenciones)
+        for clave in {sin_tildes(texto) for texto in encontradas}:
+            for indice, peso in self.pesos[clave]:
+                puntajes[indice] += peso
+        return puntajes
+
+    def puntajes(self, mensaje):
+        return self._puntajes(self._coincidencias(mensaje))
+
+    def clasificar(self, mensaje):
+        """Nombre de la intención con mayor puntaje, o None si no hay coincidencias"""
+        encontradas = self._coincidencias(mensaje)
+        if not encontradas:
+            return None
+        try:
+            return self._decisiones[encontradas]
+        except KeyError:
+            pass
+        puntajes = self._puntajes(encontradas)
+        mejor = max(range(len(puntajes)), key=lambda i: (puntajes[i], -i))
+        nombre = self.intenciones[mejor][0]
+        if len(self._decisiones) >= self.MAX_DECISIONES:
+            self._decisiones.clear()
+        self._decisiones[encontradas] = nombre
+        return nombre
+
+    def responder(self, mensaje):
+        return self.respuestas.get(self.clasificar(mensaje), RESPUESTA_GENERAL)
+
+
+motor_intenciones = MotorIntenciones(INTENCIONES)
+
+
+def respuestas_fijas():
+    """Todas las respuestas que puede dar el respaldo, sin repetir"""
+    return list(dict.fromkeys([respuesta for _, _, respuesta in INTENCIONES] + [RESPUESTA_GENERAL]))
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache, caches
+from django.http import JsonResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import circuito
+from .audio import _partes_async, _rango, respuesta_mp3, respuesta_mp3_partes
+from .cache_respuestas import estadisticas_cache
+from .cache_semantico import CacheSemantico, Vectorizador, buscar_respuesta_similar, sin_contexto
+from .limites import consumir, limitar
+from .management.commands.evaluar_cache_semantico import PARES_ETIQUETADOS, evaluar_pares
+from .models import Conversacion, Mensaje
+from .respaldo import RESPUESTA_GENERAL, motor_intenciones
+
+
+CASOS = json.loads((Path(__file__).parent / 'fixtures' / 'intenciones_respaldo.json').read_text(encoding='utf-8'))
+
+
+class MotorIntencionesTests(SimpleTestCase):
+
+    def test_casos_del_fixture(self):
+        for caso in CASOS:
+            with self.subTest(mensaje=caso['mensaje']):
+                self.assertEqual(motor_intenciones.clasificar(caso['mensaje']), caso['intencion'])
+
+    def test_respuesta_general_sin_coincidencias(self):
+        self.assertEqual(motor_intenciones.responder('mmm no sé'), RESPUESTA_GENERAL)
+
+    def test_cada_palabra_cuenta_una_vez(self):
+        # 'dulce' repetida no supera a 'latte' (peso 3)
+        self.assertEqual(motor_intenciones.clasificar('latte dulce dulce dulce'), 'latte')
+
+    def test_empate_gana_la_primera_intencion(self):
+        self.assertEqual(motor_intenciones.clasificar('fuerte'), 'americano')
+
+
+class CacheSemanticoTests(SimpleTestCase):
+
+    def setUp(self):
+        self.ahora = 1_000_000.0
+        reloj = mock.patch('chat.cache_semantico.time.time', side_effect=lambda: self.ahora)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+        self.cache = CacheSemantico(Vectorizador(), capacidad=3, ttl=60)
+
+    def test_pregunta_parecida_reutiliza_la_respuesta(self):
+        self.cache.agregar('¿Qué cafetería tiene el mejor capuchino?', 'Café Heritage')
+        respuesta, similitud = self.cache.buscar('cual cafeteria tiene el mejor capuchino', 0.77)
+        self.assertEqual(respuesta, 'Café Heritage')
+        self.assertGreater(similitud, 0.77)
+
+    def test_pregunta_distinta_no_coincide(self):
+        self.cache.agregar('¿Qué cafetería tiene el mejor capuchino?', 'Café Heritage')
+        self.assertEqual(self.cache.buscar('¿Aceptan tarjeta?', 0.77)[0], None)
+
+    def test_terminos_clave_distintos_no_reutilizan(self):
+        self.cache.agregar('quiero un americano', 'Americano en Café Heritage')
+        self.cache.agregar('cafetería con wifi', 'Café Origin tiene wifi')
+        for pregunta in ('no quiero un americano', 'cafetería sin wifi'):
+            with self.subTest(pregunta=pregunta):
+                respuesta, similitud = self.cache.buscar(pregunta, 0.7)
+                self.assertIsNone(respuesta)
+                self.assertGreater(similitud, 0.7)
+
+    def test_usa_la_siguiente_mas_parecida_con_los_mismos_terminos(self):
+        self.cache.agregar('quiero un café con azúcar', 'Con azúcar')
+        self.cache.agregar('me das un café sin azúcar', 'Sin azúcar')
+        # 'con azúcar' es la más parecida (0.81) pero no tiene 'sin'
+        self.assertEqual(self.cache.buscar('quiero un café sin azúcar', 0.7), ('Sin azúcar', mock.ANY))
+
+    def test_expiran_con_el_ttl(self):
+        self.cache.agregar('recomiéndame un espresso intenso', 'Espresso Maestro')
+        self.ahora += 61
+        self.assertIsNone(self.cache.buscar('recomiendame un espresso intenso', 0.77)[0])
+
+    def test_al_llenarse_reemplaza_la_mas_antigua(self):
+        preguntas = ['¿Dónde venden mocha?', '¿Aceptan tarjeta?', 'cafetería con terraza', '¿Qué cafetería abre los domingos?']
+        for pregunta in preguntas:
+            self.cache.agregar(pregunta, pregunta.upper())
+        self.assertIsNone(self.cache.buscar(preguntas[0], 0.99)[0])
+        for pregunta in preguntas[1:]:
+            self.assertEqual(self.cache.buscar(pregunta, 0.99)[0], pregunta.upper())
+
+    def test_solo_preguntas_sin_contexto(self):
+        sistema = {'role': 'system', 'content': 'Asistente'}
+        pregunta = {'role': 'user', 'content': 'sí, esa'}
+        self.assertTrue(sin_contexto([sistema, pregunta]))
+        self.assertFalse(sin_contexto([sistema, {'role': 'assistant', 'content': '¿Café Heritage?'}, pregunta]))
+        with mock.patch('chat.cache_semantico.obtener_cache_semantico') as obtener:
+            self.assertIsNone(buscar_respuesta_similar([sistema, {'role': 'assistant', 'content': 'Hola'}, pregunta]))
+        obtener.assert_not_called()
+
+    def test_umbral_configurado_sin_errores_en_los_pares_etiquetados(self):
+        pares = json.loads(PARES_ETIQUETADOS.read_text(encoding='utf-8'))
+        aciertos, errores = evaluar_pares(pares, Vectorizador(), settings.CHAT_SEMANTICO_UMBRAL)
+        self.assertEqual(errores, 0)
+        self.assertGreaterEqual(aciertos, sum(par['mismo'] for par in pares) // 2)
+
+
+@override_settings(
+    OPENAI_CIRCUITO_VENTANA=60, OPENAI_CIRCUITO_MIN_LLAMADAS=4, OPENAI_CIRCUITO_TASA_ERRORES=0.5,
+    OPENAI_CIRCUITO_LENTA=5.0, OPENAI_CIRCUITO_TASA_LENTAS=0.75, OPENAI_CIRCUITO_ENFRIAMIENTO=30,
+)
+class CircuitoTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ahora = 1_000_000.0
+        reloj = mock.patch('chat.circuito.time.time', side_effect=lambda: self.ahora)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def llamadas(self, exitos, errores, duracion=0.5):
+        for exito in [True] * exitos + [False] * errores:
+            circuito.registrar(exito, duracion)
+
+    def test_se_abre_con_la_tasa_de_errores(self):
+        self.llamadas(2, 1)
+        self.assertTrue(circuito.permitir())  # 3 llamadas: menos que el mínimo
+        self.llamadas(0, 1)
+        self.assertFalse(circuito.permitir())
+        self.assertEqual(circuito.estado_circuito()['estado'], circuito.ABIERTO)
+
+    def test_se_abre_con_llamadas_lentas(self):
+        self.llamadas(4, 0, duracion=6.0)
+        self.assertFalse(circuito.permitir())
+
+    def test_los_errores_viejos_salen_de_la_ventana(self):
+        self.llamadas(0, 3)
+        self.ahora += 70
+        self.llamadas(1, 0)
+        self.llamadas(0, 1)
+        self.assertTrue(circuito.permitir())
+
+    def test_una_sola_sonda_al_terminar_el_enfriamiento(self):
+        self.llamadas(0, 4)
+        self.ahora += 31
+        self.assertEqual(circuito.permitir(), circuito.SONDA)
+        self.assertFalse(circuito.permitir())
+        self.assertEqual(circuito.estado_circuito()['estado'], circuito.SEMIABIERTO)
+
+        circuito.registrar(True, 0.5, sonda=True)
+        self.assertEqual(circuito.estado_circuito()['estado'], circuito.CERRADO)
+        # La ventana empieza de nuevo: un error no lo vuelve a abrir
+        self.llamadas(0, 1)
+        self.assertTrue(circuito.permitir())
+
+    def test_sonda_fallida_reabre(self):
+        self.llamadas(0, 4)
+        self.ahora += 31
+        with self.assertRaises(RuntimeError), circuito.llamada_openai():
+            raise RuntimeError('OpenAI caído')
+        with self.assertRaises(circuito.CircuitoAbierto), circuito.llamada_openai():
+            pass
+        self.assertEqual(circuito.estado_circuito()['aperturas'], 2)
+
+    def test_llamadas_en_curso_no_cambian_el_circuito_abierto(self):
+        self.llamadas(0, 4)
+        self.ahora += 5
+        # Empezaron antes de abrirse y terminan durante el enfriamiento
+        circuito.registrar(True, 0.3)
+        circuito.registrar(False, 0.3)
+        estado = circuito.estado_circuito()
+        self.assertEqual(estado['estado'], circuito.ABIERTO)
+        self.assertEqual(estado['aperturas'], 1)
+        self.assertEqual(estado['segundos_para_sonda'], 25)
+        self.assertFalse(circuito.permitir())
+
+    def test_solo_la_sonda_cierra_el_circuito_semiabierto(self):
+        self.llamadas(0, 4)
+        self.ahora += 31
+        self.assertEqual(circuito.permitir(), circuito.SONDA)
+        circuito.registrar(True, 0.3)
+        self.assertEqual(circuito.estado_circuito()['estado'], circuito.SEMIABIERTO)
+        circuito.registrar(True, 0.3, sonda=True)
+        self.assertEqual(circuito.estado_circuito()['estado'], circuito.CERRADO)
+
+
+@override_settings(LIMITE_AUDIO_RAFAGA=2, LIMITE_AUDIO_POR_MINUTO=6, LIMITE_FACTOR_IP=1)
+class LimitesTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ahora = 1_000_000.0
+        reloj = mock.patch('chat.limites.time.time', side_effect=lambda: self.ahora)
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def test_cubeta_admite_la_rafaga_y_se_recupera(self):
+        self.assertEqual([consumir('prueba', 3, 6) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(consumir('prueba', 3, 6), 10.0)
+        self.ahora += 10
+        self.assertEqual(consumir('prueba', 3, 6), 0)
+        self.assertGreater(consumir('prueba', 3, 6), 0)
+
+    def test_decorador_responde_429_por_ip(self):
+        vista = limitar('audio')(lambda request: JsonResponse({'success': True}))
+        factory = RequestFactory()
+
+        def pedir(ip):
+            request = factory.post('/chat/generar-audio/', REMOTE_ADDR=ip)
+            request.user = AnonymousUser()
+            return vista(request)
+
+        self.assertEqual([pedir('10.0.0.1').status_code for _ in range(2)], [200, 200])
+        respuesta = pedir('10.0.0.1')
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta['Retry-After'], '10')
+        self.assertEqual(pedir('10.0.0.2').status_code, 200)
+
+
+def _chunk(texto=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=texto))] if texto is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def _cliente_stream(*chunks):
+    """Cliente asíncrono de OpenAI que transmite `chunks`"""
+    async def partes():
+        for chunk in chunks:
+            yield chunk
+
+    async def create(**kwargs):
+        return partes()
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _eventos_sse(cuerpo):
+    eventos = []
+    for bloque in cuerpo.strip().split('\n\n'):
+        evento, datos = bloque.split('\n')
+        eventos.append((evento.removeprefix('event: '), json.loads(datos.removeprefix('data: '))))
+    return eventos
+
+
+@override_settings(OPENAI_API_KEY='sk-prueba', CHAT_SEMANTICO=False)
+class EnviarMensajeStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-prueba')
+
+    def setUp(self):
+        cache.clear()
+        caches['chat'].clear()
+
+    async def enviar(self, mensaje, usuario=None):
+        cliente = AsyncClient()
+        await cliente.aforce_login(usuario or self.usuario)
+        response = await cliente.post(
+            reverse('enviar_mensaje_stream'), json.dumps({'mensaje': mensaje}), content_type='application/json'
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        # Iterador asíncrono: bajo ASGI cada evento se envía apenas se genera
+        self.assertTrue(response.is_async)
+        partes = [parte async for parte in response.streaming_content]
+        return _eventos_sse(b''.join(partes).decode('utf-8'))
+
+    def mensajes_guardados(self):
+        return list(Mensaje.objects.filter(conversacion__usuario=self.usuario)
+                    .order_by('id').values_list('tipo', 'contenido'))
+
+    async def test_tokens_de_openai_y_evento_fin(self):
+        uso = SimpleNamespace(prompt_tokens=30, completion_tokens=12)
+        cliente = _cliente_stream(_chunk('Te recomiendo '), _chunk('un americano '), _chunk(''),
+                                  _chunk('en Café Heritage.'), _chunk(usage=uso))
+        with mock.patch('chat.views.obtener_cliente_async', return_value=cliente):
+            eventos = await self.enviar('¿Qué café fuerte me recomiendas?')
+
+        self.assertEqual(eventos[:-1], [
+            ('token', {'texto': 'Te recomiendo '}),
+            ('token', {'texto': 'un americano '}),
+            ('token', {'texto': 'en Café Heritage.'}),
+        ])
+        evento, datos = eventos[-1]
+        self.assertEqual(evento, 'fin')
+        self.assertEqual(datos['mensaje_bot'], 'Te recomiendo un americano en Café Heritage.')
+        self.assertIn('cafeterias_recomendadas', datos)
+
+        mensajes = await sync_to_async(self.mensajes_guardados)()
+        self.assertEqual(mensajes, [
+            ('U', '¿Qué café fuerte me recomiendas?'),
+            ('B', 'Te recomiendo un americano en Café Heritage.'),
+        ])
+        conversacion = await Conversacion.objects.aget(usuario=self.usuario)
+        self.assertEqual((conversacion.tokens_prompt, conversacion.tokens_respuesta), (30, 12))
+
+    async def test_error_antes_del_primer_token_usa_el_respaldo(self):
+        async def create(**kwargs):
+            raise RuntimeError('OpenAI caído')
+
+        cliente = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with mock.patch('chat.views.obtener_cliente_async', return_value=cliente):
+            eventos = await self.enviar('quiero un capuchino')
+
+        respaldo = motor_intenciones.responder('quiero un capuchino')
+        self.assertEqual(eventos[0], ('token', {'texto': respaldo}))
+        self.assertEqual([evento for evento, _ in eventos], ['token', 'fin'])
+        self.assertEqual(eventos[1][1]['mensaje_bot'], respaldo.strip())
+        mensajes = await sync_to_async(self.mensajes_guardados)()
+        self.assertEqual(mensajes, [('U', 'quiero un capuchino'), ('B', respaldo.strip())])
+
+    async def test_preguntas_iguales_a_la_vez_una_sola_llamada(self):
+        llamadas = []
+
+        async def partes():
+            yield _chunk('Te recomiendo un americano ')
+            # Sigue transmitiendo hasta que la otra solicitud espera esta respuesta
+            while (await sync_to_async(estadisticas_cache)())['agrupadas'] < 1:
+                await asyncio.sleep(0.01)
+            yield _chunk('en Café Heritage.')
+
+        async def create(**kwargs):
+            llamadas.append(kwargs)
+            return partes()
+
+        otro = await User.objects.acreate_user('otro', password='clave-prueba')
+        cliente = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with mock.patch('chat.views.obtener_cliente_async', return_value=cliente):
+            primera, segunda = await asyncio.wait_for(asyncio.gather(
+                self.enviar('¿Qué café fuerte me recomiendas?'),
+                self.enviar('¿Qué café fuerte me recomiendas?', usuario=otro),
+            ), 5)
+
+        self.assertEqual(len(llamadas), 1)
+        respuesta = 'Te recomiendo un americano en Café Heritage.'
+        self.assertEqual(primera[-1][1]['mensaje_bot'], respuesta)
+        # La agrupada recibe la respuesta completa en un solo token
+        self.assertEqual(segunda[0], ('token', {'texto': respuesta}))
+        self.assertEqual(segunda[-1][1]['mensaje_bot'], respuesta)
+
+    async def test_error_a_mitad_del_stream_cuenta_para_el_circuito(self):
+        async def partes():
+            yield _chunk('Te recomiendo ')
+            raise TimeoutError('lectura sin respuesta')
+
+        async def create(**kwargs):
+            return partes()
+
+        cliente = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with mock.patch('chat.views.obtener_cliente_async', return_value=cliente):
+            eventos = await self.enviar('¿Qué café fuerte me recomiendas?')
+
+        # Ya se envió un token: no se agrega el respaldo
+        self.assertEqual([evento for evento, _ in eventos], ['token', 'fin'])
+        self.assertEqual(eventos[1][1]['mensaje_bot'], 'Te recomiendo')
+        estado = await sync_to_async(circuito.estado_circuito)()
+        self.assertEqual(estado['llamadas'], 1)
+        self.assertEqual(estado['tasa_errores'], 1.0)
+
+
+class AudioTests(SimpleTestCase):
+
+    def partes(self, generadas, cerrado):
+        try:
+            for numero in range(3):
+                generadas.append(numero)
+                yield f'mp3-{numero};'.encode()
+        finally:
+            cerrado.append(True)
+
+    def test_partes_bajo_wsgi(self):
+        request = RequestFactory().get('/chat/audio/')
+        response = respuesta_mp3_partes(request, self.partes([], []), 'abc')
+        self.assertFalse(response.is_async)
+        self.assertEqual(b''.join(response.streaming_content), b'mp3-0;mp3-1;mp3-2;')
+
+    async def test_partes_bajo_asgi_se_envian_a_medida_que_llegan(self):
+        generadas, cerrado = [], []
+        request = AsyncRequestFactory().get('/chat/audio/')
+        response = respuesta_mp3_partes(request, self.partes(generadas, cerrado), 'abc')
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['ETag'], '"abc"')
+
+        recibidas = []
+        async for parte in response:
+            # Cada parte llega antes de que se genere la siguiente
+            self.assertEqual(len(generadas), len(recibidas) + 1)
+            recibidas.append(parte)
+        self.assertEqual(recibidas, [b'mp3-0;', b'mp3-1;', b'mp3-2;'])
+        self.assertEqual(cerrado, [True])
+
+    async def test_partes_async_cierra_el_generador_al_desconectarse(self):
+        generadas, cerrado = [], []
+        partes = _partes_async(self.partes(generadas, cerrado))
+        self.assertEqual(await anext(partes), b'mp3-0;')
+        # Django (o el recolector del event loop) cierra el iterador si el cliente se va
+        await partes.aclose()
+        self.assertEqual((generadas, cerrado), ([0], [True]))
+
+
+class RespuestaMp3Tests(SimpleTestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.contenido = bytes(range(256)) * 4
+        self.ruta = Path(directorio.name) / 'abc.mp3'
+        self.ruta.write_bytes(self.contenido)
+
+    def _pedir(self, **encabezados):
+        request = RequestFactory().get('/chat/audio/', headers=encabezados)
+        return respuesta_mp3(request, self.ruta, 'abc')
+
+    def test_rango(self):
+        self.assertIsNone(_rango(None, 100))
+        self.assertIsNone(_rango('bytes=-', 100))
+        self.assertIsNone(_rango('items=0-5', 100))
+        self.assertEqual(_rango('bytes=10-19', 100), (10, 19))
+        self.assertEqual(_rango('bytes=90-', 100), (90, 99))
+        self.assertEqual(_rango('bytes=90-500', 100), (90, 99))
+        self.assertEqual(_rango('bytes=-10', 100), (90, 99))
+        self.assertEqual(_rango('bytes=-500', 100), (0, 99))
+        self.assertIs(_rango('bytes=100-', 100), False)
+        self.assertIs(_rango('bytes=20-10', 100), False)
+        self.assertIs(_rango('bytes=-0', 100), False)
+
+    def test_completo(self):
+        response = self._pedir()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+        self.assertEqual(response['Content-Length'], str(len(self.contenido)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_rango_parcial(self):
+        response = self._pedir(Range='bytes=100-299')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[100:300])
+        self.assertEqual(response['Content-Length'], '200')
+        self.assertEqual(response['Content-Range'], f'bytes 100-299/{len(self.contenido)}')
+
+    def test_rango_de_sufijo(self):
+        response = self._pedir(Range='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido[-24:])
+        tamano = len(self.contenido)
+        self.assertEqual(response['Content-Range'], f'bytes {tamano - 24}-{tamano - 1}/{tamano}')
+
+    def test_rango_fuera_del_archivo(self):
+        response = self._pedir(Range=f'bytes={len(self.contenido)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.contenido)}')
+
+    def test_sin_cambios(self):
+        response = self._pedir(If_None_Match='"abc"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(self._pedir(If_None_Match='"otra"').status_code, 200)
+
+
+@override_settings(POLLY_VOICE_ID='Lupe', POLLY_VOCES=['Lupe', 'Mia'])
+class AudioVozTests(SimpleTestCase):
+
+    def test_voz_no_permitida(self):
+        with mock.patch('chat.views.obtener_cache_audio') as cache_audio, \
+                mock.patch('chat.views.voice_service') as servicio:
+            response = self.client.get(reverse('audio_voz'), {'texto': 'Hola, bienvenido', 'voz': '../../etc'})
+        self.assertEqual(response.status_code, 400)
+        cache_audio.assert_not_called()
+        servicio.partes_mp3.assert_not_called()
+
+    def test_voces_configuradas(self):
+        for voz in ('', 'Lupe', 'Mia'):
+            with mock.patch('chat.views.obtener_cache_audio') as cache_audio, \
+                    mock.patch('chat.views.respuesta_mp3', return_value=JsonResponse({})):
+                response = self.client.get(reverse('audio_voz'), {'texto': 'Hola, bienvenido', 'voz': voz})
+            self.assertEqual(response.status_code, 200)
+            cache_audio.return_value.ruta.assert_called_once()
+
+    def test_generar_audio_con_voz_no_permitida(self):
+        with mock.patch('chat.views.voice_service') as servicio:
+            response = self.client.post(
+                reverse('generar_audio'), json.dumps({'text': 'Hola', 'voice_id': 'Hacker'}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 400)
+        servicio.text_to_speech.assert_not_called()
@@ -4,8 +4,12 @@ from . import views
 urlpatterns = [
     path('', views.chat_view, name='chat'),
     path('enviar-mensaje/', views.enviar_mensaje, name='enviar_mensaje'),
+    path('enviar-mensaje/stream/', views.enviar_mensaje_stream, name='enviar_mensaje_stream'),
+    path('cache/estadisticas/', views.estadisticas_cache_chat, name='estadisticas_cache_chat'),
+    path('circuito/estado/', views.estado_circuito_openai, name='estado_circuito_openai'),
     path('crear-recorrido/', views.crear_recorrido_chat, name='crear_recorrido_chat'),
     path('nueva-conversacion/', views.nueva_conversacion, name='nueva_conversacion'),
     path('generar-audio/', views.generar_audio, name='generar_audio'),
+    path('audio/', views.audio_voz, name='audio_voz'),
     path('obtener-voces/', views.obtener_voces, name='obtener_voces'),
 ]
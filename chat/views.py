@@ -1,14 +1,32 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from asgiref.sync import sync_to_async
+import asyncio
 import json
+from contextlib import aclosing
 import openai
 from django.conf import settings
+from .audio import respuesta_mp3, respuesta_mp3_partes
+from .cache_respuestas import (
+    aobtener_o_anunciar, aobtener_o_generar, clave_respuesta, estadisticas_cache,
+    obtener_o_generar, publicar_respuesta,
+)
+from .cache_semantico import buscar_respuesta_similar, recordar_respuesta
+from .circuito import CircuitoAbierto, estado_circuito, llamada_openai
+from .cliente_openai import limite_concurrencia, obtener_cliente, obtener_cliente_async
+from .contexto import actualizar_resumen, mensajes_recientes
+from .limites import limite_excedido, limitar, presupuesto_agotado, registrar_tokens
 from .models import Conversacion, Mensaje, PreferenciaUsuario
+from .respaldo import motor_intenciones
 from core.models import Cafeteria, TipoCafe, Recorrido
-from core.voice_service import voice_service
+from core.geo import obtener_coordenadas
+from core.planificador import interpretar_hora_inicio, planificar_recorrido
+from core.matriz_distancias import matriz_recorrido
+from core.cache_audio import clave_audio, obtener_cache_audio
+from core.voice_service import MOTOR_POLLY, voces_permitidas, voice_service
 import random
 import re
 
@@ -66,622 +84,270 @@ def limpiar_texto_para_voz(texto):
     return texto_limpio
 
 
-def get_openai_response(user_message, conversacion):
-    """Obtener respuesta del chatbot usando OpenAI con sistema optimizado y eficiente"""
-    try:
-        # Sistema de verificación inteligente de API
-        if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == 'sk-proj-tu-clave-aqui':
-            print("🔄 API key no configurada - Usando sistema inteligente de respaldo")
-            return get_smart_fallback_response(user_message, conversacion)
-        
-        # Contexto ultra-optimizado para ahorrar tokens
-        mensajes_anteriores = conversacion.mensajes.all().order_by('timestamp')[-4:]  # Solo 4 últimos
-        
-        # Prompt base eficiente y compacto
-        messages = [
-            {
-                "role": "system", 
-                "content": """Asistente cafeterías Sucre, Bolivia. Análisis inteligente + recomendaciones personalizadas.
-
-PROCESO: Analiza → Evalúa → Recomienda → Explica razonamiento.
-RESPUESTA: Máximo 120 palabras, directo, útil, con fundamentos.
-ESPECIALIDAD: 4 cafeterías por ruta, análisis de preferencias de café."""
-            }
-        ]
-        
-        # Agregar solo contexto esencial
-        for msg in mensajes_anteriores:
-            role = "user" if msg.tipo == "U" else "assistant"
-            # Comprimir mensajes largos para eficiencia
-            contenido = msg.contenido[:150] if len(msg.contenido) > 150 else msg.contenido
-            messages.append({"role": role, "content": contenido})
-        
-        # Comprimir mensaje del usuario si es muy largo
-        mensaje_actual = user_message[:200] if len(user_message) > 200 else user_message
-        messages.append({"role": "user", "content": mensaje_actual})
-        
-        # Configuración ultra-optimizada para eficiencia máxima
-        print("🚀 OpenAI optimizado - ahorrando tokens...")
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Modelo más económico
-            messages=messages,
-            max_tokens=140,       # Reducido significativamente 
-            temperature=0.8,      # Creatividad con eficiencia
-            top_p=0.95,          # Optimización adicional
-            frequency_penalty=0.1,
-            presence_penalty=0.1
-        )
-        
-        respuesta = response.choices[0].message.content.strip()
-        print(f"✅ OpenAI eficiente: {len(respuesta)} chars | Tokens minimizados")
-        
-        # Validación de calidad - si es muy corto, usar respaldo
-        if len(respuesta) < 25:
-            print("⚠️ Respuesta insuficiente, activando respaldo inteligente...")
-            return get_smart_fallback_response(user_message, conversacion)
-            
-        return respuesta
-        
-    except openai.RateLimitError:
-        print("🟡 Cuota OpenAI excedida - Sistema inteligente de respaldo ACTIVO")
-        return get_smart_fallback_response(user_message, conversacion)
-    except openai.AuthenticationError:
-        print("🔑 Error autenticación OpenAI - Respaldo inteligente funcionando")
-        return get_smart_fallback_response(user_message, conversacion)
-    except Exception as e:
-        print(f"🛡️ OpenAI temporal: {type(e).__name__} - Respaldo avanzado activo")
-        return get_smart_fallback_response(user_message, conversacion)
-
-
-def get_smart_fallback_response(user_message, conversacion):
-    """Sistema de respuestas inteligentes avanzado - Mantiene alta calidad sin OpenAI"""
-    mensaje_lower = user_message.lower()
-    
-    # Análisis del contexto de conversación
-    mensajes_anteriores = list(conversacion.mensajes.all().order_by('-timestamp')[:3])
-    es_primera_interaccion = len(mensajes_anteriores) <= 1
-    
-    print("🧠 Sistema de IA de respaldo - Procesando con razonamiento avanzado...")
-    
-    # SISTEMA DE SALUDOS INTELIGENTE
-    if any(palabra in mensaje_lower for palabra in ['hola', 'hi', 'buenos', 'buenas', 'saludos', 'hello']):
-        return """¡Hola! 👋 **Tu asistente especializado en cafeterías de Sucre está aquí**
-
-🧠 **MI PROCESO DE ANÁLISIS:**
-1️⃣ Escucho tus preferencias de café 
-2️⃣ Analizo tu perfil y ubicación
-3️⃣ Evalúo calidad, ambiente y especialidades
-4️⃣ Diseño ruta optimizada de 4 cafeterías
-5️⃣ Explico el razonamiento detrás de cada recomendación
-
-**¿QUÉ EXPERIENCIA BUSCAS?**
-☕ **AMERICANO** → Puristas del sabor auténtico
-☕ **ESPRESSO** → Intensidad máxima para expertos
-☕ **CAPPUCCINO** → Equilibrio perfecto café-leche
-☕ **LATTE** → Suavidad cremosa y delicada
-☕ **MOCHA** → Indulgencia café-chocolate
-☕ **FRAPPÉ** → Frescura para días cálidos
-
-💡 **Cuéntame:** ¿Qué tipo prefieres? ¿Zona específica de Sucre? ¿Ambiente tranquilo o animado?"""
-
-    # ANÁLISIS AVANZADO POR TIPO DE CAFÉ
-    elif any(palabra in mensaje_lower for palabra in ['americano', 'negro', 'fuerte', 'puro']):
-        return """🧠 **ANÁLISIS INTELIGENTE:** Americano detectado - ¡Excelente para apreciar el grano puro!
-
-**MI RAZONAMIENTO:** El americano revela la verdadera calidad del café. Sin leche que enmascare, cada defecto o virtud se amplifica. He seleccionado places que dominan el arte del tueste y extracción.
-
-☕ **TU RUTA PERSONALIZADA - AMERICANO PREMIUM:**
-
-🏆 **CAFÉ HERITAGE** - Aniceto Arce 25
-⭐ 4.8/5 | **¿Por qué?** Granos premium Yungas, tostado diario artesanal
-⏰ Óptimo: 8-10 AM (máxima frescura)
-
-🏆 **ESPRESSO MAESTRO** - Plaza 25 de Mayo  
-⭐ 4.9/5 | **¿Por qué?** 30 años perfeccionando técnica, método goteo tradicional
-🎯 Ambiente histórico, ritual completo
-
-🏆 **CAFÉ ORIGIN** - Potosí 45
-⭐ 4.7/5 | **¿Por qué?** Contacto directo productores, trazabilidad completa
-💡 Bonus: Explicación origen cada lote
-
-🏆 **PURE BEANS** - España 78  
-⭐ 4.6/5 | **¿Por qué?** Tuestan in-situ, proceso visible, frescura máxima
-🎁 Cata gratuita diferentes perfiles
-
-🗺️ **RUTA:** Centro→Norte→Sur→Oeste (2.5h caminando)"""
-
-    elif any(palabra in mensaje_lower for palabra in ['espresso', 'intenso', 'concentrado', 'fuerte']):
-        return """🧠 **ANÁLISIS EXPERTO:** Espresso - ¡Verdadero conocedor detectado!
-
-**RAZONAMIENTO TÉCNICO:** El espresso perfecto requiere: máquina profesional 9 bares, barista maestro, granos específicos, extracción 25-30 segundos, crema dorada persistente.
-
-☕ **RUTA ESPRESSO MAGISTRAL:**
-
-⚡ **ITALIAN CORNER** - San Alberto 34
-⭐ 4.9/5 | **¿Por qué?** Máquina italiana original, barista certificado Roma
-🎯 Shot perfecto: 30ml, 25 segundos exactos
-
-⚡ **CAFÉ INTENSO** - Bolívar 67
-⭐ 4.8/5 | **¿Por qué?** Blend exclusivo 7 orígenes, tueste dark city+
-💪 Intensidad 9/10, crema espesa 2 minutos
-
-⚡ **MAESTROS DEL CAFÉ** - Junín 89  
-⭐ 4.7/5 | **¿Por qué?** Competencia nacional baristas, técnica impecable
-🏆 Campeones bolivianos 2024
-
-⚡ **ESPRESSO BAR** - Ravelo 45
-⭐ 4.6/5 | **¿Por qué?** Ambiente italiano auténtico, ritual completo
-🇮🇹 Como en Roma: standing bar, rápido, intenso
-
-🔥 **CONSEJO PRO:** Pídelo "ristretto" para máxima intensidad"""
-
-    elif any(palabra in mensaje_lower for palabra in ['cappuccino', 'capuchino', 'cremoso']):
-        return """🧠 **ANÁLISIS CREMOSO:** Cappuccino - ¡El equilibrio perfecto en tu radar!
-
-**CIENCIA DEL CAPPUCCINO:** 1/3 espresso + 1/3 leche caliente + 1/3 espuma microtexturizada. Temperatura 65-70°C, arte latte opcional, taza precalentada.
-
-☕ **RUTA CAPPUCCINO SUBLIME:**
-
-🥛 **MILK & COFFEE** - Campero 56
-⭐ 4.9/5 | **¿Por qué?** Espuma de seda, temperatura perfecta, arte magistral
-🎨 Latte art: cisne, rosetta, corazón personalizado
-
-🥛 **CREMOSO CAFÉ** - Azurduy 78
-⭐ 4.8/5 | **¿Por qué?** Leche orgánica local, vaporizador profesional
-🏔️ Leche de vaca lechera altura, cremosidad natural
-
-🥛 **ITALIANO SUCRE** - Colon 43
-⭐ 4.7/5 | **¿Por qué?** Receta milanesa tradicional, barista italiano
-🇮🇹 Auténtico: taza 150ml, perfecto equilibrio
-
-🥛 **CAFÉ VELVET** - Hernando Siles 92
-⭐ 4.6/5 | **¿Por qué?** Espuma perfecta densidad, nunca se deshace
-✨ Textura "velvet" - cremosidad que perdura
-
-☁️ **SECRETO:** Pide que calienten la taza primero - diferencia abismal"""
-
-    elif any(palabra in mensaje_lower for palabra in ['latte', 'suave', 'delicado']):
-        return """🧠 **ANÁLISIS SUAVE:** Latte - ¡Perfecto para paladares que buscan delicadeza!
-
-**FILOSOFÍA LATTE:** 1/4 espresso + 3/4 leche vaporizada suavemente. El café abraza la leche, no la domina. Temperatura ideal: 60-65°C para preservar dulzura natural.
-
-☕ **RUTA LATTE PERFECTION:**
-
-🌸 **CAFÉ DULCE** - Loa 67
-⭐ 4.8/5 | **¿Por qué?** Leche descremada artesanal, dulzura natural realzada
-💖 Especialidad: Vanilla latte con extracto real
-
-🌸 **SMOOTH COFFEE** - Audiencias 89
-⭐ 4.7/5 | **¿Por qué?** Técnica de vaporizado suave, sin quemar leche
-🎯 Perfecta temperatura, nunca amargo
+def _api_key_configurada():
+    return settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != 'sk-proj-tu-clave-aqui'
 
-🌸 **CAFÉ HARMONY** - Colón 34  
-⭐ 4.6/5 | **¿Por qué?** Balance magistral, espresso suave blend especial
-🎼 Como sinfonía: cada nota en su lugar
 
-🌸 **DELICATE BREW** - San Alberto 78
-⭐ 4.5/5 | **¿Por qué?** Leche orgánica, proceso lento, amor en cada taza
-🕊️ Tranquilidad absoluta, ritual de relajación
+# Configuración ultra-optimizada para eficiencia máxima
+PARAMETROS_OPENAI = {
+    'model': "gpt-4o-mini",   # Modelo más económico
+    'max_tokens': 140,        # Reducido significativamente
+    'temperature': 0.8,       # Creatividad con eficiencia
+    'top_p': 0.95,            # Optimización adicional
+    'frequency_penalty': 0.1,
+    'presence_penalty': 0.1,
+}
 
-🌿 **PLUS:** Opciones plant-based (avena, almendra) disponibles"""
+# Respuestas más cortas se descartan y se usa el respaldo
+LARGO_MINIMO_RESPUESTA = 25
 
-    elif any(palabra in mensaje_lower for palabra in ['mocha', 'chocolate', 'dulce']):
-        return """🧠 **ANÁLISIS INDULGENTE:** Mocha - ¡La perfecta fusión café-chocolate!
 
-**ALQUIMIA MOCHA:** Espresso + chocolate premium + leche vaporizada + toque de crema. El chocolate debe complementar, no dominar el café. Cacao 70% mínimo para sofisticación.
-
-☕ **RUTA MOCHA SUPREMA:**
-
-🍫 **CHOCO CAFÉ** - Mercado Central
-⭐ 4.9/5 | **¿Por qué?** Chocolate boliviano Para Ti, combinación nacional perfecta
-🇧🇴 Orgullo local: café + chocolate de altura
-
-🍫 **SWEET ESPRESSO** - Plaza Libertad 45
-⭐ 4.7/5 | **¿Por qué?** Ganache casero, temperatura precisa, equilibrio sublime
-👨‍🍳 Chef chocolatero + barista maestro
-
-🍫 **MOCHA ROYAL** - Estudiantes 67
-⭐ 4.6/5 | **¿Por qué?** 3 tipos chocolate: blanco, leche, bitter - personalizable
-🎨 Crea tu mocha ideal, experiencia única
-
-🍫 **CAFÉ INDULGENCE** - Ravelo 89  
-⭐ 4.5/5 | **¿Por qué?** Marshmallows artesanales, cacao en polvo francés
-✨ Experiencia completa: sabor + presentación
-
-🎁 **SECRETO:** Pide chocolate extra hot - se integra mejor"""
-
-    elif any(palabra in mensaje_lower for palabra in ['recomendación', 'sugerir', 'mejor', 'top', 'bueno']):
-        return """🧠 **ANÁLISIS INTEGRAL:** ¡Vamos a encontrar TU lugar perfecto!
-
-**MI METODOLOGÍA:** Evalúo 47 factores: calidad del grano, skill del barista, ambiente, ubicación, precio, experiencia completa, reviews reales, y tu perfil personal.
-
-☕ **TOP 4 UNIVERSAL - ALGO PARA TODOS:**
-
-🏆 **CAFÉ EXCELLENCE** - Aniceto Arce 25  
-⭐ 4.9/5 | **¿Por qué?** Consistencia absoluta, nunca falla, staff experto
-✅ Perfecto si no sabes qué elegir
-
-🏆 **MAESTROS COFFEE** - Plaza 25 de Mayo
-⭐ 4.8/5 | **¿Por qué?** Variedad completa, ambiente versátil, horario extendido  
-🕐 6 AM - 11 PM, siempre abierto
-
-🏆 **PREMIUM BEANS** - Bolívar 67
-⭐ 4.7/5 | **¿Por qué?** Relación calidad-precio imbatible, porciones generosas
-💰 Lujo accesible, valor excepcional
-
-🏆 **SUCRE COFFEE** - San Alberto 45
-⭐ 4.6/5 | **¿Por qué?** Identidad local fuerte, productos regionales, orgullo sucreño  
-🇧🇴 Auténtica experiencia boliviana
-
-💡 **PARA PERSONALIZAR:** ¿Qué tipo de café prefieres? ¿Ambiente específico? ¿Presupuesto? ¿Zona preferida?"""
-
-    # CASOS ESPECIALES Y RESPUESTA POR DEFECTO
-    else:
-        return """🧠 **ANALIZANDO TU CONSULTA...** 
-
-**¿QUÉ BUSCA TU PALADAR?**
-
-🔥 **INTENSIDAD MÁXIMA:** Americano o Espresso
-🥛 **CREMOSIDAD:** Cappuccino o Latte  
-🍫 **INDULGENCIA:** Mocha o Frappé
-
-**TAMBIÉN PUEDES DECIRME:**
-- "Busco un lugar tranquilo para trabajar"
-- "Quiero probar algo diferente"  
-- "Recomiéndame según mi ubicación"
-
-💡 **Mi especialidad:** Crear rutas personalizadas analizando tu perfil, preferencias y contexto específico.
-
-¿Qué información puedes darme para personalizar tu experiencia perfecta? 🗺️"""
-
-
-def get_fallback_response(user_message, conversacion):
-    """Función de compatibilidad - redirige al sistema inteligente mejorado"""
-    return get_smart_fallback_response(user_message, conversacion)
-    """Sistema de respuestas inteligentes avanzado - Mantiene alta calidad sin OpenAI"""
-    mensaje_lower = user_message.lower()
+def construir_mensajes_openai(user_message, conversacion):
+    """
+    Prompt compacto: instrucciones, resumen de lo anterior, contexto reciente
+    y el mensaje del usuario. Su tamaño no crece con la conversación.
+    """
+    # Contexto ultra-optimizado para ahorrar tokens
+    mensajes_anteriores = mensajes_recientes(conversacion, user_message)  # Solo 4 últimos
+    resumen = actualizar_resumen(conversacion, mensajes_anteriores)
     
-    # Análisis del contexto de conversación
-    mensajes_anteriores = list(conversacion.mensajes.all().order_by('timestamp')[-3:])
-    es_primera_interaccion = len(mensajes_anteriores) <= 1
+    # Prompt base eficiente y compacto
+    messages = [
+        {
+            "role": "system", 
+            "content": """Asistente cafeterías Sucre, Bolivia. Análisis inteligente + recomendaciones personalizadas.
+
+PROCESO: Analiza → Evalúa → Recomienda → Explica razonamiento.
+RESPUESTA: Máximo 120 palabras, directo, útil, con fundamentos.
+ESPECIALIDAD: 4 cafeterías por ruta, análisis de preferencias de café."""
+        }
+    ]
+    if resumen:
+        messages.append({"role": "system", "content": f"Antes el usuario preguntó: {resumen}"})
     
-    print("🧠 Sistema de IA de respaldo - Procesando con razonamiento avanzado...")
+    # Agregar solo contexto esencial
+    for msg in mensajes_anteriores:
+        role = "user" if msg.tipo == "U" else "assistant"
+        # Comprimir mensajes largos para eficiencia
+        contenido = msg.contenido[:150] if len(msg.contenido) > 150 else msg.contenido
+        messages.append({"role": role, "content": contenido})
     
-    # SISTEMA DE SALUDOS INTELIGENTE
-    if any(palabra in mensaje_lower for palabra in ['hola', 'hi', 'buenos', 'buenas', 'saludos', 'hello']):
-        return """¡Hola! 👋 **Tu asistente especializado en cafeterías de Sucre está aquí**
-
-🧠 **MI PROCESO DE ANÁLISIS:**
-1️⃣ Escucho tus preferencias de café 
-2️⃣ Analizo tu perfil y ubicación
-3️⃣ Evalúo calidad, ambiente y especialidades
-4️⃣ Diseño ruta optimizada de 4 cafeterías
-5️⃣ Explico el razonamiento detrás de cada recomendación
-
-**¿QUÉ EXPERIENCIA BUSCAS?**
-☕ **AMERICANO** → Puristas del sabor auténtico
-☕ **ESPRESSO** → Intensidad máxima para expertos
-☕ **CAPPUCCINO** → Equilibrio perfecto café-leche
-☕ **LATTE** → Suavidad cremosa y delicada
-☕ **MOCHA** → Indulgencia café-chocolate
-☕ **FRAPPÉ** → Frescura para días cálidos
-
-💡 **Cuéntame:** ¿Qué tipo prefieres? ¿Zona específica de Sucre? ¿Ambiente tranquilo o animado?"""
+    # Comprimir mensaje del usuario si es muy largo
+    mensaje_actual = user_message[:200] if len(user_message) > 200 else user_message
+    messages.append({"role": "user", "content": mensaje_actual})
+    return messages
 
-    # ANÁLISIS AVANZADO POR TIPO DE CAFÉ
-    elif any(palabra in mensaje_lower for palabra in ['americano', 'negro', 'fuerte', 'puro']):
-        return """🧠 **ANÁLISIS INTELIGENTE:** Americano detectado - ¡Excelente para apreciar el grano puro!
 
-**MI RAZONAMIENTO:** El americano revela la verdadera calidad del café. Sin leche que enmascare, cada defecto o virtud se amplifica. He seleccionado places que dominan el arte del tueste y extracción.
-
-☕ **TU RUTA PERSONALIZADA - AMERICANO PREMIUM:**
-
-🏆 **CAFÉ HERITAGE** - Aniceto Arce 25
-⭐ 4.8/5 | **¿Por qué?** Granos premium Yungas, tostado diario artesanal
-⏰ Óptimo: 8-10 AM (máxima frescura)
-
-🏆 **ESPRESSO MAESTRO** - Plaza 25 de Mayo  
-⭐ 4.9/5 | **¿Por qué?** 30 años perfeccionando técnica, método goteo tradicional
-🎯 Ambiente histórico, ritual completo
-
-🏆 **CAFÉ ORIGIN** - Potosí 45
-⭐ 4.7/5 | **¿Por qué?** Contacto directo productores, trazabilidad completa
-💡 Bonus: Explicación origen cada lote
-
-🏆 **PURE BEANS** - España 78  
-⭐ 4.6/5 | **¿Por qué?** Tuestan in-situ, proceso visible, frescura máxima
-🎁 Cata gratuita diferentes perfiles
-
-🗺️ **RUTA:** Centro→Norte→Sur→Oeste (2.5h caminando)"""
-
-    elif any(palabra in mensaje_lower for palabra in ['espresso', 'intenso', 'concentrado', 'fuerte']):
-        return """🧠 **ANÁLISIS EXPERTO:** Espresso - ¡Verdadero conocedor detectado!
-
-**RAZONAMIENTO TÉCNICO:** El espresso perfecto requiere: máquina profesional 9 bares, barista maestro, granos específicos, extracción 25-30 segundos, crema dorada persistente.
-
-☕ **RUTA ESPRESSO MAGISTRAL:**
-
-⚡ **ITALIAN CORNER** - San Alberto 34
-⭐ 4.9/5 | **¿Por qué?** Máquina italiana original, barista certificado Roma
-🎯 Shot perfecto: 30ml, 25 segundos exactos
-
-⚡ **CAFÉ INTENSO** - Bolívar 67
-⭐ 4.8/5 | **¿Por qué?** Blend exclusivo 7 orígenes, tueste dark city+
-💪 Intensidad 9/10, crema espesa 2 minutos
-
-⚡ **MAESTROS DEL CAFÉ** - Junín 89  
-⭐ 4.7/5 | **¿Por qué?** Competencia nacional baristas, técnica impecable
-🏆 Campeones bolivianos 2024
+def _respuesta_valida(response):
+    """Texto de la respuesta, o None si es muy corta para servir"""
+    respuesta = response.choices[0].message.content.strip()
+    print(f"✅ OpenAI eficiente: {len(respuesta)} chars | Tokens minimizados")
+    
+    # Validación de calidad - si es muy corto, usar respaldo
+    if len(respuesta) < LARGO_MINIMO_RESPUESTA:
+        print("⚠️ Respuesta insuficiente, activando respaldo inteligente...")
+        return None
+    return respuesta
 
-⚡ **ESPRESSO BAR** - Ravelo 45
-⭐ 4.6/5 | **¿Por qué?** Ambiente italiano auténtico, ritual completo
-🇮🇹 Como en Roma: standing bar, rápido, intenso
 
-🔥 **CONSEJO PRO:** Pídelo "ristretto" para máxima intensidad"""
+def _pedir_openai(messages, conversacion):
+    with llamada_openai():
+        print("🚀 OpenAI optimizado - ahorrando tokens...")
+        response = obtener_cliente().chat.completions.create(messages=messages, **PARAMETROS_OPENAI)
+    registrar_tokens(conversacion, response.usage)
+    return _respuesta_valida(response)
 
-    elif any(palabra in mensaje_lower for palabra in ['cappuccino', 'capuchino', 'cremoso']):
-        return """🧠 **ANÁLISIS CREMOSO:** Cappuccino - ¡El equilibrio perfecto en tu radar!
 
-**CIENCIA DEL CAPPUCCINO:** 1/3 espresso + 1/3 leche caliente + 1/3 espuma microtexturizada. Temperatura 65-70°C, arte latte opcional, taza precalentada.
+async def _apedir_openai(messages, conversacion):
+    semaforo = limite_concurrencia()
+    await asyncio.wait_for(semaforo.acquire(), settings.OPENAI_TIMEOUT)
+    try:
+        with llamada_openai():
+            print("🚀 OpenAI asíncrono - cliente compartido...")
+            response = await obtener_cliente_async().chat.completions.create(
+                messages=messages, **PARAMETROS_OPENAI
+            )
+    finally:
+        semaforo.release()
+    await sync_to_async(registrar_tokens)(conversacion, response.usage)
+    return _respuesta_valida(response)
 
-☕ **RUTA CAPPUCCINO SUBLIME:**
 
-🥛 **MILK & COFFEE** - Campero 56
-⭐ 4.9/5 | **¿Por qué?** Espuma de seda, temperatura perfecta, arte magistral
-🎨 Latte art: cisne, rosetta, corazón personalizado
+async def _astream_openai(messages, conversacion):
+    """Partes de la respuesta de OpenAI a medida que genera los tokens"""
+    semaforo = limite_concurrencia()
+    await asyncio.wait_for(semaforo.acquire(), settings.OPENAI_TIMEOUT)
+    try:
+        # Para el circuito cuenta todo el stream: un corte a mitad también es un fallo
+        with llamada_openai():
+            print("🚀 OpenAI en streaming...")
+            stream = await obtener_cliente_async().chat.completions.create(
+                messages=messages, stream=True, stream_options={'include_usage': True}, **PARAMETROS_OPENAI
+            )
+            uso = None
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    uso = chunk.usage
+                if not chunk.choices:
+                    continue
+                texto = chunk.choices[0].delta.content
+                if texto:
+                    yield texto
+    finally:
+        semaforo.release()
+    if uso is not None:
+        await sync_to_async(registrar_tokens)(conversacion, uso)
+
+
+def _responder(messages, conversacion):
+    """Respuesta de una pregunta parecida ya respondida o, si no hay, de OpenAI"""
+    respuesta = buscar_respuesta_similar(messages)
+    if respuesta is None:
+        respuesta = _pedir_openai(messages, conversacion)
+        if respuesta is not None:
+            recordar_respuesta(messages, respuesta)
+    return respuesta
+
+
+async def _aresponder(messages, conversacion):
+    respuesta = await sync_to_async(buscar_respuesta_similar)(messages)
+    if respuesta is None:
+        respuesta = await _apedir_openai(messages, conversacion)
+        if respuesta is not None:
+            await sync_to_async(recordar_respuesta)(messages, respuesta)
+    return respuesta
 
-🥛 **CREMOSO CAFÉ** - Azurduy 78
-⭐ 4.8/5 | **¿Por qué?** Leche orgánica local, vaporizador profesional
-🏔️ Leche de vaca lechera altura, cremosidad natural
 
-🥛 **ITALIANO SUCRE** - Colon 43
-⭐ 4.7/5 | **¿Por qué?** Receta milanesa tradicional, barista italiano
-🇮🇹 Auténtico: taza 150ml, perfecto equilibrio
+def get_openai_response(user_message, conversacion):
+    """
+    Obtener respuesta del chatbot usando OpenAI con sistema optimizado y eficiente.
+    Las preguntas repetidas se responden desde cache_respuestas y las
+    parecidas desde cache_semantico, sin llamar a OpenAI.
+    """
+    try:
+        # Sistema de verificación inteligente de API
+        if not _api_key_configurada():
+            print("🔄 API key no configurada - Usando sistema inteligente de respaldo")
+            return get_smart_fallback_response(user_message, conversacion)
+        if presupuesto_agotado(conversacion):
+            print("💰 Presupuesto de tokens de la conversación agotado - Respaldo inteligente")
+            return get_smart_fallback_response(user_message, conversacion)
+        
+        messages = construir_mensajes_openai(user_message, conversacion)
+        respuesta = obtener_o_generar(clave_respuesta(messages), lambda: _responder(messages, conversacion))
+        return respuesta or get_smart_fallback_response(user_message, conversacion)
+        
+    except CircuitoAbierto:
+        print("⚡ Circuito OpenAI abierto - Respaldo inteligente sin esperar")
+        return get_smart_fallback_response(user_message, conversacion)
+    except openai.RateLimitError:
+        print("🟡 Cuota OpenAI excedida - Sistema inteligente de respaldo ACTIVO")
+        return get_smart_fallback_response(user_message, conversacion)
+    except openai.AuthenticationError:
+        print("🔑 Error autenticación OpenAI - Respaldo inteligente funcionando")
+        return get_smart_fallback_response(user_message, conversacion)
+    except Exception as e:
+        print(f"🛡️ OpenAI temporal: {type(e).__name__} - Respaldo avanzado activo")
+        return get_smart_fallback_response(user_message, conversacion)
 
-🥛 **CAFÉ VELVET** - Hernando Siles 92
-⭐ 4.6/5 | **¿Por qué?** Espuma perfecta densidad, nunca se deshace
-✨ Textura "velvet" - cremosidad que perdura
 
-☁️ **SECRETO:** Pide que calienten la taza primero - diferencia abismal"""
-    """Respuestas predefinidas con razonamiento inteligente cuando OpenAI no está disponible"""
-    mensaje_lower = user_message.lower()
+async def get_openai_response_async(user_message, conversacion):
+    """
+    Versión asíncrona de get_openai_response para la vista ASGI: usa el
+    cliente compartido del event loop y espera su turno si ya hay
+    OPENAI_MAX_CONCURRENCIA llamadas en curso. Las consultas a la base de
+    datos se ejecutan con sync_to_async.
+    """
+    respaldo = sync_to_async(get_smart_fallback_response)
+    if not _api_key_configurada():
+        print("🔄 API key no configurada - Usando sistema inteligente de respaldo")
+        return await respaldo(user_message, conversacion)
+    if presupuesto_agotado(conversacion):
+        print("💰 Presupuesto de tokens de la conversación agotado - Respaldo inteligente")
+        return await respaldo(user_message, conversacion)
     
-    # Obtener historial para contexto
-    mensajes_anteriores = list(conversacion.mensajes.all().order_by('timestamp')[-3:])
-    es_primera_interaccion = len(mensajes_anteriores) <= 1
+    try:
+        messages = await sync_to_async(construir_mensajes_openai)(user_message, conversacion)
+        respuesta = await aobtener_o_generar(clave_respuesta(messages), lambda: _aresponder(messages, conversacion))
+        return respuesta or await respaldo(user_message, conversacion)
     
-    # ANÁLISIS INTELIGENTE DE SALUDOS
-    if any(palabra in mensaje_lower for palabra in ['hola', 'hi', 'buenos', 'buenas', 'saludos']):
-        return """¡Hola! 👋 Soy tu asistente virtual especializado en cafeterías de Sucre.
-
-🧠 **MI PROCESO DE RAZONAMIENTO:**
-Analizo tus preferencias de café → Evalúo las mejores cafeterías de Sucre → Diseño una ruta optimizada de 4 lugares → Explico por qué cada elección es perfecta para ti.
-
-**¿QUÉ TIPO DE EXPERIENCIA DE CAFÉ BUSCAS?**
+    except CircuitoAbierto:
+        print("⚡ Circuito OpenAI abierto - Respaldo inteligente sin esperar")
+        return await respaldo(user_message, conversacion)
+    except asyncio.TimeoutError:
+        print("🟡 Demasiadas consultas simultáneas a OpenAI - Respaldo inteligente activo")
+        return await respaldo(user_message, conversacion)
+    except Exception as e:
+        print(f"🛡️ OpenAI temporal: {type(e).__name__} - Respaldo avanzado activo")
+        return await respaldo(user_message, conversacion)
 
-☕ **AMERICANO** - Para puristas que aprecian el sabor auténtico del grano
-☕ **ESPRESSO** - Máxima intensidad para conocedores exigentes  
-☕ **CAPPUCCINO** - El equilibrio perfecto entre café y leche cremosa
-☕ **LATTE** - Suavidad y cremosidad para paladares delicados
-☕ **MOCHA** - La indulgencia perfecta: café meets chocolate
-☕ **FRAPPÉ** - Refrescante y diferente para días cálidos
-☕ **MACCHIATO** - Sofisticación italiana en cada sorbo
-☕ **CORTADO** - Tradición sudamericana con intensidad controlada
 
-💡 **Cuéntame:** ¿Qué tipo prefieres? ¿Tienes alguna preferencia de zona en Sucre? ¿Buscas ambiente tranquilo o animado?"""
+async def stream_openai_response_async(user_message, conversacion):
+    """
+    Igual que get_openai_response_async, pero entrega la respuesta por partes
+    a medida que OpenAI genera los tokens. Si falla antes del primer token se
+    entrega completa la respuesta de respaldo. Si ya hay una solicitud en
+    curso con la misma pregunta, se espera su respuesta y se entrega completa.
+    """
+    respaldo = sync_to_async(get_smart_fallback_response)
+    if not _api_key_configurada():
+        print("🔄 API key no configurada - Usando sistema inteligente de respaldo")
+        yield await respaldo(user_message, conversacion)
+        return
+    if presupuesto_agotado(conversacion):
+        print("💰 Presupuesto de tokens de la conversación agotado - Respaldo inteligente")
+        yield await respaldo(user_message, conversacion)
+        return
     
-    # ANÁLISIS ESPECÍFICO POR TIPO DE CAFÉ CON RAZONAMIENTO
-    elif any(palabra in mensaje_lower for palabra in ['americano', 'negro', 'fuerte']):
-        return """🧠 **ANÁLISIS:** Detecté que prefieres americano - ¡excelente elección para apreciar el verdadero sabor del café!
-
-**MI RAZONAMIENTO:**
-El americano requiere granos de alta calidad y tueste perfecto, ya que no hay leche que enmascare imperfecciones. He seleccionado cafeterías que destacan por su expertise en este café puro.
-
-☕ **TU RUTA PERSONALIZADA DE AMERICANO:**
-
-**1. CAFÉ HERITAGE** - Calle Aniceto Arce 25
-⭐ 4.8/5 | **¿Por qué?** → Importan granos premium de Yungas, tostado artesanal diario
-💡 Mejor horario: 8-10 AM (frescura máxima)
-
-**2. CAFÉ COLONIAL** - Plaza 25 de Mayo  
-⭐ 4.7/5 | **¿Por qué?** → 30 años perfeccionando el americano, método de goteo tradicional
-💡 Ambiente: Histórico, perfecto para disfrutar sin prisa
-
-**3. CAFÉ ORIGIN** - Calle Potosí 45
-⭐ 4.6/5 | **¿Por qué?** → Contacto directo con productores, trazabilidad completa del grano
-💡 Especial: Te explican el origen de cada lote
-
-**4. CAFÉ PUREBEANS** - Calle España 78  
-⭐ 4.5/5 | **¿Por qué?** → Tuestan en sitio, puedes ver el proceso, máxima frescura
-💡 Bonus: Cata gratuita de diferentes perfiles de tueste
-
-🗺️ **RUTA OPTIMIZADA:** Centro → Norte → Sur → Oeste (2.5 horas, caminando)"""
+    partes = []
+    try:
+        messages = await sync_to_async(construir_mensajes_openai)(user_message, conversacion)
+        clave = clave_respuesta(messages)
+        # Si otra solicitud ya consulta la misma pregunta, se espera su respuesta
+        guardada, futuro = await aobtener_o_anunciar(clave)
+        if futuro is None:
+            if guardada is not None:
+                partes.append(guardada)
+                yield guardada
+        else:
+            respuesta = None
+            try:
+                respuesta = await sync_to_async(buscar_respuesta_similar)(messages)
+                if respuesta is not None:
+                    partes.append(respuesta)
+                    yield respuesta
+                else:
+                    # aclosing: si el usuario se desconecta se libera enseguida el turno de OpenAI
+                    async with aclosing(_astream_openai(messages, conversacion)) as stream:
+                        async for texto in stream:
+                            partes.append(texto)
+                            yield texto
+                    respuesta = ''.join(partes).strip()
+                    if len(respuesta) >= LARGO_MINIMO_RESPUESTA:
+                        await sync_to_async(recordar_respuesta)(messages, respuesta)
+                    else:
+                        respuesta = None
+            finally:
+                # Si falla o el usuario se desconecta, las que esperan reciben None y usan el respaldo
+                publicar_respuesta(clave, futuro, respuesta)
+    except CircuitoAbierto:
+        print("⚡ Circuito OpenAI abierto - Respaldo inteligente sin esperar")
+    except asyncio.TimeoutError:
+        print("🟡 Demasiadas consultas simultáneas a OpenAI - Respaldo inteligente activo")
+    except Exception as e:
+        print(f"🛡️ OpenAI streaming: {type(e).__name__} - Respaldo avanzado activo")
     
-    elif any(palabra in mensaje_lower for palabra in ['latte', 'suave', 'cremoso', 'delicado']):
-        return """🧠 **ANÁLISIS SUAVE:** Latte - ¡Perfecto para paladares que buscan delicadeza!
-
-**FILOSOFÍA LATTE:** 1/4 espresso + 3/4 leche vaporizada suavemente. El café abraza la leche, no la domina. Temperatura ideal: 60-65°C para preservar dulzura natural.
-
-☕ **RUTA LATTE PERFECTION:**
-
-🌸 **CAFÉ DULCE** - Loa 67
-⭐ 4.8/5 | **¿Por qué?** Leche descremada artesanal, dulzura natural realzada
-💖 Especialidad: Vanilla latte con extracto real
-
-🌸 **SMOOTH COFFEE** - Audiencias 89
-⭐ 4.7/5 | **¿Por qué?** Técnica de vaporizado suave, sin quemar leche
-🎯 Perfecta temperatura, nunca amargo
-
-🌸 **CAFÉ HARMONY** - Colón 34  
-⭐ 4.6/5 | **¿Por qué?** Balance magistral, espresso suave blend especial
-🎼 Como sinfonía: cada nota en su lugar
-
-🌸 **DELICATE BREW** - San Alberto 78
-⭐ 4.5/5 | **¿Por qué?** Leche orgánica, proceso lento, amor en cada taza
-🕊️ Tranquilidad absoluta, ritual de relajación
-
-🌿 **PLUS:** Opciones plant-based (avena, almendra) disponibles"""
-
-    elif any(palabra in mensaje_lower for palabra in ['mocha', 'chocolate', 'dulce']):
-        return """🧠 **ANÁLISIS INDULGENTE:** Mocha - ¡La perfecta fusión café-chocolate!
-
-**ALQUIMIA MOCHA:** Espresso + chocolate premium + leche vaporizada + toque de crema. El chocolate debe complementar, no dominar el café. Cacao 70% mínimo para sofisticación.
-
-☕ **RUTA MOCHA SUPREMA:**
-
-🍫 **CHOCO CAFÉ** - Mercado Central
-⭐ 4.9/5 | **¿Por qué?** Chocolate boliviano Para Ti, combinación nacional perfecta
-🇧🇴 Orgullo local: café + chocolate de altura
-
-🍫 **SWEET ESPRESSO** - Plaza Libertad 45
-⭐ 4.7/5 | **¿Por qué?** Ganache casero, temperatura precisa, equilibrio sublime
-👨‍🍳 Chef chocolatero + barista maestro
-
-🍫 **MOCHA ROYAL** - Estudiantes 67
-⭐ 4.6/5 | **¿Por qué?** 3 tipos chocolate: blanco, leche, bitter - personalizable
-🎨 Crea tu mocha ideal, experiencia única
-
-🍫 **CAFÉ INDULGENCE** - Ravelo 89  
-⭐ 4.5/5 | **¿Por qué?** Marshmallows artesanales, cacao en polvo francés
-✨ Experiencia completa: sabor + presentación
-
-🎁 **SECRETO:** Pide chocolate extra hot - se integra mejor"""
-
-    elif any(palabra in mensaje_lower for palabra in ['frappé', 'frío', 'helado', 'refrescante']):
-        return """🧠 **ANÁLISIS REFRESCANTE:** Frappé - ¡Perfecto para el clima cálido de Sucre!
-
-**CIENCIA DEL FRAPPÉ:** Café concentrado frío + hielo + leche + azúcar + licuadora. La clave: café fuerte que no se diluya, hielo de calidad, textura cremosa sin ser aguado.
-
-☕ **RUTA FRAPPÉ PARADISE:**
-
-🧊 **ICE COFFEE** - Arenales 34
-⭐ 4.8/5 | **¿Por qué?** Cold brew 12 horas, base perfecta para frappé
-❄️ Nunca amargo, concentración ideal
-
-🧊 **FROZEN CAFÉ** - Plaza 25 de Mayo
-⭐ 4.7/5 | **¿Por qué?** Hielo purificado, licuadora profesional, consistencia perfecta
-🌪️ Textura cremosa, burbujas finas
-
-🧊 **CAFÉ FRESCO** - Potosí 67
-⭐ 4.6/5 | **¿Por qué?** Syrups artesanales, personalización infinita
-🎨 Sabores: vainilla, caramelo, chocolate, coco
-
-🧊 **REFRESH STATION** - Bolívar 45
-⭐ 4.5/5 | **¿Por qué?** Toppings premium: whipped cream, chocolate chips
-☀️ Perfecto para tardes calurosas
-
-🌡️ **PRO TIP:** Mejor entre 2-5 PM cuando el sol está fuerte"""
-
-    # BÚSQUEDAS DE UBICACIÓN ESPECÍFICA
-    elif any(palabra in mensaje_lower for palabra in ['centro', 'plaza', 'mercado']):
-        return """🧠 **ANÁLISIS GEOGRÁFICO:** Centro de Sucre - ¡Corazón histórico cafetero!
-
-**VENTAJA ESTRATÉGICA:** Máxima concentración de cafeterías premium, fácil acceso peatonal, ambiente colonial único, perfecta para ruta completa.
-
-☕ **RUTA CENTRO HISTÓRICO:**
-
-🏛️ **CAFÉ COLONIAL** - Plaza 25 de Mayo
-⭐ 4.9/5 | **¿Por qué?** Vista única a la plaza, ambiente histórico incomparable
-🎭 Perfecto para observar vida sucreña
-
-🏛️ **HERITAGE COFFEE** - Calle Audiencias 45  
-⭐ 4.8/5 | **¿Por qué?** Casona restaurada, arquitectura colonial + café moderno
-📸 Instagram-worthy, historia viva
-
-🏛️ **MERCADO CAFÉ** - Mercado Central
-⭐ 4.7/5 | **¿Por qué?** Autenticidad total, precios locales, sabor tradicional
-🏪 Experiencia cultural completa
-
-🏛️ **PLAZA COFFEE** - San Alberto esquina Colón
-⭐ 4.6/5 | **¿Por qué?** Terraza con vista, brisa natural, ubicación estratégica
-🌤️ Perfecto para cualquier hora del día
-
-🚶‍♂️ **RUTA:** Todo caminando, máximo 15 min entre lugares"""
-
-    # ANÁLISIS DE AMBIENTE Y EXPERIENCIA
-    elif any(palabra in mensaje_lower for palabra in ['tranquilo', 'relajado', 'estudiar', 'trabajar']):
-        return """🧠 **ANÁLISIS AMBIENTAL:** Tranquilidad - ¡Espacios perfectos para concentración!
-
-**FACTORES CLAVE:** Ruido <50dB, WiFi estable, enchufes disponibles, mesas amplias, iluminación natural, ambiente sereno que invite a la productividad.
-
-☕ **RUTA TRANQUILITY:**
-
-🤫 **SILENT CAFÉ** - Calvo 67 (2° piso)
-⭐ 4.8/5 | **¿Por qué?** Biblioteca-café, susurros obligatorios, concentración máxima
-📚 Mesa individual, lámpara personal, silencio sagrado
-
-🤫 **CAFÉ ZEN** - Hernando Siles 45
-⭐ 4.7/5 | **¿Por qué?** Música suave, plantas naturales, aire purificado
-🧘‍♀️ Ambiente meditativo, stress-free zone
-
-🤫 **STUDY COFFEE** - Universitaria 89
-⭐ 4.6/5 | **¿Por qué?** WiFi premium, enchufes en cada mesa, estudiantes serios
-💻 Co-working natural, energía productiva
-
-🤫 **PEACEFUL BREW** - Aniceto Arce 34  
-⭐ 4.5/5 | **¿Por qué?** Jardín interior, sonidos naturales, alejado del tráfico
-🌿 Oasis urbano, creatividad flowstate
-
-⚡ **BONUS:** Todos con WiFi 50+ Mbps y política "laptop-friendly\""""
-
-    # RECOMENDACIONES GENERALES Y EXPLORATORIAS  
-    elif any(palabra in mensaje_lower for palabra in ['recomendación', 'sugerir', 'mejor', 'top', 'bueno']):
-        return """🧠 **ANÁLISIS INTEGRAL:** ¡Vamos a encontrar TU lugar perfecto!
-
-**MI METODOLOGÍA:** Evalúo 47 factores: calidad del grano, skill del barista, ambiente, ubicación, precio, experiencia completa, reviews reales, y tu perfil personal.
-
-☕ **TOP 4 UNIVERSAL - ALGO PARA TODOS:**
-
-🏆 **CAFÉ EXCELLENCE** - Aniceto Arce 25  
-⭐ 4.9/5 | **¿Por qué?** Consistencia absoluta, nunca falla, staff experto
-✅ Perfecto si no sabes qué elegir
-
-🏆 **MAESTROS COFFEE** - Plaza 25 de Mayo
-⭐ 4.8/5 | **¿Por qué?** Variedad completa, ambiente versátil, horario extendido  
-🕐 6 AM - 11 PM, siempre abierto
-
-🏆 **PREMIUM BEANS** - Bolívar 67
-⭐ 4.7/5 | **¿Por qué?** Relación calidad-precio imbatible, porciones generosas
-💰 Lujo accesible, valor excepcional
-
-🏆 **SUCRE COFFEE** - San Alberto 45
-⭐ 4.6/5 | **¿Por qué?** Identidad local fuerte, productos regionales, orgullo sucreño  
-🇧🇴 Auténtica experiencia boliviana
-
-💡 **PARA PERSONALIZAR:** ¿Qué tipo de café prefieres? ¿Ambiente específico? ¿Presupuesto? ¿Zona preferida?"""
-
-    # CASOS ESPECIALES Y CONSULTAS TÉCNICAS
-    else:
-        return """🧠 **ANÁLISIS PERSONALIZADO:** ¡Entiendo que buscas algo específico!
-
-**PROCESANDO TU CONSULTA:** Analizo palabras clave, contexto, preferencias implícitas y historial para crear la recomendación perfecta para ti.
+    if not partes:
+        yield await respaldo(user_message, conversacion)
 
-☕ **MIENTRAS PROCESO, AQUÍ TIENES OPCIONES VERSÁTILES:**
 
-🎯 **ADAPTABLE COFFEE** - Centro histórico
-⭐ 4.8/5 | **Especialidad:** Se adaptan a cualquier preferencia, menú extenso
-💡 Perfectos para descubrir tu café ideal
-
-🎯 **CUSTOM CAFÉ** - Plaza principal  
-⭐ 4.7/5 | **Especialidad:** Personalizaciones infinitas, barista consultor
-🔧 Te ayudan a crear tu bebida perfecta
-
-🎯 **ALL-IN-ONE** - Zona comercial
-⭐ 4.6/5 | **Especialidad:** Ambiente multifacético, opciones para todos
-🌈 Desde intenso hasta suave, tranquilo a animado
-
-🎯 **DISCOVERY CAFÉ** - Área turística
-⭐ 4.5/5 | **Especialidad:** Experiencia completa, tours de sabores
-🗺️ Perfecto para explorar diferentes estilos
-
-**🤔 AYÚDAME A AYUDARTE MEJOR:**
-• ¿Qué tipo de café te gusta normalmente?
-• ¿Prefieres ambiente tranquilo o animado?  
-• ¿Alguna zona específica de Sucre?
-• ¿Es para trabajar, relajarte o socializar?
-
-¡Con esta info creo tu ruta personalizada perfecta! ☕✨"""
+def get_smart_fallback_response(user_message, conversacion):
+    """
+    Sistema de respuestas inteligentes avanzado - Mantiene alta calidad sin OpenAI.
+    La intención del mensaje se detecta en una sola pasada (ver respaldo.py).
+    """
+    print("🧠 Sistema de IA de respaldo - Procesando con razonamiento avanzado...")
+    return motor_intenciones.responder(user_message)
 
 
 def get_fallback_response(user_message, conversacion):
@@ -740,11 +406,41 @@ def chat_view(request):
     return render(request, 'chat/chat.html', context)
 
 
+def obtener_conversacion_activa(usuario):
+    """Conversación activa del usuario, creándola si no existe"""
+    conversacion = Conversacion.objects.filter(
+        usuario=usuario,
+        activa=True
+    ).first()
+    
+    if not conversacion:
+        conversacion = Conversacion.objects.create(
+            usuario=usuario,
+            activa=True
+        )
+    return conversacion
+
+
+def recomendaciones_para(mensaje_usuario, respuesta_bot):
+    """Cafeterías sugeridas si la respuesta del bot habla de rutas o cafeterías"""
+    # Análisis inteligente para detectar recomendaciones
+    contiene_recomendaciones = any(palabra in respuesta_bot.lower() 
+                                 for palabra in ['ruta', 'cafetería', 'recomiendo', 'café'])
+    if not contiene_recomendaciones:
+        return []
+    return get_cafeterias_recomendadas_inteligente(mensaje_usuario, respuesta_bot)
+
+
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
-def enviar_mensaje(request):
-    """Enviar mensaje al chatbot con manejo inteligente de errores"""
+@limitar('chat')
+async def enviar_mensaje(request):
+    """
+    Enviar mensaje al chatbot con manejo inteligente de errores.
+    Es asíncrona: servida con cafeterias_sucre/asgi.py, un mismo proceso
+    atiende muchas conversaciones mientras esperan a OpenAI.
+    """
     try:
         data = json.loads(request.body)
         mensaje_usuario = data.get('mensaje', '').strip()
@@ -752,20 +448,11 @@ def enviar_mensaje(request):
         if not mensaje_usuario:
             return JsonResponse({'error': 'Mensaje vacío'}, status=400)
         
-        # Obtener conversación activa
-        conversacion = Conversacion.objects.filter(
-            usuario=request.user,
-            activa=True
-        ).first()
-        
-        if not conversacion:
-            conversacion = Conversacion.objects.create(
-                usuario=request.user,
-                activa=True
-            )
+        usuario = await request.auser()
+        conversacion = await sync_to_async(obtener_conversacion_activa)(usuario)
         
         # Guardar mensaje del usuario
-        mensaje_user = Mensaje.objects.create(
+        await Mensaje.objects.acreate(
             conversacion=conversacion,
             tipo='U',
             contenido=mensaje_usuario
@@ -773,38 +460,23 @@ def enviar_mensaje(request):
         
         # Obtener respuesta del chatbot (con razonamiento mejorado)
         print(f"🤖 Procesando mensaje: {mensaje_usuario[:50]}...")
-        respuesta_bot = get_openai_response(mensaje_usuario, conversacion)
+        respuesta_bot = await get_openai_response_async(mensaje_usuario, conversacion)
         
         # Logging para análisis de calidad
         print(f"✅ Respuesta generada: {len(respuesta_bot)} caracteres")
         
         # Guardar respuesta del bot
-        mensaje_bot = Mensaje.objects.create(
+        await Mensaje.objects.acreate(
             conversacion=conversacion,
             tipo='B',
             contenido=respuesta_bot
         )
         
-        # Análisis inteligente para detectar recomendaciones
-        contiene_recomendaciones = any(palabra in respuesta_bot.lower() 
-                                     for palabra in ['ruta', 'cafetería', 'recomiendo', 'café'])
-        
-        if contiene_recomendaciones:
-            # Obtener cafeterías recomendadas con mejor análisis
-            cafeterias_recomendadas = get_cafeterias_recomendadas_inteligente(mensaje_usuario, respuesta_bot)
-            
-            return JsonResponse({
-                'success': True,
-                'mensaje_bot': respuesta_bot,
-                'tiene_razonamiento': True,
-                'cafeterias_recomendadas': cafeterias_recomendadas
-            })
-        
         return JsonResponse({
             'success': True,
             'mensaje_bot': respuesta_bot,
             'tiene_razonamiento': True,
-            'cafeterias_recomendadas': []
+            'cafeterias_recomendadas': await sync_to_async(recomendaciones_para)(mensaje_usuario, respuesta_bot)
         })
         
     except Exception as e:
@@ -815,6 +487,82 @@ def enviar_mensaje(request):
         }, status=500)
 
 
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@login_required
+@require_http_methods(["POST"])
+@limitar('chat')
+async def enviar_mensaje_stream(request):
+    """
+    Igual que enviar_mensaje, pero responde con Server-Sent Events:
+    un evento `token` por cada parte del texto y un evento `fin` con la
+    respuesta completa y las cafeterías recomendadas. La respuesta del bot
+    se guarda al terminar el stream, aunque el cliente se desconecte antes.
+    Es asíncrona para que bajo ASGI cada parte se envíe apenas llega de
+    OpenAI (con un generador síncrono Django junta todo antes de enviarlo).
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    mensaje_usuario = data.get('mensaje', '').strip()
+    if not mensaje_usuario:
+        return JsonResponse({'error': 'Mensaje vacío'}, status=400)
+    
+    usuario = await request.auser()
+    conversacion = await sync_to_async(obtener_conversacion_activa)(usuario)
+    await Mensaje.objects.acreate(
+        conversacion=conversacion,
+        tipo='U',
+        contenido=mensaje_usuario
+    )
+    print(f"🤖 Procesando mensaje (streaming): {mensaje_usuario[:50]}...")
+    
+    async def eventos():
+        partes = []
+        try:
+            async for texto in stream_openai_response_async(mensaje_usuario, conversacion):
+                partes.append(texto)
+                yield _evento_sse('token', {'texto': texto})
+        finally:
+            respuesta_bot = ''.join(partes).strip()
+            if respuesta_bot:
+                await Mensaje.objects.acreate(
+                    conversacion=conversacion,
+                    tipo='B',
+                    contenido=respuesta_bot
+                )
+        
+        print(f"✅ Respuesta enviada: {len(respuesta_bot)} caracteres")
+        yield _evento_sse('fin', {
+            'mensaje_bot': respuesta_bot,
+            'cafeterias_recomendadas': await sync_to_async(recomendaciones_para)(mensaje_usuario, respuesta_bot),
+        })
+    
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evita que nginx acumule el stream
+    return response
+
+
+@login_required
+def estadisticas_cache_chat(request):
+    """Aciertos y fallos del caché de respuestas del chatbot (solo staff)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    return JsonResponse({'success': True, **estadisticas_cache()})
+
+
+@login_required
+def estado_circuito_openai(request):
+    """Estado y métricas del circuit breaker de OpenAI (solo staff)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    return JsonResponse({'success': True, **estado_circuito()})
+
+
 def get_cafeterias_recomendadas_inteligente(mensaje_usuario, respuesta_bot):
     """Obtener cafeterías con análisis inteligente mejorado"""
     try:
@@ -917,22 +665,47 @@ def crear_recorrido_chat(request):
                 'error': 'Debe seleccionar exactamente 4 cafeterías'
             })
         
+        # Ordenar las paradas según distancia y horarios de atención
+        coordenadas = obtener_coordenadas()
+        ids_ruta = [x for x in dict.fromkeys(int(x) for x in cafeterias_ids) if x in coordenadas]
+        if len(ids_ruta) != 4:
+            return JsonResponse({
+                'success': False,
+                'error': 'Debe seleccionar exactamente 4 cafeterías'
+            })
+
+        if data.get('lat') is not None and data.get('lng') is not None:
+            lat, lng = float(data['lat']), float(data['lng'])
+        else:
+            # Sin ubicación del usuario se parte de la primera cafetería elegida
+            lat, lng = coordenadas.coordenadas_de(ids_ruta[0])
+
+        plan = planificar_recorrido(
+            ids_ruta, matriz_recorrido(ids_ruta, lat, lng), interpretar_hora_inicio(data.get('hora_inicio'))
+        )
+
         # Crear nuevo recorrido
         recorrido = Recorrido.objects.create(
             nombre=f"Recorrido personalizado - {request.user.username}",
             descripcion="Recorrido creado por el chatbot basado en tus preferencias",
-            duracion_estimada=120,  # 2 horas estimadas
-            distancia_total=5.0,    # 5 km estimados
+            duracion_estimada=plan['duracion_min'],
+            distancia_total=round(plan['distancia_km'], 2),
         )
         
-        # Agregar cafeterías al recorrido
-        for i, cafeteria_id in enumerate(cafeterias_ids, 1):
-            cafeteria = Cafeteria.objects.get(id=cafeteria_id)
-            recorrido.cafeterias.add(cafeteria, through_defaults={'orden': i})
+        # Agregar cafeterías al recorrido: primero las abiertas en orden de visita,
+        # al final las que estarán cerradas
+        cafeterias_por_id = Cafeteria.objects.in_bulk(ids_ruta)
+        for i, cafeteria_id in enumerate(plan['orden'] + plan['omitidas'], 1):
+            recorrido.cafeterias.add(cafeterias_por_id[cafeteria_id], through_defaults={'orden': i})
         
         return JsonResponse({
             'success': True,
             'recorrido_id': recorrido.id,
+            'cafeterias_cerradas': plan['omitidas'],
+            'llegadas': {
+                parada['id']: parada['llegada'].isoformat(timespec='minutes')
+                for parada in plan['paradas']
+            },
             'mensaje': 'Recorrido creado exitosamente'
         })
         
@@ -966,15 +739,18 @@ def nueva_conversacion(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@limitar('audio')
 def generar_audio(request):
     """Generar audio usando Amazon Polly"""
     try:
         data = json.loads(request.body)
         text = data.get('text', '').strip()
-        voice_id = data.get('voice_id', settings.POLLY_VOICE_ID)
+        voice_id = data.get('voice_id') or settings.POLLY_VOICE_ID
         
         if not text:
             return JsonResponse({'error': 'Texto vacío'}, status=400)
+        if voice_id not in voces_permitidas():
+            return JsonResponse({'error': 'Voz no disponible'}, status=400)
         
         # Limpiar texto de emojis y símbolos antes de generar audio
         texto_limpio = limpiar_texto_para_voz(text)
@@ -1005,6 +781,47 @@ def generar_audio(request):
         }, status=500)
 
 
+@require_http_methods(["GET"])
+def audio_voz(request):
+    """
+    MP3 del texto para <audio src>: del caché de audio si ya se generó (con
+    soporte de Range) o transmitido desde Polly a medida que llega, frase por
+    frase con TTS_POR_FRASES. Solo lo que hay que generar cuenta para el
+    límite de solicitudes.
+    """
+    texto = limpiar_texto_para_voz(request.GET.get('texto', '').strip())
+    voice_id = request.GET.get('voz') or settings.POLLY_VOICE_ID
+    if not texto:
+        return JsonResponse({'error': 'Texto no contiene contenido legible'}, status=400)
+    # Solo voces configuradas: cualquier otro valor llegaría a Polly y al caché en disco
+    if voice_id not in voces_permitidas():
+        return JsonResponse({'error': 'Voz no disponible'}, status=400)
+    
+    clave = clave_audio(texto, voice_id, MOTOR_POLLY)
+    ruta = obtener_cache_audio().ruta(clave)
+    if ruta is not None:
+        print(f"🎧 Audio desde caché ({voice_id}) - sin llamar a Polly")
+        return respuesta_mp3(request, ruta, clave)
+    
+    rechazo = limite_excedido('audio', request, request.user)
+    if rechazo:
+        return rechazo
+    if not voice_service.is_available():
+        return JsonResponse({
+            'success': False,
+            'error': 'Amazon Polly no disponible. Usando voz del navegador.'
+        }, status=503)
+    try:
+        if settings.TTS_POR_FRASES:
+            partes = voice_service.partes_mp3_por_frases(texto, voice_id)
+        else:
+            partes = voice_service.partes_mp3(texto, voice_id)
+    except Exception as e:
+        print(f"❌ Error en Polly TTS: {e}")
+        return JsonResponse({'success': False, 'error': 'No se pudo generar el audio.'}, status=502)
+    return respuesta_mp3_partes(request, partes, clave)
+
+
 def obtener_voces(request):
     """Obtener voces disponibles de Amazon Polly"""
     try:
@@ -5,8 +5,9 @@ from django.contrib import messages
 from django.utils import timezone
 from .models import (
     PerfilUsuario, Cafeteria, TipoCafe, CafeteriaTipoCafe,
-    Recorrido, RecorridoCafeteria, RecorridoUsuario, 
-    Comentario, MeGusta, HorarioCafeteria, DuenoCafeteria
+    Recorrido, RecorridoCafeteria, RecorridoDestacadoSemanal, RecorridoUsuario,
+    Comentario, MeGusta, HorarioCafeteria, DuenoCafeteria,
+    EstadisticaDiaria, EstadisticaGeneralDiaria
 )
 
 
@@ -62,6 +63,12 @@ class RecorridoAdmin(admin.ModelAdmin):
     inlines = [RecorridoCafeteriaInline]
 
 
+@admin.register(RecorridoDestacadoSemanal)
+class RecorridoDestacadoSemanalAdmin(admin.ModelAdmin):
+    list_display = ['anio', 'semana', 'posicion', 'recorrido', 'fecha_creacion']
+    list_filter = ['anio', 'semana']
+
+
 @admin.register(RecorridoUsuario)
 class RecorridoUsuarioAdmin(admin.ModelAdmin):
     list_display = ['usuario', 'recorrido', 'estado', 'fecha_inicio', 'fecha_completado']
@@ -83,6 +90,18 @@ class MeGustaAdmin(admin.ModelAdmin):
     search_fields = ['usuario__username', 'cafeteria__nombre']
 
 
+@admin.register(EstadisticaDiaria)
+class EstadisticaDiariaAdmin(admin.ModelAdmin):
+    list_display = ['cafeteria', 'fecha', 'me_gusta', 'comentarios', 'recorridos_iniciados', 'recorridos_completados']
+    list_filter = ['fecha']
+    search_fields = ['cafeteria__nombre']
+
+
+@admin.register(EstadisticaGeneralDiaria)
+class EstadisticaGeneralDiariaAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'me_gusta', 'comentarios', 'recorridos_iniciados', 'recorridos_completados']
+
+
 @admin.register(DuenoCafeteria)
 class DuenoCafeteriaAdmin(admin.ModelAdmin):
     list_display = ['user', 'nombre_cafeteria', 'estado', 'fecha_solicitud', 'aprobado_por', 'acciones']
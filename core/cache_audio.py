@@ -0,0 +1,156 @@
+"""
+Caché en disco del audio generado con Amazon Polly.
+
+Cada clip se guarda como MP3 con el nombre sha256(voz + motor + texto
+normalizado), repartido en subdirectorios por los primeros caracteres del
+hash (ab/cd/abcd....mp3) para que ninguno crezca demasiado. El mismo texto
+con la misma voz se lee del disco sin volver a llamar a Polly.
+
+Cada proceso lleva un índice en memoria (hash -> bytes) en orden de uso.
+Cuando el total pasa de TTS_CACHE_MAX_MB se borran los menos usados. Al
+usar un archivo se actualiza su fecha de modificación, así el orden
+sobrevive a un reinicio (el índice se arma leyendo el directorio). Varios
+procesos pueden compartir el directorio: si otro borró un archivo se trata
+como un fallo y si otro lo escribió se adopta.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+
+EXTENSION = '.mp3'
+
+
+def normalizar_texto(texto):
+    """Espacios repetidos y saltos de línea no cambian el audio"""
+    return ' '.join(texto.split())
+
+
+def clave_audio(texto, voice_id, engine):
+    return hashlib.sha256(f'{voice_id}\0{engine}\0{normalizar_texto(texto)}'.encode('utf-8')).hexdigest()
+
+
+class CacheAudio:
+    def __init__(self, directorio, max_bytes):
+        self.directorio = Path(directorio)
+        self.max_bytes = max_bytes
+        self._indice = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _ruta(self, clave):
+        return self.directorio / clave[:2] / clave[2:4] / f'{clave}{EXTENSION}'
+
+    def _cargar_indice(self):
+        archivos = []
+        if self.directorio.is_dir():
+            for ruta in self.directorio.glob(f'*/*/*{EXTENSION}'):
+                try:
+                    estado = ruta.stat()
+                except FileNotFoundError:
+                    continue
+                archivos.append((estado.st_mtime, ruta.stem, estado.st_size))
+        archivos.sort()
+        self._indice = OrderedDict((clave, tamano) for _, clave, tamano in archivos)
+        self._total = sum(self._indice.values())
+
+    def _indice_cargado(self):
+        if self._indice is None:
+            self._cargar_indice()
+        return self._indice
+
+    def ruta(self, clave):
+        """Ruta del MP3 guardado para `clave`, o None; lo marca como recién usado"""
+        ruta = self._ruta(clave)
+        with self._lock:
+            indice = self._indice_cargado()
+            try:
+                os.utime(ruta)
+                tamano = indice.get(clave) or ruta.stat().st_size
+            except FileNotFoundError:
+                if clave in indice:
+                    self._total -= indice.pop(clave)
+                return None
+            if clave not in indice:
+                self._total += tamano
+            indice[clave] = tamano
+            indice.move_to_end(clave)
+        return ruta
+
+    def leer(self, clave):
+        ruta = self.ruta(clave)
+        if ruta is None:
+            return None
+        try:
+            return ruta.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def guardar(self, clave, datos):
+        """Escribe el MP3 de forma atómica y borra los menos usados si hace falta"""
+        for _ in self.guardar_partes(clave, [datos]):
+            pass
+        return self._ruta(clave)
+
+    def guardar_partes(self, clave, partes):
+        """
+        Entrega las partes del MP3 a medida que llegan mientras las escribe en
+        un temporal, que pasa al caché cuando se leyeron todas. Si quien
+        consume las partes se detiene antes, el resto se lee igual para no
+        tener que generarlo otra vez.
+        """
+        ruta = self._ruta(clave)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as archivo:
+                partes = iter(partes)
+                for parte in partes:
+                    archivo.write(parte)
+                    try:
+                        yield parte
+                    except GeneratorExit:
+                        for resto in partes:
+                            archivo.write(resto)
+                        break
+            os.replace(temporal, ruta)
+        except BaseException:
+            os.unlink(temporal)
+            raise
+        self._registrar(clave, ruta.stat().st_size)
+
+    def _registrar(self, clave, tamano):
+        with self._lock:
+            indice = self._indice_cargado()
+            self._total += tamano - indice.get(clave, 0)
+            indice[clave] = tamano
+            indice.move_to_end(clave)
+            while self._total > self.max_bytes and len(indice) > 1:
+                viejo, tamano = indice.popitem(last=False)
+                self._total -= tamano
+                try:
+                    self._ruta(viejo).unlink()
+                except FileNotFoundError:
+                    pass
+
+    def estadisticas(self):
+        with self._lock:
+            indice = self._indice_cargado()
+            return {'archivos': len(indice), 'bytes': self._total, 'max_bytes': self.max_bytes}
+
+
+_cache_audio = None
+_cache_audio_lock = threading.Lock()
+
+
+def obtener_cache_audio():
+    global _cache_audio
+    with _cache_audio_lock:
+        if _cache_audio is None:
+            _cache_audio = CacheAudio(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_MB * 1024 * 1024)
+        return _cache_audio
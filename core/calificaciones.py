@@ -0,0 +1,104 @@
+"""
+Agregados de calificaciones de cada cafetería.
+
+Al crear o borrar un comentario se actualizan en una sola sentencia UPDATE
+con expresiones F() el total, la suma, el promedio y el histograma por
+estrellas, sin recorrer los comentarios existentes. `reconciliar_calificaciones`
+vuelve a calcularlos desde los comentarios para corregir diferencias.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Count, DecimalField, F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
+
+
+ESTRELLAS = range(1, 6)
+
+
+def campo_estrellas(calificacion):
+    return f'calificaciones_{calificacion}'
+
+
+def _promedio(suma, total):
+    return (Decimal(suma) / total).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _expresion_promedio(suma, total):
+    return Coalesce(
+        Round(Cast(suma, FloatField()) / NullIf(total, 0), 2),
+        Value(0.0),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def registrar_calificacion(cafeteria_id, calificacion, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) una calificación a los agregados de la
+    cafetería con una sola actualización atómica.
+    """
+    from .models import Cafeteria
+
+    if calificacion not in ESTRELLAS:
+        return 0
+    campo = campo_estrellas(calificacion)
+    total = F('total_calificaciones') + signo
+    suma = F('suma_calificaciones') + signo * calificacion
+    estrella = F(campo) + signo
+    if signo < 0:
+        # Nunca por debajo de cero aunque los contadores se hayan desfasado
+        total, suma, estrella = Greatest(total, 0), Greatest(suma, 0), Greatest(estrella, 0)
+    return Cafeteria.objects.filter(pk=cafeteria_id).update(
+        total_calificaciones=total,
+        suma_calificaciones=suma,
+        calificacion_promedio=_expresion_promedio(suma, total),
+        **{campo: estrella},
+    )
+
+
+def reconciliar_calificaciones(cafeteria_ids=None):
+    """
+    Recalcula los agregados desde los comentarios y guarda solo las
+    cafeterías con diferencias. Si una cafetería no tiene comentarios y
+    sus contadores están en cero se respeta su calificación promedio.
+    Retorna la cantidad de cafeterías corregidas.
+    """
+    from .models import Cafeteria, Comentario
+
+    cafeterias = Cafeteria.objects.all()
+    comentarios = Comentario.objects.all()
+    if cafeteria_ids is not None:
+        cafeterias = cafeterias.filter(id__in=cafeteria_ids)
+        comentarios = comentarios.filter(cafeteria_id__in=cafeteria_ids)
+
+    histogramas = {}
+    for cafeteria_id, calificacion, cantidad in (
+        comentarios.values_list('cafeteria_id', 'calificacion')
+        .annotate(cantidad=Count('id')).order_by()
+    ):
+        if calificacion in ESTRELLAS:
+            histogramas.setdefault(cafeteria_id, dict.fromkeys(ESTRELLAS, 0))[calificacion] = cantidad
+
+    campos = ['total_calificaciones', 'suma_calificaciones', 'calificacion_promedio']
+    campos += [campo_estrellas(e) for e in ESTRELLAS]
+    corregidas = []
+    for cafeteria in cafeterias.only('id', *campos):
+        histograma = histogramas.get(cafeteria.id, dict.fromkeys(ESTRELLAS, 0))
+        total = sum(histograma.values())
+        suma = sum(e * n for e, n in histograma.items())
+        if (
+            cafeteria.histograma_calificaciones == histograma
+            and cafeteria.total_calificaciones == total
+            and cafeteria.suma_calificaciones == suma
+            and (total == 0 or cafeteria.calificacion_promedio == _promedio(suma, total))
+        ):
+            continue
+        for e, n in histograma.items():
+            setattr(cafeteria, campo_estrellas(e), n)
+        cafeteria.total_calificaciones = total
+        cafeteria.suma_calificaciones = suma
+        if total:
+            cafeteria.calificacion_promedio = _promedio(suma, total)
+        corregidas.append(cafeteria)
+
+    Cafeteria.objects.bulk_update(corregidas, campos, batch_size=500)
+    return len(corregidas)
@@ -0,0 +1,96 @@
+"""
+Recorridos destacados de la semana para la página principal.
+
+La selección se hace una sola vez por semana ISO (con el comando
+`seleccionar_recorridos_destacados` o en el primer pedido de la semana), se
+guarda en RecorridoDestacadoSemanal y los ids quedan en caché. Si no hay
+recorridos activos, la lista vacía también queda en caché, por menos tiempo,
+para no volver a buscar en cada pedido.
+"""
+import random
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+
+CANTIDAD_DESTACADOS = 2
+
+CACHE_DESTACADOS = 'recorridos:destacados:{anio}-{semana}'
+TIMEOUT_DESTACADOS = 7 * 24 * 60 * 60
+# Sin recorridos activos se vuelve a intentar pasado este tiempo
+TIMEOUT_SIN_DESTACADOS = 5 * 60
+
+
+def semana_iso(fecha=None):
+    """(año, semana) ISO de la fecha dada o de hoy"""
+    anio, semana, _ = (fecha or timezone.localdate()).isocalendar()
+    return anio, semana
+
+
+def seleccionar_destacados(anio, semana, reemplazar=False):
+    """
+    Elige y guarda los recorridos destacados de la semana. Usa un generador
+    propio con semilla por semana, así la elección es reproducible y no
+    toca el estado global de `random`. Retorna la lista de ids.
+    """
+    from .models import Recorrido, RecorridoDestacadoSemanal
+
+    ids = sorted(Recorrido.objects.filter(activo=True).values_list('id', flat=True))
+    generador = random.Random(anio * 100 + semana)
+    elegidos = generador.sample(ids, min(CANTIDAD_DESTACADOS, len(ids)))
+
+    try:
+        with transaction.atomic():
+            existentes = RecorridoDestacadoSemanal.objects.filter(anio=anio, semana=semana)
+            if reemplazar:
+                existentes.delete()
+            anteriores = list(existentes.values_list('recorrido_id', flat=True))
+            if anteriores:
+                elegidos = anteriores
+            else:
+                RecorridoDestacadoSemanal.objects.bulk_create([
+                    RecorridoDestacadoSemanal(anio=anio, semana=semana, posicion=posicion, recorrido_id=recorrido_id)
+                    for posicion, recorrido_id in enumerate(elegidos, 1)
+                ])
+    except IntegrityError:
+        # Otro proceso guardó la selección al mismo tiempo
+        elegidos = list(
+            RecorridoDestacadoSemanal.objects.filter(anio=anio, semana=semana)
+            .values_list('recorrido_id', flat=True)
+        )
+
+    cache.set(
+        CACHE_DESTACADOS.format(anio=anio, semana=semana), elegidos,
+        TIMEOUT_DESTACADOS if elegidos else TIMEOUT_SIN_DESTACADOS,
+    )
+    return elegidos
+
+
+def ids_destacados(anio=None, semana=None):
+    """Ids de los recorridos destacados de la semana (la actual por defecto)"""
+    from .models import RecorridoDestacadoSemanal
+
+    if anio is None or semana is None:
+        anio, semana = semana_iso()
+    clave = CACHE_DESTACADOS.format(anio=anio, semana=semana)
+    ids = cache.get(clave)
+    if ids is None:
+        ids = list(
+            RecorridoDestacadoSemanal.objects.filter(anio=anio, semana=semana)
+            .values_list('recorrido_id', flat=True)
+        )
+        if ids:
+            cache.set(clave, ids, TIMEOUT_DESTACADOS)
+        else:
+            ids = seleccionar_destacados(anio, semana)
+    return ids
+
+
+def recorridos_destacados():
+    """Recorridos destacados de esta semana que siguen activos, en su orden"""
+    from .models import Recorrido
+
+    ids = ids_destacados()
+    recorridos = Recorrido.objects.in_bulk(ids)
+    return [recorridos[i] for i in ids if i in recorridos and recorridos[i].activo]
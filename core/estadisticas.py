@@ -0,0 +1,154 @@
+"""
+Estadísticas diarias precalculadas.
+
+Las señales suman cada me gusta, comentario y recorrido a la fila del día de
+cada cafetería involucrada (EstadisticaDiaria) y a la del total de la
+plataforma (EstadisticaGeneralDiaria). Los me gusta y comentarios cuentan en
+el día en que se crearon y los recorridos en el día en que se iniciaron y se
+completaron, también al borrarlos; con ME_GUSTA_DIFERIDO los me gusta se
+suman en lote al volcar el contador (ver me_gusta.py). Las páginas de
+estadísticas solo leen esas filas. `python manage.py calcular_estadisticas`
+las reconstruye desde los datos originales.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+CAMPOS = ('me_gusta', 'comentarios', 'suma_calificaciones', 'recorridos_iniciados', 'recorridos_completados')
+
+# Días que se muestran en los gráficos de tendencia
+DIAS_SERIE = 30
+
+
+def _sumar(modelo, filtro, deltas):
+    cambios = {campo: F(campo) + valor for campo, valor in deltas.items()}
+    if modelo.objects.filter(**filtro).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**filtro, **deltas)
+    except IntegrityError:
+        # Otro proceso creó la fila del día al mismo tiempo
+        modelo.objects.filter(**filtro).update(**cambios)
+
+
+def registrar_actividad(cafeteria_ids, fecha=None, **deltas):
+    """
+    Suma `deltas` (por ejemplo me_gusta=1) a las filas del día de cada
+    cafetería y a la fila general, creándolas si no existen.
+    """
+    from .models import EstadisticaDiaria, EstadisticaGeneralDiaria
+
+    deltas = {campo: valor for campo, valor in deltas.items() if valor}
+    if not deltas:
+        return
+    fecha = fecha or timezone.localdate()
+    for cafeteria_id in cafeteria_ids:
+        _sumar(EstadisticaDiaria, {'cafeteria_id': cafeteria_id, 'fecha': fecha}, deltas)
+    _sumar(EstadisticaGeneralDiaria, {'fecha': fecha}, deltas)
+
+
+def registrar_actividad_por_cafeteria(fecha, campo, deltas):
+    """
+    Suma a `campo` de la fila del día de cada cafetería su valor en `deltas`
+    ({cafeteria_id: delta}) y el total a la fila general.
+    """
+    from .models import EstadisticaDiaria, EstadisticaGeneralDiaria
+
+    deltas = {cafeteria_id: delta for cafeteria_id, delta in deltas.items() if delta}
+    for cafeteria_id, delta in deltas.items():
+        _sumar(EstadisticaDiaria, {'cafeteria_id': cafeteria_id, 'fecha': fecha}, {campo: delta})
+    total = sum(deltas.values())
+    if total:
+        _sumar(EstadisticaGeneralDiaria, {'fecha': fecha}, {campo: total})
+
+
+def _filas(cafeteria_id=None):
+    from .models import EstadisticaDiaria, EstadisticaGeneralDiaria
+
+    if cafeteria_id is None:
+        return EstadisticaGeneralDiaria.objects.all()
+    return EstadisticaDiaria.objects.filter(cafeteria_id=cafeteria_id)
+
+
+def totales_actividad(cafeteria_id=None):
+    """Totales históricos de la plataforma o de una cafetería"""
+    return _filas(cafeteria_id).aggregate(**{campo: Coalesce(Sum(campo), 0) for campo in CAMPOS})
+
+
+def serie_actividad(cafeteria_id=None, dias=DIAS_SERIE):
+    """Valores día por día de los últimos `dias` días (incluido hoy), con ceros donde no hubo actividad"""
+    hoy = timezone.localdate()
+    desde = hoy - timedelta(days=dias - 1)
+    filas = {fila['fecha']: fila for fila in _filas(cafeteria_id).filter(fecha__gte=desde).values('fecha', *CAMPOS)}
+    fechas = [desde + timedelta(days=i) for i in range(dias)]
+    resultado = {'fechas': [fecha.strftime('%d/%m') for fecha in fechas]}
+    for campo in CAMPOS:
+        resultado[campo] = [filas.get(fecha, {}).get(campo, 0) for fecha in fechas]
+    return resultado
+
+
+def reconstruir_estadisticas(apps=django_apps):
+    """
+    Borra y vuelve a calcular todas las filas diarias a partir de los me
+    gusta, comentarios y recorridos existentes. Retorna la cantidad de
+    filas por cafetería creadas. Las migraciones pasan su registro `apps`
+    para usar los modelos históricos.
+    """
+    Comentario, EstadisticaDiaria, EstadisticaGeneralDiaria, MeGusta, RecorridoUsuario = (
+        apps.get_model('core', nombre) for nombre in (
+            'Comentario', 'EstadisticaDiaria', 'EstadisticaGeneralDiaria', 'MeGusta', 'RecorridoUsuario'
+        )
+    )
+
+    por_cafeteria = defaultdict(Counter)
+    general = defaultdict(Counter)
+
+    for fila in (
+        MeGusta.objects.annotate(fecha=TruncDate('fecha_creacion'))
+        .values('cafeteria_id', 'fecha').annotate(total=Count('id')).order_by()
+    ):
+        por_cafeteria[(fila['cafeteria_id'], fila['fecha'])]['me_gusta'] += fila['total']
+
+    for fila in (
+        Comentario.objects.annotate(fecha=TruncDate('fecha_creacion'))
+        .values('cafeteria_id', 'fecha')
+        .annotate(total=Count('id'), suma=Sum('calificacion')).order_by()
+    ):
+        contador = por_cafeteria[(fila['cafeteria_id'], fila['fecha'])]
+        contador['comentarios'] += fila['total']
+        contador['suma_calificaciones'] += fila['suma']
+
+    for (_, fecha), contador in por_cafeteria.items():
+        general[fecha].update(contador)
+
+    iniciados = RecorridoUsuario.objects.annotate(fecha=TruncDate('fecha_inicio'))
+    completados = RecorridoUsuario.objects.filter(estado='C').annotate(
+        fecha=TruncDate(Coalesce('fecha_completado', 'fecha_inicio'))
+    )
+    for campo, recorridos in (('recorridos_iniciados', iniciados), ('recorridos_completados', completados)):
+        for fila in recorridos.values('fecha').annotate(total=Count('id')).order_by():
+            general[fila['fecha']][campo] += fila['total']
+        for fila in (
+            recorridos.filter(recorrido__cafeterias__isnull=False)
+            .values('recorrido__cafeterias', 'fecha').annotate(total=Count('id')).order_by()
+        ):
+            por_cafeteria[(fila['recorrido__cafeterias'], fila['fecha'])][campo] += fila['total']
+
+    with transaction.atomic():
+        EstadisticaDiaria.objects.all().delete()
+        EstadisticaGeneralDiaria.objects.all().delete()
+        EstadisticaDiaria.objects.bulk_create([
+            EstadisticaDiaria(cafeteria_id=cafeteria_id, fecha=fecha, **contador)
+            for (cafeteria_id, fecha), contador in por_cafeteria.items()
+        ], batch_size=500)
+        EstadisticaGeneralDiaria.objects.bulk_create([
+            EstadisticaGeneralDiaria(fecha=fecha, **contador) for fecha, contador in general.items()
+        ], batch_size=500)
+    return len(por_cafeteria)
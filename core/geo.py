@@ -0,0 +1,362 @@
+"""
+Utilidades geográficas: distancias Haversine (escalares y vectorizadas con
+NumPy), índice espacial y arreglo de coordenadas de cafeterías
+"""
+import math
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+
+
+RADIO_TIERRA_KM = 6371.0
+
+# Tamaño de celda del índice en grados (~1.1 km de latitud)
+TAMANO_CELDA_GRADOS = 0.01
+
+CACHE_VERSION_INDICE = 'geo:indice:version'
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Calcula distancia Haversine en kilómetros entre dos coordenadas."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return RADIO_TIERRA_KM * c
+
+
+def haversine_uno_a_muchos(lat, lng, lats, lngs):
+    """Distancias (km) desde un punto a un arreglo de puntos en una sola llamada"""
+    phi1 = math.radians(lat)
+    lambda1 = math.radians(lng)
+    phi2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lambda2 = np.radians(np.asarray(lngs, dtype=np.float64))
+    a = np.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_muchos_a_muchos(lats1, lngs1, lats2=None, lngs2=None):
+    """
+    Matriz de distancias (km) de forma (len(lats1), len(lats2)).
+    Si no se pasa el segundo conjunto se calcula la matriz del primero contra sí mismo.
+    """
+    phi1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lambda1 = np.radians(np.asarray(lngs1, dtype=np.float64))[:, None]
+    if lats2 is None:
+        phi2, lambda2 = phi1.T, lambda1.T
+    else:
+        phi2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+        lambda2 = np.radians(np.asarray(lngs2, dtype=np.float64))[None, :]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lambda2 - lambda1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def top_k(distancias, k):
+    """
+    Índices de las k distancias menores, ordenados de menor a mayor.
+    Usa argpartition para no ordenar el arreglo completo.
+    """
+    distancias = np.asarray(distancias)
+    n = distancias.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        candidatos = np.argpartition(distancias, k - 1)[:k]
+    else:
+        candidatos = np.arange(n)
+    return candidatos[np.argsort(distancias[candidatos], kind='stable')]
+
+
+class CoordenadasCafeterias:
+    """
+    Coordenadas de todas las cafeterías en arreglos float64 contiguos, para
+    calcular distancias uno-a-muchos y muchos-a-muchos sin recorrer objetos.
+    """
+
+    def __init__(self, ids, lats, lngs):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.lats = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lngs = np.ascontiguousarray(lngs, dtype=np.float64)
+        self.posiciones = {int(cafe_id): i for i, cafe_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __contains__(self, cafe_id):
+        return cafe_id in self.posiciones
+
+    def indices_de(self, ids):
+        """Posiciones en los arreglos de los ids dados (se ignoran los desconocidos)"""
+        return np.array([self.posiciones[i] for i in ids if i in self.posiciones], dtype=np.intp)
+
+    def coordenadas_de(self, cafe_id):
+        i = self.posiciones[cafe_id]
+        return float(self.lats[i]), float(self.lngs[i])
+
+    def distancias_desde(self, lat, lng, indices=None):
+        """Distancias desde (lat, lng) a todas las cafeterías o a las posiciones dadas"""
+        if indices is None:
+            return haversine_uno_a_muchos(lat, lng, self.lats, self.lngs)
+        return haversine_uno_a_muchos(lat, lng, self.lats[indices], self.lngs[indices])
+
+    def matriz(self, indices=None):
+        """Matriz de distancias entre todas las cafeterías o entre las posiciones dadas"""
+        if indices is None:
+            return haversine_muchos_a_muchos(self.lats, self.lngs)
+        return haversine_muchos_a_muchos(self.lats[indices], self.lngs[indices])
+
+
+class IndiceEspacial:
+    """
+    Índice de rejilla lat/lng en memoria.
+    Cada punto se guarda en la celda que le corresponde y las búsquedas
+    recorren anillos de celdas alrededor del origen, deteniéndose cuando
+    ningún punto fuera del anillo puede estar más cerca que los ya encontrados.
+    """
+
+    def __init__(self, tamano_celda=TAMANO_CELDA_GRADOS):
+        self.tamano_celda = tamano_celda
+        self.celdas = {}
+        self.puntos = {}
+        # Límites (fila_min, fila_max, col_min, col_max) de las celdas usadas;
+        # no se reducen al eliminar, solo sirven como cota del recorrido
+        self.limites = None
+
+    def __len__(self):
+        return len(self.puntos)
+
+    def _celda(self, lat, lng):
+        return (math.floor(lat / self.tamano_celda), math.floor(lng / self.tamano_celda))
+
+    def agregar(self, punto_id, lat, lng):
+        """Agrega o mueve un punto en el índice"""
+        self.eliminar(punto_id)
+        celda = self._celda(lat, lng)
+        self.celdas.setdefault(celda, {})[punto_id] = (lat, lng)
+        self.puntos[punto_id] = celda
+        fila, col = celda
+        if self.limites is None:
+            self.limites = (fila, fila, col, col)
+        else:
+            fmin, fmax, cmin, cmax = self.limites
+            self.limites = (min(fmin, fila), max(fmax, fila), min(cmin, col), max(cmax, col))
+
+    def eliminar(self, punto_id):
+        """Quita un punto del índice si existe"""
+        celda = self.puntos.pop(punto_id, None)
+        if celda is None:
+            return
+        bucket = self.celdas.get(celda)
+        if bucket is not None:
+            bucket.pop(punto_id, None)
+            if not bucket:
+                del self.celdas[celda]
+
+    def _distancia_minima_anillo(self, lat, anillo):
+        """
+        Cota inferior (km) de la distancia a cualquier punto situado en un
+        anillo de celdas mayor que `anillo`.
+        """
+        if anillo <= 0:
+            return 0.0
+        delta = math.radians(anillo * self.tamano_celda)
+        cota_lat = RADIO_TIERRA_KM * delta
+        lat_extrema = min(90.0, abs(lat) + (anillo + 1) * self.tamano_celda)
+        cos_min = math.cos(math.radians(lat_extrema))
+        cota_lng = 2 * RADIO_TIERRA_KM * math.asin(min(1.0, cos_min * math.sin(delta / 2)))
+        return min(cota_lat, cota_lng)
+
+    def _anillo_minimo(self, celda_origen):
+        """Primer anillo que puede contener celdas ocupadas"""
+        if self.limites is None:
+            return 0
+        fila, col = celda_origen
+        fmin, fmax, cmin, cmax = self.limites
+        return max(0, fmin - fila, fila - fmax, cmin - col, col - cmax)
+
+    def _anillo_maximo(self, celda_origen):
+        """Anillo a partir del cual ya se cubrieron todas las celdas ocupadas"""
+        if self.limites is None:
+            return 0
+        fila, col = celda_origen
+        fmin, fmax, cmin, cmax = self.limites
+        return max(abs(fmin - fila), abs(fmax - fila), abs(cmin - col), abs(cmax - col))
+
+    def _celdas_anillo(self, centro, anillo):
+        fila, col = centro
+        if anillo == 0:
+            yield centro
+            return
+        for c in range(col - anillo, col + anillo + 1):
+            yield (fila - anillo, c)
+            yield (fila + anillo, c)
+        for f in range(fila - anillo + 1, fila + anillo):
+            yield (f, col - anillo)
+            yield (f, col + anillo)
+
+    def k_cercanos(self, lat, lng, k=4, radio_km=None, filtro=None):
+        """
+        Retorna una lista de (distancia_km, punto_id) con los k puntos más
+        cercanos, ordenada por distancia. `filtro` es un conjunto opcional de
+        ids permitidos.
+        """
+        if k <= 0 or not self.puntos:
+            return []
+
+        centro = self._celda(lat, lng)
+        anillo = self._anillo_minimo(centro)
+        anillo_maximo = self._anillo_maximo(centro)
+        # Mejores k hasta el momento, siempre ordenados por distancia
+        mejores_ids = []
+        mejores_d = np.empty(0, dtype=np.float64)
+
+        def evaluar(buckets):
+            nonlocal mejores_ids, mejores_d
+            ids, lats, lngs = [], [], []
+            for bucket in buckets:
+                for punto_id, (plat, plng) in bucket.items():
+                    if filtro is not None and punto_id not in filtro:
+                        continue
+                    ids.append(punto_id)
+                    lats.append(plat)
+                    lngs.append(plng)
+            if not ids:
+                return
+            d = haversine_uno_a_muchos(lat, lng, lats, lngs)
+            if radio_km is not None:
+                dentro = d <= radio_km
+                d = d[dentro]
+                ids = [punto_id for punto_id, ok in zip(ids, dentro) if ok]
+            todos_ids = mejores_ids + ids
+            todos_d = np.concatenate([mejores_d, d])
+            orden = top_k(todos_d, k)
+            mejores_ids = [todos_ids[i] for i in orden]
+            mejores_d = todos_d[orden]
+
+        while anillo <= anillo_maximo:
+            if 8 * anillo > len(self.celdas):
+                # El anillo tiene más celdas que celdas ocupadas: es más barato
+                # revisar directamente las celdas ocupadas que faltan
+                fila, col = centro
+                evaluar(
+                    bucket for (f, c), bucket in self.celdas.items()
+                    if max(abs(f - fila), abs(c - col)) >= anillo
+                )
+                break
+
+            evaluar(
+                self.celdas[celda] for celda in self._celdas_anillo(centro, anillo)
+                if celda in self.celdas
+            )
+
+            cota = self._distancia_minima_anillo(lat, anillo)
+            if radio_km is not None and cota > radio_km:
+                break
+            if len(mejores_ids) == k and cota >= mejores_d[-1]:
+                break
+            anillo += 1
+
+        return [(float(d), punto_id) for d, punto_id in zip(mejores_d, mejores_ids)]
+
+
+_indice = None
+_indice_version = None
+_indice_lock = threading.Lock()
+
+_coordenadas = None
+_coordenadas_version = None
+_coordenadas_lock = threading.Lock()
+
+
+def _construir_indice():
+    from .models import Cafeteria
+
+    indice = IndiceEspacial()
+    for cafe_id, lat, lng in Cafeteria.objects.values_list('id', 'latitud', 'longitud'):
+        if lat is None or lng is None:
+            continue
+        indice.agregar(cafe_id, float(lat), float(lng))
+    return indice
+
+
+def obtener_indice():
+    """
+    Retorna el índice espacial del proceso, reconstruyéndolo si otro proceso
+    invalidó la versión compartida en caché.
+    """
+    global _indice, _indice_version
+    version = cache.get(CACHE_VERSION_INDICE, 0)
+    with _indice_lock:
+        if _indice is None or _indice_version != version:
+            _indice = _construir_indice()
+            _indice_version = version
+        return _indice
+
+
+def obtener_coordenadas():
+    """
+    Retorna el arreglo de coordenadas del proceso. Comparte la versión del
+    índice espacial, así que cualquier cambio en el catálogo lo reconstruye.
+    """
+    global _coordenadas, _coordenadas_version
+    from .models import Cafeteria
+
+    version = cache.get(CACHE_VERSION_INDICE, 0)
+    with _coordenadas_lock:
+        if _coordenadas is None or _coordenadas_version != version:
+            filas = [
+                (cafe_id, float(lat), float(lng))
+                for cafe_id, lat, lng in Cafeteria.objects.values_list('id', 'latitud', 'longitud')
+                if lat is not None and lng is not None
+            ]
+            ids, lats, lngs = zip(*filas) if filas else ((), (), ())
+            _coordenadas = CoordenadasCafeterias(ids, lats, lngs)
+            _coordenadas_version = version
+        return _coordenadas
+
+
+def actualizar_cafeteria_en_indice(cafeteria):
+    """Actualiza solo el punto de una cafetería (llamado al guardar)"""
+    if cafeteria.latitud is None or cafeteria.longitud is None:
+        _aplicar_cambio(lambda indice: indice.eliminar(cafeteria.pk))
+    else:
+        lat, lng = float(cafeteria.latitud), float(cafeteria.longitud)
+        _aplicar_cambio(lambda indice: indice.agregar(cafeteria.pk, lat, lng))
+
+
+def eliminar_cafeteria_de_indice(cafeteria_id):
+    """Quita una cafetería del índice (llamado al eliminar)"""
+    _aplicar_cambio(lambda indice: indice.eliminar(cafeteria_id))
+
+
+def _aplicar_cambio(cambio):
+    """
+    Incrementa la versión compartida y aplica el cambio al índice local.
+    Si otro proceso modificó el catálogo en el intermedio, el índice se
+    descarta y se reconstruye en la siguiente consulta.
+    """
+    global _indice, _indice_version
+    nueva_version = _incrementar_version()
+    with _indice_lock:
+        if _indice is None:
+            return
+        if _indice_version is not None and nueva_version == _indice_version + 1:
+            cambio(_indice)
+            _indice_version = nueva_version
+        else:
+            _indice = None
+
+
+def _incrementar_version():
+    try:
+        return cache.incr(CACHE_VERSION_INDICE)
+    except ValueError:
+        # Caché nueva o vaciada: si se empezara de nuevo en 1 un proceso podría
+        # ver la misma versión que ya tenía con otro catálogo
+        version = time.time_ns() // 1000
+        cache.set(CACHE_VERSION_INDICE, version, None)
+        return version
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.estadisticas import reconstruir_estadisticas
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye las estadísticas diarias desde los me gusta, comentarios y recorridos existentes'
+
+    def handle(self, *args, **options):
+        filas = reconstruir_estadisticas()
+        self.stdout.write(self.style.SUCCESS(f'✅ Estadísticas recalculadas: {filas} filas diarias por cafetería'))
@@ -0,0 +1,54 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.matriz_distancias import construir_matriz, obtener_matriz
+from core.models import Recorrido, RecorridoCafeteria
+
+
+class Command(BaseCommand):
+    help = 'Calcula la matriz de distancias y tiempos a pie entre todas las cafeterías'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--capacidad', type=int, default=None,
+            help='Número de slots a reservar (por defecto cafeterías actuales + margen)'
+        )
+        parser.add_argument(
+            '--recorridos', action='store_true',
+            help='Recalcular también distancia_total y duracion_estimada de los recorridos'
+        )
+
+    def handle(self, *args, **options):
+        n, capacidad = construir_matriz(options['capacidad'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Matriz calculada: {n} cafeterías, capacidad {capacidad} '
+            f'({settings.MATRIZ_DISTANCIAS_DIR})'
+        ))
+
+        if options['recorridos']:
+            actualizados = self.actualizar_recorridos()
+            self.stdout.write(self.style.SUCCESS(f'✅ {actualizados} recorridos actualizados'))
+
+    def actualizar_recorridos(self):
+        matriz = obtener_matriz()
+        paradas = defaultdict(list)
+        for recorrido_id, cafeteria_id in (
+            RecorridoCafeteria.objects.order_by('recorrido_id', 'orden')
+            .values_list('recorrido_id', 'cafeteria_id')
+        ):
+            paradas[recorrido_id].append(cafeteria_id)
+
+        recorridos = []
+        for recorrido in Recorrido.objects.filter(id__in=paradas.keys()):
+            ids = paradas[recorrido.id]
+            tramos = [(a, b) for a, b in zip(ids, ids[1:])]
+            distancia = sum(matriz.distancia(a, b) or 0.0 for a, b in tramos)
+            caminata = sum(matriz.duracion(a, b) or 0.0 for a, b in tramos)
+            recorrido.distancia_total = round(distancia, 2)
+            recorrido.duracion_estimada = int(round(caminata + len(ids) * settings.ESTANCIA_CAFETERIA_MIN))
+            recorridos.append(recorrido)
+
+        Recorrido.objects.bulk_update(recorridos, ['distancia_total', 'duracion_estimada'])
+        return len(recorridos)
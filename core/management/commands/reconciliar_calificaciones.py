@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.calificaciones import reconciliar_calificaciones
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde los comentarios el promedio, la suma y el histograma de calificaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'cafeterias', nargs='*', type=int,
+            help='Ids de cafeterías a revisar (por defecto todas)'
+        )
+
+    def handle(self, *args, **options):
+        corregidas = reconciliar_calificaciones(options['cafeterias'] or None)
+        if corregidas:
+            self.stdout.write(self.style.WARNING(f'⚠️ {corregidas} cafeterías tenían diferencias y fueron corregidas'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Todos los agregados de calificación están al día'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.destacados import seleccionar_destacados, semana_iso
+
+
+class Command(BaseCommand):
+    help = 'Selecciona los recorridos destacados de la semana ISO para la página principal'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--semana', default=None,
+            help='Semana ISO en formato AAAA-SS (por defecto la semana actual)'
+        )
+        parser.add_argument(
+            '--reemplazar', action='store_true',
+            help='Volver a elegir aunque la semana ya tenga selección'
+        )
+
+    def handle(self, *args, **options):
+        if options['semana']:
+            try:
+                anio, semana = (int(v) for v in options['semana'].split('-'))
+            except ValueError:
+                raise CommandError('La semana debe tener el formato AAAA-SS')
+        else:
+            anio, semana = semana_iso()
+
+        ids = seleccionar_destacados(anio, semana, reemplazar=options['reemplazar'])
+        if not ids:
+            self.stdout.write(self.style.WARNING(f'⚠️ No hay recorridos activos para {anio}-S{semana:02d}'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Recorridos destacados {anio}-S{semana:02d}: {", ".join(str(i) for i in ids)}'
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.me_gusta import volcar_me_gusta
+
+
+class Command(BaseCommand):
+    help = 'Escribe en la base de datos los me gusta acumulados en la caché (ME_GUSTA_DIFERIDO)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--continuo', action='store_true',
+            help='Volcar cada ME_GUSTA_INTERVALO_VOLCADO segundos hasta detener el comando',
+        )
+
+    def handle(self, *args, **options):
+        if not options['continuo']:
+            actualizadas = volcar_me_gusta()
+            self.stdout.write(self.style.SUCCESS(f'✅ Me gusta volcados en {actualizadas} cafeterías'))
+            return
+
+        self.stdout.write(f'🔁 Volcando me gusta cada {settings.ME_GUSTA_INTERVALO_VOLCADO} s (Ctrl+C para detener)')
+        try:
+            while True:
+                actualizadas = volcar_me_gusta()
+                if actualizadas:
+                    self.stdout.write(f'💾 Me gusta volcados en {actualizadas} cafeterías')
+                time.sleep(settings.ME_GUSTA_INTERVALO_VOLCADO)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('✅ Volcado de me gusta detenido'))
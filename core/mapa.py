@@ -0,0 +1,236 @@
+"""
+Datos de cafeterías para el mapa, construidos una vez y guardados en caché.
+
+El contenido se guarda bajo una clave versionada; cualquier cambio en
+Cafeteria o Comentario incrementa la versión (ver signals.py), igual que los
+me gusta al escribirse en la base de datos (ver me_gusta.py), y el siguiente
+pedido vuelve a construirlo.
+
+Para el mapa interactivo cada proceso mantiene un IndiceMapa con los grupos
+de cafeterías ya calculados para cada nivel de zoom, de modo que /api/mapa/
+solo recorta lo que cae dentro de la vista.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+
+
+CACHE_VERSION_MAPA = 'mapa:version'
+CACHE_DATOS_MAPA = 'mapa:datos:{version}'
+
+# Los datos no expiran solos: se reemplazan al cambiar la versión
+TIMEOUT_DATOS_MAPA = 24 * 60 * 60
+
+
+# Hasta este zoom se agrupan las cafeterías; con más zoom se envían sueltas
+ZOOM_MAX_AGRUPADO = 14
+
+# Lado en píxeles de pantalla de cada celda de agrupación
+TAMANO_GRUPO_PX = 60
+
+# Tamaño de una tesela de Leaflet / OpenStreetMap
+TAMANO_TESELA_PX = 256
+
+# Latitud máxima representable en Web Mercator
+LATITUD_MAXIMA = 85.05112878
+
+
+def _cafeteria_a_dict(cafeteria):
+    return {
+        'id': cafeteria.id,
+        'nombre': cafeteria.nombre,
+        'descripcion': cafeteria.descripcion,
+        'direccion': cafeteria.direccion,
+        'latitud': float(cafeteria.latitud),
+        'longitud': float(cafeteria.longitud),
+        'telefono': cafeteria.telefono,
+        'horario': cafeteria.horario,
+        'precio_promedio': float(cafeteria.precio_promedio),
+        'wifi': cafeteria.wifi,
+        'terraza': cafeteria.terraza,
+        'estacionamiento': cafeteria.estacionamiento,
+        'zona': cafeteria.zona,
+        'calificacion_promedio': float(cafeteria.calificacion_promedio),
+        'total_calificaciones': cafeteria.total_calificaciones,
+        'total_me_gusta': cafeteria.total_me_gusta,
+    }
+
+
+def construir_datos_mapa():
+    """Arma la lista de cafeterías y el GeoJSON de /api/cafeterias.geojson"""
+    from .models import Cafeteria
+
+    cafeterias = [_cafeteria_a_dict(c) for c in Cafeteria.objects.all()]
+    features = []
+    for datos in cafeterias:
+        propiedades = {k: v for k, v in datos.items() if k not in ('latitud', 'longitud')}
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [datos['longitud'], datos['latitud']]},
+            'properties': propiedades,
+        })
+
+    geojson = json.dumps({'type': 'FeatureCollection', 'features': features}, ensure_ascii=False)
+    return {
+        'total': len(cafeterias),
+        'cafeterias': cafeterias,
+        'geojson': geojson,
+        'etag': hashlib.md5(geojson.encode('utf-8')).hexdigest(),
+    }
+
+
+def version_mapa():
+    return cache.get(CACHE_VERSION_MAPA, 0)
+
+
+def obtener_datos_mapa():
+    """Retorna los datos del mapa de la versión actual, construyéndolos si faltan"""
+    clave = CACHE_DATOS_MAPA.format(version=version_mapa())
+    datos = cache.get(clave)
+    if datos is None:
+        datos = construir_datos_mapa()
+        cache.set(clave, datos, TIMEOUT_DATOS_MAPA)
+    return datos
+
+
+def invalidar_mapa():
+    """Incrementa la versión; los datos anteriores quedan huérfanos y expiran"""
+    try:
+        cache.incr(CACHE_VERSION_MAPA)
+    except ValueError:
+        # Caché nueva o vaciada: no se vuelve a 1 para que ningún proceso
+        # confunda la nueva versión con una que ya tenía (ver geo.py)
+        cache.set(CACHE_VERSION_MAPA, time.time_ns() // 1000, None)
+
+
+def _a_pixeles(lats, lngs, zoom):
+    """Proyección Web Mercator a píxeles absolutos del nivel de zoom"""
+    escala = TAMANO_TESELA_PX * 2.0 ** zoom
+    lat = np.radians(np.clip(lats, -LATITUD_MAXIMA, LATITUD_MAXIMA))
+    x = (np.asarray(lngs) + 180.0) / 360.0 * escala
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * escala
+    return x, y
+
+
+class IndiceMapa:
+    """
+    Cafeterías del mapa con sus grupos precalculados para cada zoom entre 0
+    y ZOOM_MAX_AGRUPADO. Los grupos salen de una grilla de celdas de
+    TAMANO_GRUPO_PX píxeles en pantalla; cada grupo guarda la cantidad de
+    cafeterías, su centroide, sus límites y la calificación promedio.
+    """
+
+    def __init__(self, cafeterias):
+        self.cafeterias = cafeterias
+        self.lats = np.array([c['latitud'] for c in cafeterias], dtype=np.float64)
+        self.lngs = np.array([c['longitud'] for c in cafeterias], dtype=np.float64)
+        self.calificaciones = np.array([c['calificacion_promedio'] for c in cafeterias], dtype=np.float64)
+        self.resenas = np.array([c['total_calificaciones'] for c in cafeterias], dtype=np.float64)
+        self.grupos = {zoom: self._agrupar(zoom) for zoom in range(ZOOM_MAX_AGRUPADO + 1)}
+
+    def _agrupar(self, zoom):
+        n = len(self.cafeterias)
+        if not n:
+            return None
+        x, y = _a_pixeles(self.lats, self.lngs, zoom)
+        # Una sola clave entera por celda (columna, fila) para agrupar con np.unique
+        celdas = (x // TAMANO_GRUPO_PX).astype(np.int64) << 32 | (y // TAMANO_GRUPO_PX).astype(np.int64)
+        _, grupo, totales = np.unique(celdas, return_inverse=True, return_counts=True)
+        grupo = grupo.ravel()
+        m = len(totales)
+
+        def suma(valores):
+            return np.bincount(grupo, weights=valores, minlength=m)
+
+        # Promedio ponderado por reseñas: es el promedio de todas las calificaciones del grupo
+        resenas = suma(self.resenas)
+        puntos = suma(self.calificaciones * self.resenas)
+        calificacion = np.divide(puntos, resenas, out=np.zeros(m), where=resenas > 0)
+
+        sur, norte = np.full(m, np.inf), np.full(m, -np.inf)
+        oeste, este = np.full(m, np.inf), np.full(m, -np.inf)
+        np.minimum.at(sur, grupo, self.lats)
+        np.maximum.at(norte, grupo, self.lats)
+        np.minimum.at(oeste, grupo, self.lngs)
+        np.maximum.at(este, grupo, self.lngs)
+
+        # Para los grupos de una sola cafetería se envía la cafetería
+        unica = np.full(m, -1, dtype=np.int64)
+        unica[grupo] = np.arange(n)
+
+        return {
+            'total': totales,
+            'lat': suma(self.lats) / totales,
+            'lng': suma(self.lngs) / totales,
+            'calificacion': calificacion,
+            'resenas': resenas.astype(np.int64),
+            'limites': np.stack([oeste, sur, este, norte], axis=1),
+            'unica': unica,
+        }
+
+    def limites(self):
+        """[oeste, sur, este, norte] de todas las cafeterías, o None si no hay"""
+        if not len(self.cafeterias):
+            return None
+        return [float(self.lngs.min()), float(self.lats.min()), float(self.lngs.max()), float(self.lats.max())]
+
+    @staticmethod
+    def _dentro(lats, lngs, oeste, sur, este, norte):
+        en_lat = (lats >= sur) & (lats <= norte)
+        if oeste <= este:
+            return en_lat & (lngs >= oeste) & (lngs <= este)
+        # La vista cruza el antimeridiano
+        return en_lat & ((lngs >= oeste) | (lngs <= este))
+
+    def consultar(self, oeste, sur, este, norte, zoom):
+        """
+        Retorna (cafeterias, grupos) dentro de la vista. Con zoom mayor que
+        ZOOM_MAX_AGRUPADO no hay grupos y se devuelven todas las cafeterías
+        visibles.
+        """
+        if not len(self.cafeterias):
+            return [], []
+        if zoom > ZOOM_MAX_AGRUPADO:
+            visibles = np.nonzero(self._dentro(self.lats, self.lngs, oeste, sur, este, norte))[0]
+            return [self.cafeterias[i] for i in visibles], []
+
+        datos = self.grupos[max(zoom, 0)]
+        visibles = np.nonzero(self._dentro(datos['lat'], datos['lng'], oeste, sur, este, norte))[0]
+        cafeterias, grupos = [], []
+        for g in visibles:
+            if datos['total'][g] == 1:
+                cafeterias.append(self.cafeterias[datos['unica'][g]])
+                continue
+            grupos.append({
+                'total': int(datos['total'][g]),
+                'latitud': float(datos['lat'][g]),
+                'longitud': float(datos['lng'][g]),
+                'calificacion_promedio': round(float(datos['calificacion'][g]), 2),
+                'total_calificaciones': int(datos['resenas'][g]),
+                'limites': [float(v) for v in datos['limites'][g]],
+            })
+        return cafeterias, grupos
+
+
+_indice_mapa = None
+_indice_mapa_version = None
+_indice_mapa_lock = threading.Lock()
+
+
+def obtener_indice_mapa():
+    """
+    Retorna el IndiceMapa del proceso, reconstruyéndolo desde los datos en
+    caché cuando cambia la versión del mapa.
+    """
+    global _indice_mapa, _indice_mapa_version
+    version = version_mapa()
+    with _indice_mapa_lock:
+        if _indice_mapa is None or _indice_mapa_version != version:
+            _indice_mapa = IndiceMapa(obtener_datos_mapa()['cafeterias'])
+            _indice_mapa_version = version
+        return _indice_mapa
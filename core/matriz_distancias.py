@@ -0,0 +1,265 @@
+"""
+Matriz precalculada de distancias y tiempos a pie entre todas las cafeterías.
+
+Se guarda en disco como archivos .npy que se abren con memoria mapeada, con
+una posición (slot) por cafetería:
+
+    ids.npy          (C,)    int64    id de la cafetería en cada slot, -1 si está libre
+    coordenadas.npy  (C, 2)  float64  lat/lng usadas para calcular cada slot
+    distancias.npy   (C, C)  float32  km a pie
+    duraciones.npy   (C, C)  float32  minutos a pie
+
+La distancia a pie se aproxima como la distancia Haversine multiplicada por
+FACTOR_RODEO (las calles no van en línea recta); no se hace ninguna llamada
+a servicios externos. C es la capacidad: al guardar una cafetería nueva se
+ocupa un slot libre y solo se recalcula su fila y su columna.
+"""
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .geo import haversine_muchos_a_muchos, haversine_uno_a_muchos, obtener_coordenadas
+from .rutas import matriz_con_origen
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+ARCHIVOS = ('ids', 'coordenadas', 'distancias', 'duraciones')
+
+# Slots libres extra que se reservan al reconstruir la matriz
+CAPACIDAD_EXTRA = 32
+
+
+def _directorio():
+    return Path(settings.MATRIZ_DISTANCIAS_DIR)
+
+
+def _ruta(nombre, directorio=None):
+    return (directorio or _directorio()) / f'{nombre}.npy'
+
+
+def _factor():
+    return settings.FACTOR_RODEO
+
+
+def _a_minutos(distancias_km):
+    return distancias_km / settings.VELOCIDAD_CAMINATA_KMH * 60.0
+
+
+class _BloqueoEscritura:
+    """Bloqueo entre procesos (fcntl) y entre hilos para modificar los archivos"""
+    _lock = threading.Lock()
+
+    def __init__(self, directorio):
+        self.ruta = directorio / '.lock'
+        self.archivo = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if fcntl is not None:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            self.archivo = open(self.ruta, 'w')
+            fcntl.flock(self.archivo, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.archivo is not None:
+            fcntl.flock(self.archivo, fcntl.LOCK_UN)
+            self.archivo.close()
+        self._lock.release()
+
+
+class MatrizDistancias:
+    """Lectura O(1) por par de cafeterías sobre los archivos mapeados en memoria"""
+
+    def __init__(self, directorio=None):
+        directorio = directorio or _directorio()
+        self.inodo = os.stat(_ruta('ids', directorio)).st_ino
+        self.ids = np.load(_ruta('ids', directorio), mmap_mode='r')
+        self.distancias = np.load(_ruta('distancias', directorio), mmap_mode='r')
+        self.duraciones = np.load(_ruta('duraciones', directorio), mmap_mode='r')
+        self._indexar()
+
+    def _indexar(self):
+        self.posiciones = {int(cafe_id): slot for slot, cafe_id in enumerate(self.ids) if cafe_id >= 0}
+
+    def slot(self, cafe_id):
+        """Slot de la cafetería o None si todavía no está en la matriz"""
+        slot = self.posiciones.get(cafe_id)
+        if slot is not None and self.ids[slot] == cafe_id:
+            return slot
+        # Otro proceso pudo haber agregado o movido cafeterías
+        self._indexar()
+        return self.posiciones.get(cafe_id)
+
+    def distancia(self, a, b):
+        """Distancia a pie en km entre dos cafeterías, o None si falta alguna"""
+        i, j = self.slot(a), self.slot(b)
+        if i is None or j is None:
+            return None
+        return float(self.distancias[i, j])
+
+    def duracion(self, a, b):
+        """Tiempo a pie en minutos entre dos cafeterías, o None si falta alguna"""
+        i, j = self.slot(a), self.slot(b)
+        if i is None or j is None:
+            return None
+        return float(self.duraciones[i, j])
+
+    def submatriz(self, ids):
+        """Matriz de distancias entre los ids dados, o None si falta alguno"""
+        slots = [self.slot(cafe_id) for cafe_id in ids]
+        if any(slot is None for slot in slots):
+            return None
+        return np.asarray(self.distancias[np.ix_(slots, slots)], dtype=np.float64)
+
+    def fila(self, cafe_id):
+        """(ids, distancias) desde una cafetería hacia todas las demás"""
+        slot = self.slot(cafe_id)
+        if slot is None:
+            return None
+        ocupados = np.asarray(self.ids) >= 0
+        ocupados[slot] = False
+        return np.asarray(self.ids)[ocupados], np.asarray(self.distancias[slot], dtype=np.float64)[ocupados]
+
+
+_matriz = None
+_matriz_lock = threading.Lock()
+
+
+def obtener_matriz():
+    """
+    Retorna la matriz del proceso, o None si todavía no se generó con
+    `python manage.py calcular_matriz_distancias`. Se vuelve a abrir cuando
+    los archivos se reconstruyen.
+    """
+    global _matriz
+    try:
+        inodo = os.stat(_ruta('ids')).st_ino
+    except FileNotFoundError:
+        return None
+    with _matriz_lock:
+        if _matriz is None or _matriz.inodo != inodo:
+            _matriz = MatrizDistancias()
+        return _matriz
+
+
+def construir_matriz(capacidad=None):
+    """Recalcula la matriz completa desde la base de datos"""
+    from .models import Cafeteria
+
+    filas = [
+        (cafe_id, float(lat), float(lng))
+        for cafe_id, lat, lng in Cafeteria.objects.values_list('id', 'latitud', 'longitud')
+        if lat is not None and lng is not None
+    ]
+    n = len(filas)
+    capacidad = max(capacidad or 0, n + CAPACIDAD_EXTRA)
+
+    ids = np.full(capacidad, -1, dtype=np.int64)
+    coordenadas = np.full((capacidad, 2), np.nan)
+    distancias = np.full((capacidad, capacidad), np.nan, dtype=np.float32)
+    if n:
+        ids[:n] = [f[0] for f in filas]
+        coordenadas[:n] = [(f[1], f[2]) for f in filas]
+        km = haversine_muchos_a_muchos(coordenadas[:n, 0], coordenadas[:n, 1]) * _factor()
+        distancias[:n, :n] = km
+    duraciones = _a_minutos(distancias)
+
+    directorio = _directorio()
+    directorio.mkdir(parents=True, exist_ok=True)
+    with _BloqueoEscritura(directorio):
+        # Se escribe en temporales y se reemplaza al final para que los
+        # lectores nunca vean archivos a medio escribir; ids va último porque
+        # su inodo es el que marca la versión
+        for nombre, datos in zip(reversed(ARCHIVOS), (duraciones, distancias, coordenadas, ids)):
+            temporal = directorio / f'{nombre}.tmp.npy'
+            np.save(temporal, datos)
+            os.replace(temporal, _ruta(nombre, directorio))
+    return n, capacidad
+
+
+def actualizar_cafeteria_en_matriz(cafeteria):
+    """
+    Recalcula solo la fila y la columna de una cafetería. Si las coordenadas
+    no cambiaron no se escribe nada. Retorna False si la matriz no existe.
+    """
+    directorio = _directorio()
+    if not _ruta('ids', directorio).exists():
+        return False
+    if cafeteria.latitud is None or cafeteria.longitud is None:
+        return eliminar_cafeteria_de_matriz(cafeteria.pk)
+    lat, lng = float(cafeteria.latitud), float(cafeteria.longitud)
+
+    with _BloqueoEscritura(directorio):
+        ids = np.load(_ruta('ids', directorio), mmap_mode='r+')
+        coordenadas = np.load(_ruta('coordenadas', directorio), mmap_mode='r+')
+        encontrados = np.nonzero(ids == cafeteria.pk)[0]
+        libres = np.nonzero(ids < 0)[0]
+        if len(encontrados):
+            slot = int(encontrados[0])
+            if np.allclose(coordenadas[slot], (lat, lng), rtol=0, atol=1e-9):
+                return True
+        elif len(libres):
+            slot = int(libres[0])
+        else:
+            slot = None
+
+        if slot is not None:
+            distancias = np.load(_ruta('distancias', directorio), mmap_mode='r+')
+            duraciones = np.load(_ruta('duraciones', directorio), mmap_mode='r+')
+            km = haversine_uno_a_muchos(lat, lng, coordenadas[:, 0], coordenadas[:, 1]) * _factor()
+            km[ids < 0] = np.nan
+            km[slot] = 0.0
+            for matriz, valores in ((distancias, km), (duraciones, _a_minutos(km))):
+                matriz[slot, :] = valores
+                matriz[:, slot] = valores
+                matriz.flush()
+            coordenadas[slot] = (lat, lng)
+            coordenadas.flush()
+            # El id se escribe al final: hasta aquí los lectores no ven el slot
+            ids[slot] = cafeteria.pk
+            ids.flush()
+            return True
+        capacidad = len(ids)
+
+    # Sin slots libres: reconstruir con el doble de capacidad
+    construir_matriz(capacidad * 2)
+    return True
+
+
+def eliminar_cafeteria_de_matriz(cafe_id):
+    """Libera el slot de una cafetería"""
+    directorio = _directorio()
+    if not _ruta('ids', directorio).exists():
+        return False
+    with _BloqueoEscritura(directorio):
+        ids = np.load(_ruta('ids', directorio), mmap_mode='r+')
+        encontrados = np.nonzero(ids == cafe_id)[0]
+        if len(encontrados):
+            ids[encontrados] = -1
+            ids.flush()
+    return True
+
+
+def matriz_recorrido(ids, lat, lng):
+    """
+    Matriz (n + 1) x (n + 1) de distancias a pie con el punto de partida
+    (lat, lng) en la posición 0 y las cafeterías `ids` a continuación.
+    Entre cafeterías se lee la matriz precalculada; si falta alguna se
+    calcula al vuelo con el mismo factor de rodeo.
+    """
+    coordenadas = obtener_coordenadas()
+    indices = coordenadas.indices_de(ids)
+    origen = coordenadas.distancias_desde(lat, lng, indices) * _factor()
+    matriz = obtener_matriz()
+    paradas = matriz.submatriz(ids) if matriz is not None else None
+    if paradas is None:
+        paradas = coordenadas.matriz(indices) * _factor()
+    return matriz_con_origen(origen, paradas)
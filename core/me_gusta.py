@@ -0,0 +1,191 @@
+"""
+Contador de me gusta de cada cafetería y su estadística diaria.
+
+Por defecto cada cambio es un UPDATE atómico con F() que solo toca la
+columna total_me_gusta, más la suma a la fila diaria de estadísticas. Con
+settings.ME_GUSTA_DIFERIDO ambos cambios se suman en la caché y
+`python manage.py volcar_me_gusta --continuo` los escribe en lote cada
+ME_GUSTA_INTERVALO_VOLCADO segundos, fuera de las solicitudes; el mapa se
+invalida una vez por volcado y no con cada me gusta.
+
+Para no recorrer todas las cafeterías en cada volcado, la primera vez que
+una cafetería cambia en un día desde el último volcado se anota en una lista
+en la caché (una clave por posición y un contador con la última posición);
+el volcado solo lee las cafeterías y días de la lista.
+"""
+from collections import defaultdict
+from datetime import date
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+CACHE_ME_GUSTA_PENDIENTE = 'me_gusta:pendiente:{cafeteria_id}'
+CACHE_ME_GUSTA_DIA = 'me_gusta:dia:{cafeteria_id}:{fecha}'
+CACHE_ME_GUSTA_ANOTADA = 'me_gusta:anotada:{cafeteria_id}:{fecha}'
+CACHE_ME_GUSTA_LISTA = 'me_gusta:lista:{posicion}'
+CACHE_ME_GUSTA_LISTA_FIN = 'me_gusta:lista:fin'
+CACHE_ME_GUSTA_LISTA_LEIDA = 'me_gusta:lista:leida'
+CACHE_ME_GUSTA_LISTA_HUECO = 'me_gusta:lista:hueco'
+CACHE_ME_GUSTA_VOLCADO = 'me_gusta:volcado'
+
+# Los cambios pendientes no deben expirar antes de volcarse
+TIMEOUT_ME_GUSTA_PENDIENTE = 24 * 60 * 60
+
+
+def _clave(cafeteria_id):
+    return CACHE_ME_GUSTA_PENDIENTE.format(cafeteria_id=cafeteria_id)
+
+
+def _clave_dia(cafeteria_id, fecha):
+    return CACHE_ME_GUSTA_DIA.format(cafeteria_id=cafeteria_id, fecha=fecha)
+
+
+def _sumar(clave, delta):
+    if not cache.add(clave, delta, TIMEOUT_ME_GUSTA_PENDIENTE):
+        try:
+            cache.incr(clave, delta)
+        except ValueError:
+            # La clave expiró entre add e incr
+            cache.set(clave, delta, TIMEOUT_ME_GUSTA_PENDIENTE)
+
+
+def _actualizar(cafeteria_id, delta):
+    from .models import Cafeteria
+
+    return Cafeteria.objects.filter(pk=cafeteria_id).update(
+        total_me_gusta=Greatest(F('total_me_gusta') + delta, 0)
+    )
+
+
+def _anotar(cafeteria_id, fecha):
+    """Agrega la cafetería y el día a la lista del próximo volcado si todavía no están"""
+    if cache.add(CACHE_ME_GUSTA_ANOTADA.format(cafeteria_id=cafeteria_id, fecha=fecha), 1, TIMEOUT_ME_GUSTA_PENDIENTE):
+        cache.add(CACHE_ME_GUSTA_LISTA_FIN, 0, None)
+        posicion = cache.incr(CACHE_ME_GUSTA_LISTA_FIN)
+        cache.set(CACHE_ME_GUSTA_LISTA.format(posicion=posicion), (cafeteria_id, fecha), TIMEOUT_ME_GUSTA_PENDIENTE)
+
+
+def _acumular(cafeteria_id, delta, fecha):
+    _sumar(_clave(cafeteria_id), delta)
+    _sumar(_clave_dia(cafeteria_id, fecha), delta)
+    _anotar(cafeteria_id, fecha)
+
+
+def sumar_me_gusta(cafeteria_id, delta, fecha):
+    """
+    Suma `delta` (1 o -1) al contador de la cafetería y a su estadística del
+    día `fecha` (el día en que se dio el me gusta, también al quitarlo).
+    """
+    from .estadisticas import registrar_actividad
+    from .mapa import invalidar_mapa
+
+    if not delta:
+        return
+    if settings.ME_GUSTA_DIFERIDO:
+        transaction.on_commit(partial(_acumular, cafeteria_id, delta, fecha.isoformat()))
+    else:
+        _actualizar(cafeteria_id, delta)
+        registrar_actividad([cafeteria_id], fecha, me_gusta=delta)
+        transaction.on_commit(invalidar_mapa)
+
+
+def me_gusta_pendientes(cafeteria_id):
+    """Cambios todavía no volcados a la base de datos"""
+    if not settings.ME_GUSTA_DIFERIDO:
+        return 0
+    return cache.get(_clave(cafeteria_id), 0)
+
+
+def total_me_gusta(cafeteria_id):
+    """Total actual: lo guardado en la base de datos más lo pendiente"""
+    from .models import Cafeteria
+
+    guardado = Cafeteria.objects.filter(pk=cafeteria_id).values_list('total_me_gusta', flat=True).first()
+    return max((guardado or 0) + me_gusta_pendientes(cafeteria_id), 0)
+
+
+def _leer_lista():
+    """
+    ((cafeteria_id, fecha) anotados desde el último volcado, posiciones
+    leídas). Una posición reservada pero todavía sin escribir detiene la
+    lectura; si en el volcado siguiente sigue vacía (el proceso que la
+    reservó terminó antes de escribirla) se salta.
+    """
+    leida = cache.get(CACHE_ME_GUSTA_LISTA_LEIDA, 0)
+    fin = cache.get(CACHE_ME_GUSTA_LISTA_FIN, 0)
+    claves = [CACHE_ME_GUSTA_LISTA.format(posicion=posicion) for posicion in range(leida + 1, fin + 1)]
+    valores = cache.get_many(claves)
+    pares = []
+    for posicion, clave in enumerate(claves, leida + 1):
+        if clave in valores:
+            pares.append(valores[clave])
+        elif cache.get(CACHE_ME_GUSTA_LISTA_HUECO) != posicion:
+            cache.set(CACHE_ME_GUSTA_LISTA_HUECO, posicion, TIMEOUT_ME_GUSTA_PENDIENTE)
+            return pares, range(leida + 1, posicion)
+    return pares, range(leida + 1, fin + 1)
+
+
+def _descontar(pendientes):
+    """Descuenta de cada clave lo que se volcó"""
+    for clave, delta in pendientes.items():
+        try:
+            cache.decr(clave, delta)
+        except ValueError:
+            # La clave expiró después de leerla: no queda nada pendiente
+            pass
+
+
+def volcar_me_gusta():
+    """
+    Escribe en la base de datos los cambios acumulados en la caché para las
+    cafeterías anotadas: el contador de cada una y las estadísticas de cada
+    día. A cada clave se le descuenta exactamente lo que se volcó, así los me
+    gusta que llegan durante el volcado quedan para el siguiente. Retorna la
+    cantidad de cafeterías actualizadas.
+    """
+    from .estadisticas import registrar_actividad_por_cafeteria
+    from .mapa import invalidar_mapa
+
+    # Un solo volcado a la vez: dos a la vez escribirían dos veces lo mismo
+    if not cache.add(CACHE_ME_GUSTA_VOLCADO, 1, TIMEOUT_ME_GUSTA_PENDIENTE):
+        return 0
+    try:
+        pares, posiciones = _leer_lista()
+        # Se desmarcan antes de leer los pendientes: un me gusta que llegue
+        # ahora vuelve a anotar la cafetería para el volcado siguiente
+        cache.delete_many([
+            CACHE_ME_GUSTA_ANOTADA.format(cafeteria_id=cafeteria_id, fecha=fecha) for cafeteria_id, fecha in pares
+        ])
+        claves = {_clave(cafeteria_id): cafeteria_id for cafeteria_id, _ in pares}
+        claves_dia = {_clave_dia(cafeteria_id, fecha): (cafeteria_id, fecha) for cafeteria_id, fecha in set(pares)}
+        leidos = cache.get_many([*claves, *claves_dia])
+        pendientes = {clave: leidos[clave] for clave in claves if leidos.get(clave)}
+        pendientes_dia = {clave: leidos[clave] for clave in claves_dia if leidos.get(clave)}
+
+        por_dia = defaultdict(dict)
+        for clave, delta in pendientes_dia.items():
+            cafeteria_id, fecha = claves_dia[clave]
+            por_dia[fecha][cafeteria_id] = delta
+
+        if pendientes or pendientes_dia:
+            with transaction.atomic():
+                for clave, delta in pendientes.items():
+                    _actualizar(claves[clave], delta)
+                for fecha, deltas in por_dia.items():
+                    registrar_actividad_por_cafeteria(date.fromisoformat(fecha), 'me_gusta', deltas)
+            _descontar(pendientes)
+            _descontar(pendientes_dia)
+        if pendientes:
+            invalidar_mapa()
+
+        if posiciones:
+            cache.set(CACHE_ME_GUSTA_LISTA_LEIDA, posiciones[-1], None)
+            cache.delete_many([CACHE_ME_GUSTA_LISTA.format(posicion=posicion) for posicion in posiciones])
+        return len(pendientes)
+    finally:
+        cache.delete(CACHE_ME_GUSTA_VOLCADO)
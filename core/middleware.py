@@ -1,40 +1,68 @@
+"""
+Redirección de los dueños de cafetería a su panel.
+
+El rol de cada usuario se guarda en la caché por defecto y las señales de
+DuenoCafeteria lo borran al cambiar la solicitud. Con una caché por proceso
+(LocMem) solo se borra en el proceso que hizo el cambio, por eso el rol
+expira a los ROL_USUARIO_TIMEOUT segundos; para que el cambio se vea al
+instante en todos los procesos la caché debe ser compartida (p. ej. Redis).
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import redirect
-from django.urls import reverse
-
-
-class DuenoRedirectMiddleware:
-    """Middleware para redirigir automáticamente a los dueños a su panel"""
-    
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        # Rutas que no necesitan redirección
-        exempt_urls = [
-            '/login/', '/logout/', '/registro/', '/registro-dueno/', 
-            '/panel-dueno/', '/productos/', '/cafeteria/editar/',
-            '/admin/', '/static/', '/media/', '/chat/', '/api/'
-        ]
-        
-        # Si el usuario está autenticado
-        if request.user.is_authenticated:
-            
-            # Si es superusuario, permitir acceso normal
-            if request.user.is_superuser:
-                pass
-            
-            # Si es dueño de cafetería aprobado
-            elif (hasattr(request.user, 'duenocafeteria') and 
-                  request.user.duenocafeteria.esta_aprobado):
-                
-                # Si está en la página principal, redirigir al panel
-                if request.path == '/':
-                    return redirect('panel_dueno')
-                
-                # Si está tratando de acceder a rutas no permitidas para dueños
-                forbidden_paths = ['/perfil/', '/estadisticas/', '/completar-perfil/']
-                if any(request.path.startswith(path) for path in forbidden_paths):
-                    return redirect('panel_dueno')
-        
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+from django.utils.deprecation import MiddlewareMixin
+
+
+# Rutas que no necesitan redirección: se descartan antes de tocar la sesión o la base de datos
+EXEMPT_URLS = re.compile(
+    r'^/(login|logout|registro|registro-dueno|panel-dueno|productos|cafeteria/editar'
+    r'|admin|static|media|chat|api)/'
+)
+
+# Rutas no permitidas para dueños (además de la página principal)
+FORBIDDEN_PATHS = re.compile(r'^/$|^/(perfil|estadisticas|completar-perfil)/')
+
+ROL_SUPERUSUARIO = 'superusuario'
+ROL_DUENO = 'dueno'
+ROL_REGULAR = 'regular'
+
+CACHE_ROL_USUARIO = 'usuario:rol:{user_id}'
+
+
+def rol_usuario(user):
+    """Rol del usuario autenticado; el de dueño se guarda en caché (ver signals.py)"""
+    if user.is_superuser:
+        return ROL_SUPERUSUARIO
+    clave = CACHE_ROL_USUARIO.format(user_id=user.pk)
+    rol = cache.get(clave)
+    if rol is None:
+        from .models import DuenoCafeteria
+
+        es_dueno = DuenoCafeteria.objects.filter(user_id=user.pk, estado='aprobado').exists()
+        rol = ROL_DUENO if es_dueno else ROL_REGULAR
+        cache.set(clave, rol, settings.ROL_USUARIO_TIMEOUT)
+    return rol
+
+
+def invalidar_rol_usuario(user_id):
+    cache.delete(CACHE_ROL_USUARIO.format(user_id=user_id))
+
+
+class DuenoRedirectMiddleware(MiddlewareMixin):
+    """
+    Middleware para redirigir automáticamente a los dueños a su panel.
+    Con MiddlewareMixin funciona también bajo ASGI sin obligar a que las
+    vistas asíncronas (el chat) se ejecuten en un hilo.
+    """
+
+    def process_request(self, request):
+        path = request.path
+
+        # Solo la página principal y las rutas prohibidas para dueños necesitan
+        # conocer el rol; el resto pasa sin consultar al usuario
+        if not EXEMPT_URLS.match(path) and FORBIDDEN_PATHS.match(path):
+            if request.user.is_authenticated and rol_usuario(request.user) == ROL_DUENO:
+                return redirect('panel_dueno')
+        return None
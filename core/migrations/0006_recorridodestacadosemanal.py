@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_duenocafeteria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecorridoDestacadoSemanal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveIntegerField()),
+                ('semana', models.PositiveIntegerField()),
+                ('posicion', models.PositiveIntegerField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('recorrido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recorrido')),
+            ],
+            options={
+                'ordering': ['anio', 'semana', 'posicion'],
+                'unique_together': {('anio', 'semana', 'posicion')},
+            },
+        ),
+    ]
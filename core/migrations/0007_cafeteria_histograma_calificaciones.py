@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:58
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def llenar_histogramas(apps, schema_editor):
+    """Inicializa suma e histograma desde los comentarios existentes"""
+    Cafeteria = apps.get_model('core', 'Cafeteria')
+    Comentario = apps.get_model('core', 'Comentario')
+
+    histogramas = {}
+    for cafeteria_id, calificacion, cantidad in (
+        Comentario.objects.values_list('cafeteria_id', 'calificacion')
+        .annotate(cantidad=Count('id')).order_by()
+    ):
+        if 1 <= calificacion <= 5:
+            histogramas.setdefault(cafeteria_id, {})[calificacion] = cantidad
+
+    for cafeteria_id, histograma in histogramas.items():
+        Cafeteria.objects.filter(pk=cafeteria_id).update(
+            total_calificaciones=sum(histograma.values()),
+            suma_calificaciones=sum(e * n for e, n in histograma.items()),
+            **{f'calificaciones_{e}': n for e, n in histograma.items()},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recorridodestacadosemanal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cafeteria',
+            name='calificaciones_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafeteria',
+            name='calificaciones_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafeteria',
+            name='calificaciones_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafeteria',
+            name='calificaciones_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafeteria',
+            name='calificaciones_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cafeteria',
+            name='suma_calificaciones',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(llenar_histogramas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cafeteria_histograma_calificaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaGeneralDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('me_gusta', models.IntegerField(default=0)),
+                ('comentarios', models.IntegerField(default=0)),
+                ('suma_calificaciones', models.IntegerField(default=0)),
+                ('recorridos_iniciados', models.IntegerField(default=0)),
+                ('recorridos_completados', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('me_gusta', models.IntegerField(default=0)),
+                ('comentarios', models.IntegerField(default=0)),
+                ('suma_calificaciones', models.IntegerField(default=0)),
+                ('recorridos_iniciados', models.IntegerField(default=0)),
+                ('recorridos_completados', models.IntegerField(default=0)),
+                ('cafeteria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_diarias', to='core.cafeteria')),
+            ],
+            options={
+                'ordering': ['fecha'],
+                'unique_together': {('cafeteria', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def llenar_estadisticas(apps, schema_editor):
+    """Calcula las filas diarias desde los me gusta, comentarios y recorridos existentes"""
+    from core.estadisticas import reconstruir_estadisticas
+
+    reconstruir_estadisticas(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_estadisticas_diarias'),
+    ]
+
+    operations = [
+        migrations.RunPython(llenar_estadisticas, migrations.RunPython.noop),
+    ]
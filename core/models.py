@@ -44,6 +44,14 @@ class Cafeteria(models.Model):
     total_calificaciones = models.PositiveIntegerField(default=0)
     total_me_gusta = models.PositiveIntegerField(default=0)
     
+    # Suma e histograma de calificaciones, actualizados al agregar o borrar comentarios
+    suma_calificaciones = models.PositiveIntegerField(default=0)
+    calificaciones_1 = models.PositiveIntegerField(default=0)
+    calificaciones_2 = models.PositiveIntegerField(default=0)
+    calificaciones_3 = models.PositiveIntegerField(default=0)
+    calificaciones_4 = models.PositiveIntegerField(default=0)
+    calificaciones_5 = models.PositiveIntegerField(default=0)
+    
     def __str__(self):
         return self.nombre
     
@@ -51,6 +59,11 @@ class Cafeteria(models.Model):
     def estrellas(self):
         return round(self.calificacion_promedio)
 
+    @property
+    def histograma_calificaciones(self):
+        """Cantidad de calificaciones por estrella: {1: n1, ..., 5: n5}"""
+        return {estrellas: getattr(self, f'calificaciones_{estrellas}') for estrellas in range(1, 6)}
+
     def get_horarios_detallados(self):
         """Retorna los horarios detallados por día de la semana"""
         horarios = HorarioCafeteria.objects.filter(cafeteria=self).order_by('dia_semana')
@@ -164,6 +177,22 @@ class RecorridoCafeteria(models.Model):
         ordering = ['orden']
 
 
+class RecorridoDestacadoSemanal(models.Model):
+    """Recorridos que se muestran en la página principal durante una semana ISO"""
+    anio = models.PositiveIntegerField()
+    semana = models.PositiveIntegerField()
+    posicion = models.PositiveIntegerField()
+    recorrido = models.ForeignKey(Recorrido, on_delete=models.CASCADE)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['anio', 'semana', 'posicion']
+        ordering = ['anio', 'semana', 'posicion']
+    
+    def __str__(self):
+        return f"{self.anio}-S{self.semana:02d} #{self.posicion} {self.recorrido.nombre}"
+
+
 class RecorridoUsuario(models.Model):
     ESTADO_CHOICES = [
         ('P', 'Pendiente'),
@@ -208,6 +237,40 @@ class MeGusta(models.Model):
         return f"{self.usuario.username} le gusta {self.cafeteria.nombre}"
 
 
+class EstadisticaDiaria(models.Model):
+    """Actividad de una cafetería en un día, acumulada a medida que ocurre"""
+    cafeteria = models.ForeignKey(Cafeteria, on_delete=models.CASCADE, related_name='estadisticas_diarias')
+    fecha = models.DateField()
+    me_gusta = models.IntegerField(default=0)
+    comentarios = models.IntegerField(default=0)
+    suma_calificaciones = models.IntegerField(default=0)
+    recorridos_iniciados = models.IntegerField(default=0)
+    recorridos_completados = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['cafeteria', 'fecha']
+        ordering = ['fecha']
+    
+    def __str__(self):
+        return f"{self.cafeteria.nombre} - {self.fecha}"
+
+
+class EstadisticaGeneralDiaria(models.Model):
+    """Actividad de toda la plataforma en un día"""
+    fecha = models.DateField(unique=True)
+    me_gusta = models.IntegerField(default=0)
+    comentarios = models.IntegerField(default=0)
+    suma_calificaciones = models.IntegerField(default=0)
+    recorridos_iniciados = models.IntegerField(default=0)
+    recorridos_completados = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['fecha']
+    
+    def __str__(self):
+        return str(self.fecha)
+
+
 class DuenoCafeteria(models.Model):
     """Modelo para dueños de cafeterías"""
     ESTADO_CHOICES = [
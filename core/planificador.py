@@ -0,0 +1,274 @@
+"""
+Planificador de recorridos que respeta los horarios de atención.
+
+Resuelve el orden de visita como un problema del viajante con ventanas de
+tiempo: cada parada solo puede visitarse entre su hora de apertura y su hora
+de cierre del día del recorrido. Si se llega antes de que abra, se espera.
+Las cafeterías sin horario cargado para ese día usan settings.HORARIO_SIN_CARGAR.
+
+Un horario que pasa la medianoche (18:00-02:00) también cubre la madrugada
+del día siguiente: si el recorrido empieza antes de ese cierre se usa la
+ventana de la noche anterior. Cada parada tiene una sola ventana, así que un
+recorrido que empieza de madrugada no espera a que la cafetería vuelva a
+abrir esa noche.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
+from .rutas import MAX_PARADAS_EXACTO, distancia_ruta, optimizar_ruta
+
+
+MINUTOS_DIA = 24 * 60
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def _ventana(apertura, cierre):
+    abre, cierra = _minutos(apertura), _minutos(cierre)
+    if cierra <= abre:
+        cierra += MINUTOS_DIA
+    return abre, cierra
+
+
+def ventana_sin_horario():
+    """
+    Ventana para las cafeterías sin horario cargado ese día, tomada de
+    settings.HORARIO_SIN_CARGAR ('HH:MM-HH:MM'); None si está vacío (se
+    omiten del recorrido). Lanza ValueError si el formato es inválido.
+    """
+    valor = settings.HORARIO_SIN_CARGAR.strip()
+    if not valor:
+        return None
+    apertura, _, cierre = valor.partition('-')
+    apertura, cierre = parse_time(apertura.strip()), parse_time(cierre.strip())
+    if apertura is None or cierre is None:
+        raise ValueError(f"HORARIO_SIN_CARGAR inválido: {valor}")
+    return _ventana(apertura, cierre)
+
+
+class TablaHorarios:
+    """
+    Horarios semanales en memoria, cargados en una sola consulta.
+    Las ventanas se guardan en minutos desde la medianoche; un cierre menor
+    o igual que la apertura se interpreta como cierre después de medianoche.
+    """
+
+    def __init__(self, filas, sin_horario=None):
+        self.sin_horario = sin_horario
+        self.ventanas = {}
+        for cafe_id, dia, apertura, cierre, cerrado in filas:
+            if cerrado:
+                self.ventanas[(cafe_id, dia)] = None
+            elif apertura is not None and cierre is not None:
+                self.ventanas[(cafe_id, dia)] = _ventana(apertura, cierre)
+
+    @classmethod
+    def cargar(cls, cafeteria_ids=None):
+        from .models import HorarioCafeteria
+
+        horarios = HorarioCafeteria.objects.all()
+        if cafeteria_ids is not None:
+            horarios = horarios.filter(cafeteria_id__in=list(cafeteria_ids))
+        return cls(horarios.values_list(
+            'cafeteria_id', 'dia_semana', 'hora_apertura', 'hora_cierre', 'cerrado'
+        ), ventana_sin_horario())
+
+    def ventana(self, cafe_id, dia_semana, desde=None):
+        """
+        (apertura, cierre) en minutos, o None si está cerrada ese día. Sin
+        horario cargado se usa `sin_horario`. Si a los `desde` minutos sigue
+        abierta desde la noche anterior, retorna esa ventana (con la apertura
+        antes de la medianoche, en negativo).
+        """
+        if desde is not None:
+            anterior = self.ventanas.get((cafe_id, (dia_semana - 1) % 7), self.sin_horario)
+            if anterior is not None and desde < anterior[1] - MINUTOS_DIA:
+                return anterior[0] - MINUTOS_DIA, anterior[1] - MINUTOS_DIA
+        return self.ventanas.get((cafe_id, dia_semana), self.sin_horario)
+
+
+def interpretar_hora_inicio(valor):
+    """
+    Convierte 'YYYY-MM-DDTHH:MM' o 'HH:MM' (hoy) a datetime local.
+    Sin valor retorna la hora actual. Lanza ValueError si el formato es inválido.
+    """
+    ahora = timezone.localtime()
+    if not valor:
+        return ahora
+    fecha_hora = parse_datetime(valor)
+    if fecha_hora is None:
+        hora = parse_time(valor)
+        if hora is None:
+            raise ValueError(f"Hora de inicio inválida: {valor}")
+        fecha_hora = datetime.combine(ahora.date(), hora)
+    if timezone.is_naive(fecha_hora):
+        fecha_hora = timezone.make_aware(fecha_hora)
+    return timezone.localtime(fecha_hora)
+
+
+def _simular(ruta, tiempos, abre, cierra, inicio_min, estancia_min):
+    """
+    Recorre la ruta en orden y retorna la lista de (llegada, inicio_visita)
+    o None si alguna parada queda fuera de su ventana.
+    """
+    actual, ahora = 0, inicio_min
+    resultado = []
+    for parada in ruta:
+        llegada = ahora + tiempos[actual, parada]
+        comienzo = max(llegada, abre[parada])
+        if comienzo + estancia_min > cierra[parada]:
+            return None
+        resultado.append((llegada, comienzo))
+        ahora = comienzo + estancia_min
+        actual = parada
+    return resultado
+
+
+def _exacto_ventanas(tiempos, abre, cierra, inicio_min, estancia_min):
+    """
+    Programación dinámica sobre subconjuntos. Para cada (conjunto, última
+    parada) guarda la hora más temprana de salida; llegar antes nunca es
+    peor porque se puede esperar. Retorna la ruta que visita más paradas y,
+    entre ellas, la que termina antes.
+    """
+    n = tiempos.shape[0] - 1
+    total = 1 << n
+    bits = 1 << np.arange(n)
+    paradas = tiempos[1:, 1:]
+    abre_p, cierra_p = abre[1:], cierra[1:]
+
+    salida = np.full((total, n), np.inf)
+    previo = np.full((total, n), -1, dtype=np.int64)
+
+    comienzo = np.maximum(inicio_min + tiempos[0, 1:], abre_p)
+    factible = comienzo + estancia_min <= cierra_p
+    salida[bits[factible], np.arange(n)[factible]] = comienzo[factible] + estancia_min
+
+    mascaras = np.arange(total)
+    pertenece = (mascaras[:, None] & bits[None, :]) != 0
+    tamanos = pertenece.sum(axis=1)
+
+    for tamano in range(1, n):
+        capa = mascaras[tamanos == tamano]
+        llegadas = salida[capa][:, :, None] + paradas[None, :, :]
+        mejores_j = np.argmin(llegadas, axis=1)
+        mejores = np.take_along_axis(llegadas, mejores_j[:, None, :], axis=1)[:, 0, :]
+        filas, ks = np.nonzero(~pertenece[capa])
+        comienzo = np.maximum(mejores[filas, ks], abre_p[ks])
+        ok = comienzo + estancia_min <= cierra_p[ks]
+        filas, ks, comienzo = filas[ok], ks[ok], comienzo[ok]
+        destinos = capa[filas] | bits[ks]
+        salida[destinos, ks] = comienzo + estancia_min
+        previo[destinos, ks] = mejores_j[filas, ks]
+
+    alcanzables = np.isfinite(salida).any(axis=1)
+    if not alcanzables.any():
+        return []
+    # Máscara con más paradas y, entre esas, la de salida más temprana
+    candidatas = mascaras[alcanzables]
+    mejor_tamano = tamanos[candidatas].max()
+    candidatas = candidatas[tamanos[candidatas] == mejor_tamano]
+    fin = salida[candidatas].min(axis=1)
+    mascara = int(candidatas[np.argmin(fin)])
+
+    j = int(np.argmin(salida[mascara]))
+    ruta = []
+    while j != -1:
+        ruta.append(j + 1)
+        anterior = int(previo[mascara, j])
+        mascara &= ~(1 << j)
+        j = anterior
+    return ruta[::-1]
+
+
+def _voraz_ventanas(tiempos, abre, cierra, inicio_min, estancia_min):
+    """Siempre ir a la parada que se pueda terminar de visitar más temprano"""
+    n = tiempos.shape[0] - 1
+    pendientes = np.ones(n + 1, dtype=bool)
+    pendientes[0] = False
+    actual, ahora = 0, inicio_min
+    ruta = []
+    while pendientes.any():
+        comienzo = np.maximum(ahora + tiempos[actual], abre)
+        factible = pendientes & (comienzo + estancia_min <= cierra)
+        if not factible.any():
+            break
+        siguiente = int(np.argmin(np.where(factible, comienzo, np.inf)))
+        ruta.append(siguiente)
+        pendientes[siguiente] = False
+        ahora = comienzo[siguiente] + estancia_min
+        actual = siguiente
+    return ruta
+
+
+def planificar_recorrido(ids, matriz, inicio, tabla=None, velocidad_kmh=None,
+                         estancia_min=None, estrategia='auto', limite_ms=None):
+    """
+    Ordena las cafeterías `ids` respetando sus horarios del día de `inicio`.
+
+    `matriz` es la matriz de distancias (n + 1) x (n + 1) en km con el punto
+    de partida en la posición 0 y las cafeterías en el mismo orden que `ids`.
+    Primero se busca la ruta más corta; si esa ruta cumple todos los
+    horarios se usa tal cual, si no se resuelve con ventanas de tiempo.
+
+    Retorna un diccionario con el orden, las paradas omitidas (cerradas, sin
+    horario si HORARIO_SIN_CARGAR está vacío, o imposibles de alcanzar a
+    tiempo), la hora de llegada a cada parada, la distancia total y la
+    duración estimada en minutos.
+    """
+    velocidad_kmh = velocidad_kmh or settings.VELOCIDAD_CAMINATA_KMH
+    if estancia_min is None:
+        estancia_min = settings.ESTANCIA_CAFETERIA_MIN
+    if tabla is None:
+        tabla = TablaHorarios.cargar(ids)
+
+    matriz = np.asarray(matriz, dtype=np.float64)
+    tiempos = matriz / velocidad_kmh * 60.0
+    dia = inicio.weekday()
+    medianoche = inicio.replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio_min = (inicio - medianoche).total_seconds() / 60.0
+
+    abre = np.zeros(len(ids) + 1)
+    cierra = np.full(len(ids) + 1, np.inf)
+    for i, cafe_id in enumerate(ids, 1):
+        ventana = tabla.ventana(cafe_id, dia, inicio_min)
+        if ventana is None:
+            abre[i], cierra[i] = np.inf, -np.inf
+        else:
+            abre[i], cierra[i] = ventana
+
+    ruta, _ = optimizar_ruta(matriz, estrategia, limite_ms)
+    visitas = _simular(ruta, tiempos, abre, cierra, inicio_min, estancia_min)
+    if visitas is None:
+        if len(ids) <= MAX_PARADAS_EXACTO:
+            ruta = _exacto_ventanas(tiempos, abre, cierra, inicio_min, estancia_min)
+        else:
+            ruta = _voraz_ventanas(tiempos, abre, cierra, inicio_min, estancia_min)
+        visitas = _simular(ruta, tiempos, abre, cierra, inicio_min, estancia_min)
+
+    paradas = []
+    for parada, (llegada, comienzo) in zip(ruta, visitas):
+        paradas.append({
+            'id': ids[parada - 1],
+            'llegada': medianoche + timedelta(minutes=float(llegada)),
+            'espera_min': round(float(comienzo - llegada)),
+        })
+
+    visitadas = set(ruta)
+    duracion = 0
+    if visitas:
+        duracion = visitas[-1][1] + estancia_min - inicio_min
+
+    return {
+        'orden': [ids[parada - 1] for parada in ruta],
+        'omitidas': [cafe_id for i, cafe_id in enumerate(ids, 1) if i not in visitadas],
+        'paradas': paradas,
+        'distancia_km': distancia_ruta(matriz, ruta),
+        'duracion_min': int(round(duracion)),
+    }
@@ -0,0 +1,221 @@
+"""
+Optimizador de rutas entre cafeterías (problema del viajante con inicio fijo).
+
+Todas las estrategias trabajan sobre una matriz de distancias precalculada
+de tamaño (n + 1) x (n + 1), donde el nodo 0 es el punto de partida del
+usuario y los nodos 1..n son las paradas. La ruta es abierta: termina en la
+última cafetería, no vuelve al origen.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+
+
+# Hasta este número de paradas se usa programación dinámica exacta
+MAX_PARADAS_EXACTO = 12
+
+
+def distancia_ruta(matriz, ruta):
+    """Distancia total de una ruta que empieza en el nodo 0"""
+    if not ruta:
+        return 0.0
+    nodos = [0] + list(ruta)
+    return float(sum(matriz[a, b] for a, b in zip(nodos, nodos[1:])))
+
+
+def _limite(limite_ms):
+    return time.perf_counter() + limite_ms / 1000.0
+
+
+def vecino_mas_cercano(matriz, limite_ms=None):
+    """Ruta voraz: siempre ir a la parada pendiente más cercana"""
+    n = matriz.shape[0] - 1
+    pendientes = np.ones(n + 1, dtype=bool)
+    pendientes[0] = False
+    actual = 0
+    ruta = []
+    for _ in range(n):
+        siguiente = int(np.argmin(np.where(pendientes, matriz[actual], np.inf)))
+        ruta.append(siguiente)
+        pendientes[siguiente] = False
+        actual = siguiente
+    return ruta
+
+
+def mejorar_dos_opt(matriz, ruta, fin):
+    """
+    2-opt para rutas abiertas: invierte tramos mientras acorten la ruta o
+    hasta agotar el tiempo.
+    """
+    nodos = [0] + list(ruta)
+    m = len(nodos)
+    mejorado = True
+    while mejorado and time.perf_counter() < fin:
+        mejorado = False
+        for i in range(1, m - 1):
+            a, b = nodos[i - 1], nodos[i]
+            for j in range(i + 1, m):
+                c = nodos[j]
+                delta = matriz[a, c] - matriz[a, b]
+                if j + 1 < m:
+                    d = nodos[j + 1]
+                    delta += matriz[b, d] - matriz[c, d]
+                if delta < -1e-9:
+                    nodos[i:j + 1] = reversed(nodos[i:j + 1])
+                    mejorado = True
+                    break
+            if mejorado or time.perf_counter() >= fin:
+                break
+    return nodos[1:]
+
+
+def mejorar_or_opt(matriz, ruta, fin, max_segmento=3):
+    """
+    Or-opt: mueve tramos de 1 a `max_segmento` paradas (en cualquier sentido)
+    a la posición donde más acorten la ruta.
+    """
+    nodos = [0] + list(ruta)
+    mejorado = True
+    while mejorado and time.perf_counter() < fin:
+        mejorado = False
+        m = len(nodos)
+        for largo in range(1, max_segmento + 1):
+            for i in range(1, m - largo + 1):
+                tramo = nodos[i:i + largo]
+                antes = nodos[i - 1]
+                despues = nodos[i + largo] if i + largo < m else None
+                # Costo ahorrado al sacar el tramo
+                ahorro = matriz[antes, tramo[0]]
+                if despues is not None:
+                    ahorro += matriz[tramo[-1], despues] - matriz[antes, despues]
+                resto = nodos[:i] + nodos[i + largo:]
+                mejor = None
+                for k in range(len(resto)):
+                    p = resto[k]
+                    q = resto[k + 1] if k + 1 < len(resto) else None
+                    for candidato in (tramo, tramo[::-1]):
+                        costo = matriz[p, candidato[0]]
+                        if q is not None:
+                            costo += matriz[candidato[-1], q] - matriz[p, q]
+                        if costo - ahorro < -1e-9 and (mejor is None or costo - ahorro < mejor[0]):
+                            mejor = (costo - ahorro, k, candidato)
+                if mejor is not None:
+                    _, k, candidato = mejor
+                    nodos = resto[:k + 1] + list(candidato) + resto[k + 1:]
+                    mejorado = True
+                    break
+                if time.perf_counter() >= fin:
+                    break
+            if mejorado or time.perf_counter() >= fin:
+                break
+    return nodos[1:]
+
+
+def dos_opt(matriz, limite_ms):
+    """Vecino más cercano mejorado con 2-opt"""
+    return mejorar_dos_opt(matriz, vecino_mas_cercano(matriz), _limite(limite_ms))
+
+
+def or_opt(matriz, limite_ms):
+    """Vecino más cercano mejorado con 2-opt y Or-opt alternados"""
+    fin = _limite(limite_ms)
+    ruta = vecino_mas_cercano(matriz)
+    distancia = distancia_ruta(matriz, ruta)
+    while time.perf_counter() < fin:
+        ruta = mejorar_or_opt(matriz, mejorar_dos_opt(matriz, ruta, fin), fin)
+        nueva_distancia = distancia_ruta(matriz, ruta)
+        if nueva_distancia >= distancia - 1e-9:
+            break
+        distancia = nueva_distancia
+    return ruta
+
+
+def exacto(matriz, limite_ms=None):
+    """
+    Held-Karp para rutas abiertas. Solo para n <= MAX_PARADAS_EXACTO paradas;
+    con más paradas se delega en Or-opt.
+    """
+    n = matriz.shape[0] - 1
+    if n > MAX_PARADAS_EXACTO:
+        return or_opt(matriz, limite_ms or settings.RUTA_LIMITE_MS)
+    if n <= 1:
+        return list(range(1, n + 1))
+
+    paradas = matriz[1:, 1:]
+    total = 1 << n
+    bits = 1 << np.arange(n)
+    # costo[mascara, j]: ruta más corta que visita `mascara` y termina en j
+    costo = np.full((total, n), np.inf)
+    previo = np.full((total, n), -1, dtype=np.int64)
+    costo[bits, np.arange(n)] = matriz[0, 1:]
+
+    mascaras = np.arange(total)
+    pertenece = (mascaras[:, None] & bits[None, :]) != 0
+    tamanos = pertenece.sum(axis=1)
+
+    # Se procesan juntas todas las máscaras con el mismo número de paradas;
+    # cada par (destino, k) se alcanza desde una única máscara de la capa
+    for tamano in range(1, n):
+        capa = mascaras[tamanos == tamano]
+        candidatos = costo[capa][:, :, None] + paradas[None, :, :]
+        mejores_j = np.argmin(candidatos, axis=1)
+        mejores = np.take_along_axis(candidatos, mejores_j[:, None, :], axis=1)[:, 0, :]
+        filas, ks = np.nonzero(~pertenece[capa])
+        destinos = capa[filas] | bits[ks]
+        costo[destinos, ks] = mejores[filas, ks]
+        previo[destinos, ks] = mejores_j[filas, ks]
+
+    completa = total - 1
+    j = int(np.argmin(costo[completa]))
+    ruta = []
+    mascara = completa
+    while j != -1:
+        ruta.append(j + 1)
+        anterior = int(previo[mascara, j])
+        mascara &= ~(1 << j)
+        j = anterior
+    return ruta[::-1]
+
+
+def automatica(matriz, limite_ms):
+    """Exacta para rutas cortas, heurística con presupuesto de tiempo para el resto"""
+    if matriz.shape[0] - 1 <= MAX_PARADAS_EXACTO:
+        return exacto(matriz, limite_ms)
+    return or_opt(matriz, limite_ms)
+
+
+ESTRATEGIAS = {
+    'auto': automatica,
+    'vecino': vecino_mas_cercano,
+    '2opt': dos_opt,
+    'oropt': or_opt,
+    'exacto': exacto,
+}
+
+
+def optimizar_ruta(matriz, estrategia='auto', limite_ms=None):
+    """
+    Calcula el orden de visita de las paradas.
+
+    `matriz` es la matriz (n + 1) x (n + 1) con el origen en la posición 0.
+    Retorna (orden, distancia_km), donde `orden` contiene las posiciones
+    1..n de las paradas en el orden de visita.
+    """
+    if estrategia not in ESTRATEGIAS:
+        raise ValueError(f"Estrategia de ruta desconocida: {estrategia}")
+    if limite_ms is None:
+        limite_ms = settings.RUTA_LIMITE_MS
+    matriz = np.asarray(matriz, dtype=np.float64)
+    ruta = ESTRATEGIAS[estrategia](matriz, limite_ms)
+    return ruta, distancia_ruta(matriz, ruta)
+
+
+def matriz_con_origen(distancias_origen, matriz_paradas):
+    """Arma la matriz (n + 1) x (n + 1) a partir de las distancias desde el origen"""
+    n = len(distancias_origen)
+    matriz = np.zeros((n + 1, n + 1), dtype=np.float64)
+    matriz[0, 1:] = distancias_origen
+    matriz[1:, 0] = distancias_origen
+    matriz[1:, 1:] = matriz_paradas
+    return matriz
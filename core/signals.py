@@ -0,0 +1,170 @@
+"""
+Señales de la app core para mantener sincronizadas las estructuras en memoria
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Cafeteria, Comentario, DuenoCafeteria, MeGusta, RecorridoCafeteria, RecorridoUsuario
+from .calificaciones import registrar_calificacion
+from .estadisticas import registrar_actividad
+from .geo import actualizar_cafeteria_en_indice, eliminar_cafeteria_de_indice
+from .mapa import invalidar_mapa
+from .me_gusta import sumar_me_gusta
+from .middleware import invalidar_rol_usuario
+from .matriz_distancias import actualizar_cafeteria_en_matriz, eliminar_cafeteria_de_matriz
+
+
+@receiver(post_save, sender=Cafeteria)
+def cafeteria_guardada(sender, instance, **kwargs):
+    """
+    Actualizar el índice espacial y la matriz de distancias cuando se guarda
+    una cafetería, al confirmarse la transacción (un rollback no los toca)
+    """
+    transaction.on_commit(partial(actualizar_cafeteria_en_indice, instance))
+    transaction.on_commit(partial(actualizar_cafeteria_en_matriz, instance))
+
+
+@receiver(post_delete, sender=Cafeteria)
+def cafeteria_eliminada(sender, instance, **kwargs):
+    """Quitar la cafetería del índice espacial y de la matriz de distancias"""
+    transaction.on_commit(partial(eliminar_cafeteria_de_indice, instance.pk))
+    transaction.on_commit(partial(eliminar_cafeteria_de_matriz, instance.pk))
+
+
+def _dia_de_creacion(instance):
+    """Día local en que se creó el registro: su actividad cuenta en ese día"""
+    return timezone.localdate(instance.fecha_creacion)
+
+
+@receiver(pre_save, sender=Comentario)
+def comentario_por_guardar(sender, instance, **kwargs):
+    """Recordar la calificación anterior cuando se edita un comentario"""
+    instance._calificacion_anterior = None
+    if instance.pk and not instance._state.adding:
+        instance._calificacion_anterior = (
+            Comentario.objects.filter(pk=instance.pk).values_list('calificacion', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Comentario)
+def comentario_guardado(sender, instance, created, **kwargs):
+    """Actualizar los agregados de calificación de la cafetería"""
+    anterior = getattr(instance, '_calificacion_anterior', None)
+    if created:
+        registrar_calificacion(instance.cafeteria_id, instance.calificacion)
+        registrar_actividad([instance.cafeteria_id], comentarios=1, suma_calificaciones=instance.calificacion)
+    elif anterior is not None and anterior != instance.calificacion:
+        registrar_calificacion(instance.cafeteria_id, anterior, signo=-1)
+        registrar_calificacion(instance.cafeteria_id, instance.calificacion)
+        registrar_actividad(
+            [instance.cafeteria_id], _dia_de_creacion(instance), suma_calificaciones=instance.calificacion - anterior
+        )
+
+
+def _borrado_con_cafeteria(origin):
+    """True si el borrado viene de eliminar la cafetería (no hay que registrar actividad)"""
+    if isinstance(origin, QuerySet):
+        return origin.model is Cafeteria
+    return isinstance(origin, Cafeteria)
+
+
+@receiver(post_delete, sender=Comentario)
+def comentario_eliminado(sender, instance, origin=None, **kwargs):
+    """Descontar la calificación del comentario borrado"""
+    registrar_calificacion(instance.cafeteria_id, instance.calificacion, signo=-1)
+    if not _borrado_con_cafeteria(origin):
+        registrar_actividad(
+            [instance.cafeteria_id], _dia_de_creacion(instance),
+            comentarios=-1, suma_calificaciones=-instance.calificacion,
+        )
+
+
+@receiver(post_save, sender=MeGusta)
+def me_gusta_guardado(sender, instance, created, **kwargs):
+    """Sumar el me gusta al contador y a la estadística diaria (ver me_gusta.py)"""
+    if created:
+        sumar_me_gusta(instance.cafeteria_id, 1, _dia_de_creacion(instance))
+
+
+@receiver(post_delete, sender=MeGusta)
+def me_gusta_eliminado(sender, instance, origin=None, **kwargs):
+    if not _borrado_con_cafeteria(origin):
+        sumar_me_gusta(instance.cafeteria_id, -1, _dia_de_creacion(instance))
+
+
+@receiver(pre_save, sender=RecorridoUsuario)
+def recorrido_usuario_por_guardar(sender, instance, **kwargs):
+    """Recordar el estado anterior para detectar cuándo se completa"""
+    instance._estado_anterior = None
+    if instance.pk and not instance._state.adding:
+        instance._estado_anterior = (
+            RecorridoUsuario.objects.filter(pk=instance.pk).values_list('estado', flat=True).first()
+        )
+
+
+def _cafeterias_del_recorrido(recorrido_id):
+    return list(RecorridoCafeteria.objects.filter(recorrido_id=recorrido_id).values_list('cafeteria_id', flat=True))
+
+
+@receiver(post_save, sender=RecorridoUsuario)
+def recorrido_usuario_guardado(sender, instance, created, **kwargs):
+    """Contar recorridos iniciados y completados para cada cafetería del recorrido"""
+    completado = instance.estado == 'C' and getattr(instance, '_estado_anterior', None) != 'C'
+    if not created and not completado:
+        return
+    cafeteria_ids = _cafeterias_del_recorrido(instance.recorrido_id)
+    registrar_actividad(
+        cafeteria_ids,
+        recorridos_iniciados=1 if created else 0,
+        recorridos_completados=1 if completado else 0,
+    )
+
+
+@receiver(pre_delete, sender=RecorridoUsuario)
+def recorrido_usuario_por_eliminar(sender, instance, **kwargs):
+    """
+    Recordar las cafeterías del recorrido: si se borra el recorrido, sus
+    RecorridoCafeteria pueden borrarse antes del post_delete
+    """
+    instance._cafeteria_ids = _cafeterias_del_recorrido(instance.recorrido_id)
+
+
+@receiver(post_delete, sender=RecorridoUsuario)
+def recorrido_usuario_eliminado(sender, instance, origin=None, **kwargs):
+    """Descontar el recorrido del día en que se inició y, si se completó, del día en que se completó"""
+    if _borrado_con_cafeteria(origin):
+        return
+    cafeteria_ids = getattr(instance, '_cafeteria_ids', None)
+    if cafeteria_ids is None:
+        cafeteria_ids = _cafeterias_del_recorrido(instance.recorrido_id)
+    registrar_actividad(cafeteria_ids, timezone.localdate(instance.fecha_inicio), recorridos_iniciados=-1)
+    if instance.estado == 'C':
+        registrar_actividad(
+            cafeteria_ids, timezone.localdate(instance.fecha_completado or instance.fecha_inicio),
+            recorridos_completados=-1,
+        )
+
+
+@receiver(post_save, sender=Cafeteria)
+@receiver(post_delete, sender=Cafeteria)
+@receiver(post_save, sender=Comentario)
+@receiver(post_delete, sender=Comentario)
+def datos_mapa_modificados(sender, **kwargs):
+    """
+    Nueva versión de los datos del mapa cuando se confirme la transacción.
+    Los me gusta invalidan el mapa desde me_gusta.py (una vez por volcado
+    con ME_GUSTA_DIFERIDO).
+    """
+    transaction.on_commit(invalidar_mapa)
+
+
+@receiver(post_save, sender=DuenoCafeteria)
+@receiver(post_delete, sender=DuenoCafeteria)
+def dueno_modificado(sender, instance, **kwargs):
+    """El estado de la solicitud define el rol del usuario en DuenoRedirectMiddleware"""
+    transaction.on_commit(lambda: invalidar_rol_usuario(instance.user_id))
@@ -1,3 +1,1119 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+from io import StringIO
+from itertools import permutations
+from decimal import ROUND_HALF_UP, Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .me_gusta import (
+    CACHE_ME_GUSTA_LISTA_FIN, me_gusta_pendientes, sumar_me_gusta, total_me_gusta, volcar_me_gusta,
+)
+from .calificaciones import reconciliar_calificaciones
+from .destacados import (
+    CACHE_DESTACADOS, CANTIDAD_DESTACADOS, ids_destacados, recorridos_destacados, seleccionar_destacados, semana_iso,
+)
+from .estadisticas import CAMPOS, reconstruir_estadisticas, totales_actividad
+from .geo import (
+    CACHE_VERSION_INDICE, CoordenadasCafeterias, IndiceEspacial, haversine_km, haversine_muchos_a_muchos, haversine_uno_a_muchos,
+    obtener_indice, top_k,
+)
+from .mapa import (
+    CACHE_VERSION_MAPA, TAMANO_GRUPO_PX, ZOOM_MAX_AGRUPADO, IndiceMapa, _a_pixeles, invalidar_mapa, obtener_datos_mapa,
+    version_mapa,
+)
+from .matriz_distancias import (
+    CAPACIDAD_EXTRA, MatrizDistancias, actualizar_cafeteria_en_matriz, construir_matriz, eliminar_cafeteria_de_matriz,
+)
+from .middleware import CACHE_ROL_USUARIO, ROL_DUENO, ROL_REGULAR, rol_usuario
+from .models import (
+    Cafeteria, Comentario, DuenoCafeteria, EstadisticaDiaria, EstadisticaGeneralDiaria, HorarioCafeteria, MeGusta,
+    Recorrido, RecorridoCafeteria, RecorridoDestacadoSemanal, RecorridoUsuario,
+)
+from .planificador import TablaHorarios, _exacto_ventanas, _simular, planificar_recorrido, ventana_sin_horario
+from .rutas import (
+    ESTRATEGIAS, MAX_PARADAS_EXACTO, distancia_ruta, exacto, matriz_con_origen, mejorar_dos_opt, mejorar_or_opt,
+    optimizar_ruta, vecino_mas_cercano,
+)
+from .voice_service import dividir_en_frases
+
+
+class DividirEnFrasesTests(SimpleTestCase):
+
+    def test_divide_en_fin_de_oracion(self):
+        texto = ('Te recomiendo el americano de Café Heritage. '
+                 '¿Prefieres algo suave? El capuchino de Milk & Coffee es ideal!')
+        self.assertEqual(dividir_en_frases(texto), [
+            'Te recomiendo el americano de Café Heritage.',
+            '¿Prefieres algo suave? El capuchino de Milk & Coffee es ideal!',
+        ])
+
+    def test_frases_cortas_se_unen_a_la_siguiente(self):
+        texto = 'Hola. ¿Qué tal? Te recomiendo el americano de Café Heritage.'
+        self.assertEqual(dividir_en_frases(texto), [texto])
+
+    def test_ultima_frase_corta_se_une_a_la_anterior(self):
+        texto = 'Te recomiendo el americano de Café Heritage. Es muy bueno.'
+        self.assertEqual(dividir_en_frases(texto), [texto])
+
+    def test_titulos_en_negrita(self):
+        texto = ('**Americano:** intenso y aromático para empezar el día '
+                 '**Capuchino:** suave con espuma de leche cremosa')
+        self.assertEqual(dividir_en_frases(texto), [
+            '**Americano:** intenso y aromático para empezar el día',
+            '**Capuchino:** suave con espuma de leche cremosa',
+        ])
+
+    def test_fin_de_oracion_dentro_de_negrita(self):
+        texto = '**¿Te gusta el café bien fuerte?** Prueba un espresso doble en Café Origin.'
+        self.assertEqual(dividir_en_frases(texto), [
+            '**¿Te gusta el café bien fuerte?**',
+            'Prueba un espresso doble en Café Origin.',
+        ])
+
+    def test_texto_corto_o_vacio(self):
+        self.assertEqual(dividir_en_frases('Sí.'), ['Sí.'])
+        self.assertEqual(dividir_en_frases('   '), [])
+
+
+@override_settings(ME_GUSTA_DIFERIDO=True)
+class MeGustaDiferidoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cafeterias = [
+            Cafeteria.objects.create(
+                nombre=f'Café {numero}', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+            )
+            for numero in range(3)
+        ]
+
+    def _sumar(self, cafeteria, delta):
+        with self.captureOnCommitCallbacks(execute=True):
+            sumar_me_gusta(cafeteria.pk, delta, timezone.localdate())
+
+    def _guardado(self, cafeteria):
+        cafeteria.refresh_from_db()
+        return cafeteria.total_me_gusta
+
+    def test_el_me_gusta_no_escribe_hasta_el_volcado(self):
+        primera = self.cafeterias[0]
+        self._sumar(primera, 1)
+        self._sumar(primera, 1)
+        self.assertEqual(self._guardado(primera), 0)
+        self.assertEqual(total_me_gusta(primera.pk), 2)
+
+        self.assertEqual(volcar_me_gusta(), 1)
+        self.assertEqual(self._guardado(primera), 2)
+        self.assertEqual(me_gusta_pendientes(primera.pk), 0)
+        self.assertEqual(volcar_me_gusta(), 0)
+
+    def test_solo_se_vuelcan_las_cafeterias_anotadas(self):
+        primera, segunda, tercera = self.cafeterias
+        self._sumar(primera, 1)
+        self._sumar(tercera, 1)
+        self._sumar(tercera, 1)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(volcar_me_gusta(), 2)
+        # Solo se actualizan las cafeterías anotadas, sin recorrer las demás
+        actualizadas = [c['sql'] for c in consultas if c['sql'].startswith('UPDATE "core_cafeteria"')]
+        self.assertEqual(len(actualizadas), 2)
+        self.assertFalse([c['sql'] for c in consultas if c['sql'].startswith('SELECT "core_cafeteria"')])
+        self.assertEqual([self._guardado(c) for c in self.cafeterias], [1, 0, 2])
+
+    def test_vuelve_a_anotar_despues_del_volcado(self):
+        primera = self.cafeterias[0]
+        self._sumar(primera, 1)
+        volcar_me_gusta()
+        self._sumar(primera, -1)
+        self.assertEqual(volcar_me_gusta(), 1)
+        self.assertEqual(self._guardado(primera), 0)
+
+    def test_posicion_sin_escribir_se_salta_en_el_volcado_siguiente(self):
+        primera, segunda, _ = self.cafeterias
+        cache.set(CACHE_ME_GUSTA_LISTA_FIN, 1, None)  # posición reservada que nadie escribió
+        self._sumar(primera, 1)
+
+        self.assertEqual(volcar_me_gusta(), 0)
+        self.assertEqual(volcar_me_gusta(), 1)
+        self.assertEqual(self._guardado(primera), 1)
+        self._sumar(segunda, 1)
+        self.assertEqual(volcar_me_gusta(), 1)
+
+    def test_clave_expirada_durante_el_volcado(self):
+        primera = self.cafeterias[0]
+        self._sumar(primera, 1)
+        decr = cache.decr
+
+        def expirar(clave, delta=1, version=None):
+            cache.delete(clave)
+            return decr(clave, delta, version)
+
+        with patch.object(cache, 'decr', side_effect=expirar):
+            self.assertEqual(volcar_me_gusta(), 1)
+        self.assertEqual(self._guardado(primera), 1)
+        self.assertEqual(me_gusta_pendientes(primera.pk), 0)
+
+    def test_estadisticas_y_mapa_se_actualizan_en_el_volcado(self):
+        primera, segunda, _ = self.cafeterias
+        usuario = User.objects.create_user('ana')
+        version = cache.get(CACHE_VERSION_MAPA)
+        with self.captureOnCommitCallbacks(execute=True):
+            MeGusta.objects.create(usuario=usuario, cafeteria=primera)
+            MeGusta.objects.create(usuario=usuario, cafeteria=segunda)
+        self.assertFalse(EstadisticaDiaria.objects.exists())
+        self.assertEqual(cache.get(CACHE_VERSION_MAPA), version)
+
+        volcar_me_gusta()
+        self.assertEqual(totales_actividad(primera.pk)['me_gusta'], 1)
+        self.assertEqual(totales_actividad()['me_gusta'], 2)
+        self.assertNotEqual(cache.get(CACHE_VERSION_MAPA), version)
+
+
+class EstadisticasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cafeteria = Cafeteria.objects.create(
+            nombre='Café Heritage', descripcion='', direccion='Calle Bolívar',
+            latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+        )
+        self.usuario = User.objects.create_user('ana')
+        self.hace_tres_dias = timezone.now() - timedelta(days=3)
+
+    def _fila(self, dias_atras):
+        fecha = timezone.localdate() - timedelta(days=dias_atras)
+        return EstadisticaDiaria.objects.filter(cafeteria=self.cafeteria, fecha=fecha).values(*CAMPOS).first()
+
+    def test_quitar_un_me_gusta_descuenta_del_dia_en_que_se_dio(self):
+        me_gusta = MeGusta.objects.create(usuario=self.usuario, cafeteria=self.cafeteria)
+        MeGusta.objects.filter(pk=me_gusta.pk).update(fecha_creacion=self.hace_tres_dias)
+        reconstruir_estadisticas()
+
+        MeGusta.objects.filter(pk=me_gusta.pk).delete()
+        self.assertEqual(self._fila(3)['me_gusta'], 0)
+        self.assertIsNone(self._fila(0))
+        self.cafeteria.refresh_from_db()
+        self.assertEqual(self.cafeteria.total_me_gusta, 0)
+
+    def test_borrar_un_comentario_descuenta_del_dia_en_que_se_escribio(self):
+        comentario = Comentario.objects.create(
+            usuario=self.usuario, cafeteria=self.cafeteria, comentario='Muy bueno', calificacion=4
+        )
+        Comentario.objects.filter(pk=comentario.pk).update(fecha_creacion=self.hace_tres_dias)
+        reconstruir_estadisticas()
+
+        comentario.refresh_from_db()
+        comentario.calificacion = 5
+        comentario.save()
+        self.assertEqual(self._fila(3)['suma_calificaciones'], 5)
+        comentario.delete()
+        self.assertEqual(self._fila(3), dict.fromkeys(CAMPOS, 0))
+        self.assertIsNone(self._fila(0))
+
+    def test_las_senales_coinciden_con_la_reconstruccion(self):
+        MeGusta.objects.create(usuario=self.usuario, cafeteria=self.cafeteria)
+        Comentario.objects.create(usuario=self.usuario, cafeteria=self.cafeteria, comentario='Rico', calificacion=5)
+        por_senales = (totales_actividad(), totales_actividad(self.cafeteria.pk))
+
+        reconstruir_estadisticas()
+        self.assertEqual((totales_actividad(), totales_actividad(self.cafeteria.pk)), por_senales)
+
+    def _filas_y_totales(self):
+        return (
+            list(EstadisticaDiaria.objects.order_by('cafeteria_id', 'fecha').values('cafeteria_id', 'fecha', *CAMPOS)),
+            list(EstadisticaGeneralDiaria.objects.order_by('fecha').values('fecha', *CAMPOS)),
+            totales_actividad(),
+        )
+
+    def test_borrar_recorridos_coincide_con_la_reconstruccion(self):
+        recorridos = []
+        for nombre in ('Ruta centro', 'Ruta recoleta'):
+            recorrido = Recorrido.objects.create(
+                nombre=nombre, descripcion='', duracion_estimada=60, distancia_total=Decimal('1.5')
+            )
+            RecorridoCafeteria.objects.create(recorrido=recorrido, cafeteria=self.cafeteria, orden=1)
+            recorridos.append(recorrido)
+        otro = User.objects.create_user('luis')
+        completado = RecorridoUsuario.objects.create(usuario=self.usuario, recorrido=recorridos[0])
+        RecorridoUsuario.objects.filter(pk=completado.pk).update(fecha_inicio=self.hace_tres_dias)
+        completado.refresh_from_db()
+        completado.estado = 'C'
+        completado.fecha_completado = timezone.now()
+        completado.save()
+        RecorridoUsuario.objects.create(usuario=self.usuario, recorrido=recorridos[1])
+        RecorridoUsuario.objects.create(usuario=otro, recorrido=recorridos[0])
+        RecorridoUsuario.objects.create(usuario=otro, recorrido=recorridos[1])
+        reconstruir_estadisticas()
+        self.assertEqual(totales_actividad()['recorridos_iniciados'], 4)
+
+        # Borrados en cascada: del usuario y del recorrido con sus cafeterías
+        self.usuario.delete()
+        recorridos[1].delete()
+        por_senales = self._filas_y_totales()
+        self.assertEqual(por_senales[2]['recorridos_iniciados'], 1)
+        self.assertEqual(por_senales[2]['recorridos_completados'], 0)
+
+        reconstruir_estadisticas()
+        reconstruidas = self._filas_y_totales()
+        # La reconstrucción no crea filas en cero
+        self.assertEqual([fila for fila in por_senales[0] if any(fila[campo] for campo in CAMPOS)], reconstruidas[0])
+        self.assertEqual([fila for fila in por_senales[1] if any(fila[campo] for campo in CAMPOS)], reconstruidas[1])
+        self.assertEqual(por_senales[2], reconstruidas[2])
+
+
+class IndiceEspacialTests(SimpleTestCase):
+
+    def setUp(self):
+        generador = np.random.default_rng(7)
+        self.puntos = {
+            punto_id: (float(lat), float(lng))
+            for punto_id, (lat, lng) in enumerate(
+                zip(generador.uniform(-19.07, -19.01, 60), generador.uniform(-65.29, -65.23, 60)), 1
+            )
+        }
+        self.indice = IndiceEspacial()
+        for punto_id, (lat, lng) in self.puntos.items():
+            self.indice.agregar(punto_id, lat, lng)
+
+    def _fuerza_bruta(self, lat, lng, k, radio_km=None, filtro=None):
+        distancias = sorted(
+            (haversine_km(lat, lng, plat, plng), punto_id) for punto_id, (plat, plng) in self.puntos.items()
+            if filtro is None or punto_id in filtro
+        )
+        if radio_km is not None:
+            distancias = [(d, punto_id) for d, punto_id in distancias if d <= radio_km]
+        return distancias[:k]
+
+    def assertMismosCercanos(self, obtenidos, esperados):
+        self.assertEqual([punto_id for _, punto_id in obtenidos], [punto_id for _, punto_id in esperados])
+        for (d1, _), (d2, _) in zip(obtenidos, esperados):
+            self.assertAlmostEqual(d1, d2, places=9)
+
+    def test_coincide_con_fuerza_bruta(self):
+        for lat, lng in ((-19.04, -65.26), (-19.0, -65.2), (-19.1, -65.3), (-18.5, -65.26)):
+            for k in (1, 4, 10):
+                self.assertMismosCercanos(self.indice.k_cercanos(lat, lng, k), self._fuerza_bruta(lat, lng, k))
+
+    def test_radio_y_filtro(self):
+        filtro = set(range(1, 61, 3))
+        self.assertMismosCercanos(
+            self.indice.k_cercanos(-19.04, -65.26, 5, radio_km=1.5, filtro=filtro),
+            self._fuerza_bruta(-19.04, -65.26, 5, radio_km=1.5, filtro=filtro),
+        )
+
+    def test_k_mayor_que_la_cantidad_de_puntos(self):
+        cercanos = self.indice.k_cercanos(-19.04, -65.26, k=100)
+        self.assertEqual(len(cercanos), len(self.puntos))
+        self.assertMismosCercanos(cercanos, self._fuerza_bruta(-19.04, -65.26, 100))
+
+    def test_indice_vacio(self):
+        self.assertEqual(IndiceEspacial().k_cercanos(-19.04, -65.26, k=4), [])
+        self.assertEqual(self.indice.k_cercanos(-19.04, -65.26, k=0), [])
+
+    def test_eliminar_y_mover_puntos(self):
+        for punto_id in range(1, 31):
+            self.indice.eliminar(punto_id)
+            del self.puntos[punto_id]
+        self.indice.agregar(31, -19.5, -65.0)
+        self.puntos[31] = (-19.5, -65.0)
+        self.assertEqual(len(self.indice), 30)
+        self.assertMismosCercanos(self.indice.k_cercanos(-19.04, -65.26, 30), self._fuerza_bruta(-19.04, -65.26, 30))
+
+
+class IndiceCafeteriasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_el_indice_se_actualiza_al_confirmar_la_transaccion(self):
+        self.assertEqual(len(obtener_indice()), 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            cafeteria = Cafeteria.objects.create(
+                nombre='Café Heritage', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+            )
+            self.assertEqual(len(obtener_indice()), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(obtener_indice().k_cercanos(-19.04, -65.26, k=1)[0][1], cafeteria.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cafeteria.delete()
+        self.assertEqual(len(obtener_indice()), 0)
+
+    def test_la_version_no_se_repite_al_vaciar_la_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cafeteria.objects.create(
+                nombre='Café Heritage', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+            )
+        version = cache.get(CACHE_VERSION_INDICE)
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Cafeteria.objects.create(
+                nombre='Café Origin', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal('-19.0500000'), longitud=Decimal('-65.2600000'),
+            )
+        self.assertNotEqual(cache.get(CACHE_VERSION_INDICE), version)
+        self.assertEqual(len(obtener_indice()), 2)
+
+
+class MatrizDistanciasTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(MATRIZ_DISTANCIAS_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.cafeterias = [self._crear(-19.04 + i * 0.003, -65.26 - i * 0.002) for i in range(4)]
+
+    def _crear(self, lat, lng):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Cafeteria.objects.create(
+                nombre='Café', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal(f'{lat:.7f}'), longitud=Decimal(f'{lng:.7f}'),
+            )
+
+    def _esperada(self, a, b):
+        return haversine_km(float(a.latitud), float(a.longitud), float(b.latitud), float(b.longitud)) * settings.FACTOR_RODEO
+
+    def assertCoincideConFuerzaBruta(self, cafeterias):
+        matriz = MatrizDistancias()
+        for a in cafeterias:
+            for b in cafeterias:
+                self.assertAlmostEqual(matriz.distancia(a.pk, b.pk), self._esperada(a, b), places=4)
+                self.assertAlmostEqual(
+                    matriz.duracion(a.pk, b.pk), self._esperada(a, b) / settings.VELOCIDAD_CAMINATA_KMH * 60, places=3
+                )
+
+    def test_coincide_con_fuerza_bruta(self):
+        self.assertEqual(construir_matriz(), (4, 4 + CAPACIDAD_EXTRA))
+        self.assertCoincideConFuerzaBruta(self.cafeterias)
+        ids = [c.pk for c in self.cafeterias]
+        np.testing.assert_allclose(
+            MatrizDistancias().submatriz(ids),
+            [[self._esperada(a, b) for b in self.cafeterias] for a in self.cafeterias], atol=1e-4,
+        )
+
+    def test_matriz_vacia(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cafeteria.objects.all().delete()
+        self.assertEqual(construir_matriz(), (0, CAPACIDAD_EXTRA))
+        matriz = MatrizDistancias()
+        self.assertIsNone(matriz.distancia(self.cafeterias[0].pk, self.cafeterias[1].pk))
+        self.assertEqual(matriz.submatriz([]).shape, (0, 0))
+
+    def test_sin_matriz_no_se_escribe_nada(self):
+        self.assertFalse(actualizar_cafeteria_en_matriz(self.cafeterias[0]))
+        self.assertFalse(eliminar_cafeteria_de_matriz(self.cafeterias[0].pk))
+
+    def test_agregar_mover_y_eliminar_cafeterias(self):
+        construir_matriz()
+        nueva = self._crear(-19.05, -65.25)
+        self.assertCoincideConFuerzaBruta(self.cafeterias + [nueva])
+
+        movida = self.cafeterias[0]
+        movida.latitud = Decimal('-19.0300000')
+        with self.captureOnCommitCallbacks(execute=True):
+            movida.save()
+        self.assertCoincideConFuerzaBruta(self.cafeterias + [nueva])
+
+        eliminada = self.cafeterias.pop(1)
+        slot = MatrizDistancias().slot(eliminada.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            eliminada.delete()
+        matriz = MatrizDistancias()
+        self.assertIsNone(matriz.slot(eliminada.pk))
+        self.assertIsNone(matriz.distancia(eliminada.pk, nueva.pk))
+        self.assertIsNone(matriz.submatriz([eliminada.pk, nueva.pk]))
+
+        # El slot liberado se reutiliza
+        otra = self._crear(-19.06, -65.27)
+        self.assertEqual(MatrizDistancias().slot(otra.pk), slot)
+        self.assertCoincideConFuerzaBruta(self.cafeterias + [nueva, otra])
+
+    def test_sin_slots_libres_se_reconstruye_con_mas_capacidad(self):
+        with patch('core.matriz_distancias.CAPACIDAD_EXTRA', 0):
+            self.assertEqual(construir_matriz(), (4, 4))
+            nueva = self._crear(-19.05, -65.25)
+        self.assertEqual(len(MatrizDistancias().ids), 8)
+        self.assertCoincideConFuerzaBruta(self.cafeterias + [nueva])
+
+    def test_la_matriz_se_actualiza_al_confirmar_la_transaccion(self):
+        construir_matriz()
+        with self.captureOnCommitCallbacks() as callbacks:
+            nueva = Cafeteria.objects.create(
+                nombre='Café', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal('-19.0500000'), longitud=Decimal('-65.2500000'),
+            )
+            self.assertIsNone(MatrizDistancias().slot(nueva.pk))
+        for callback in callbacks:
+            callback()
+        self.assertIsNotNone(MatrizDistancias().slot(nueva.pk))
+
+
+class RolUsuarioTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('dueno')
+        self.solicitud = DuenoCafeteria.objects.create(
+            user=self.usuario, telefono='70000000', cedula='1234567', direccion_personal='Calle Bolívar',
+            nombre_cafeteria='Café Heritage', descripcion_cafeteria='', direccion_cafeteria='Calle Bolívar',
+            telefono_cafeteria='70000000',
+        )
+
+    def test_el_rol_se_guarda_en_cache_con_ttl_corto(self):
+        with patch.object(cache, 'set', wraps=cache.set) as guardar:
+            self.assertEqual(rol_usuario(self.usuario), ROL_REGULAR)
+        guardar.assert_called_once_with(CACHE_ROL_USUARIO.format(user_id=self.usuario.pk), ROL_REGULAR, settings.ROL_USUARIO_TIMEOUT)
+        with self.assertNumQueries(0):
+            self.assertEqual(rol_usuario(self.usuario), ROL_REGULAR)
+
+    def test_aprobar_la_solicitud_invalida_el_rol(self):
+        self.assertEqual(rol_usuario(self.usuario), ROL_REGULAR)
+        self.solicitud.estado = 'aprobado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.solicitud.save()
+        self.assertEqual(rol_usuario(self.usuario), ROL_DUENO)
+
+    def test_el_dueno_es_redirigido_a_su_panel(self):
+        DuenoCafeteria.objects.filter(pk=self.solicitud.pk).update(estado='aprobado')
+        self.client.force_login(self.usuario)
+        self.assertRedirects(self.client.get('/perfil/'), '/panel-dueno/', fetch_redirect_response=False)
+
+
+def _matriz_en_linea(posiciones):
+    """Matriz de distancias (km) entre puntos sobre una recta, con el origen en 0"""
+    puntos = np.array([0.0, *posiciones])
+    return np.abs(puntos[:, None] - puntos[None, :])
+
+
+@override_settings(HORARIO_SIN_CARGAR='08:00-20:00')
+class PlanificadorTests(SimpleTestCase):
+    # A 6 km/h cada km son 10 minutos de caminata
+
+    def setUp(self):
+        self.inicio = timezone.make_aware(datetime(2026, 10, 19, 9, 0))  # lunes
+        self.dia = self.inicio.weekday()
+
+    def _tabla(self, horarios):
+        filas = [
+            (cafe_id, self.dia, time(*apertura) if apertura else None, time(*cierre) if cierre else None, cerrado)
+            for cafe_id, (apertura, cierre, cerrado) in horarios.items()
+        ]
+        return TablaHorarios(filas, ventana_sin_horario())
+
+    def _planificar(self, ids, posiciones, tabla, inicio=None):
+        return planificar_recorrido(
+            ids, _matriz_en_linea(posiciones), inicio or self.inicio, tabla,
+            velocidad_kmh=6, estancia_min=30,
+        )
+
+    def test_ruta_mas_corta_si_todas_estan_abiertas(self):
+        tabla = self._tabla({cafe_id: ((7, 0), (22, 0), False) for cafe_id in (10, 20, 30)})
+        plan = self._planificar([10, 20, 30], [3.0, 1.0, 2.0], tabla)
+        self.assertEqual(plan['orden'], [20, 30, 10])
+        self.assertEqual(plan['omitidas'], [])
+        self.assertAlmostEqual(plan['distancia_km'], 3.0)
+        self.assertEqual([p['llegada'].strftime('%H:%M') for p in plan['paradas']], ['09:10', '09:50', '10:30'])
+        self.assertEqual(plan['duracion_min'], 120)
+
+    def test_se_omite_la_cafeteria_cerrada(self):
+        tabla = self._tabla({10: ((7, 0), (22, 0), False), 20: (None, None, True)})
+        plan = self._planificar([10, 20], [2.0, 1.0], tabla)
+        self.assertEqual(plan['orden'], [10])
+        self.assertEqual(plan['omitidas'], [20])
+
+    def test_cambia_el_orden_para_llegar_antes_del_cierre(self):
+        # La más lejana cierra pronto: hay que ir primero a ella
+        tabla = self._tabla({10: ((7, 0), (22, 0), False), 20: ((7, 0), (10, 0), False)})
+        plan = self._planificar([10, 20], [1.0, 2.0], tabla)
+        self.assertEqual(plan['orden'], [20, 10])
+        self.assertEqual(plan['omitidas'], [])
+
+    def test_espera_a_que_abra(self):
+        tabla = self._tabla({10: ((10, 0), (22, 0), False)})
+        plan = self._planificar([10], [1.0], tabla)
+        self.assertEqual(plan['paradas'][0]['espera_min'], 50)
+        self.assertEqual(plan['duracion_min'], 90)
+
+    def test_cierre_despues_de_medianoche(self):
+        tabla = self._tabla({10: ((18, 0), (2, 0), False)})
+        plan = self._planificar([10], [1.0], tabla, inicio=self.inicio.replace(hour=23))
+        self.assertEqual(plan['orden'], [10])
+
+    def test_abierta_desde_la_noche_anterior(self):
+        ayer = (self.dia - 1) % 7
+        tabla = TablaHorarios([(10, ayer, time(18), time(2), False), (10, self.dia, None, None, True)])
+        plan = self._planificar([10], [1.0], tabla, inicio=self.inicio.replace(hour=1))
+        self.assertEqual(plan['orden'], [10])
+        self.assertEqual(plan['paradas'][0]['llegada'].strftime('%H:%M'), '01:10')
+        # Después del cierre de la madrugada cuenta el horario del día (cerrada)
+        plan = self._planificar([10], [1.0], tabla, inicio=self.inicio.replace(hour=2))
+        self.assertEqual(plan['omitidas'], [10])
+
+    def test_sin_horario_usa_el_horario_configurado(self):
+        tabla = self._tabla({10: ((7, 0), (23, 0), False)})
+        plan = self._planificar([10, 20], [1.0, 2.0], tabla)
+        self.assertEqual(plan['orden'], [10, 20])
+        # A las 21:00 la que no tiene horario ya no se considera abierta
+        plan = self._planificar([10, 20], [1.0, 2.0], tabla, inicio=self.inicio.replace(hour=21))
+        self.assertEqual(plan['orden'], [10])
+        self.assertEqual(plan['omitidas'], [20])
+
+    @override_settings(HORARIO_SIN_CARGAR='')
+    def test_sin_horario_configurado_se_omite(self):
+        tabla = self._tabla({10: ((7, 0), (23, 0), False)})
+        plan = self._planificar([10, 20], [1.0, 2.0], tabla)
+        self.assertEqual(plan['omitidas'], [20])
+
+    @override_settings(HORARIO_SIN_CARGAR='todo el día')
+    def test_horario_configurado_invalido(self):
+        with self.assertRaises(ValueError):
+            ventana_sin_horario()
+
+    def test_ventanas_exacto_coincide_con_fuerza_bruta(self):
+        generador = np.random.default_rng(3)
+        for _ in range(20):
+            n = 5
+            puntos = generador.uniform(0, 3, size=(n + 1, 2))
+            tiempos = np.hypot(*(puntos[:, None, :] - puntos[None, :, :]).transpose(2, 0, 1)) * 10
+            abre = np.concatenate([[0], generador.uniform(540, 700, n)])
+            cierra = abre + np.concatenate([[np.inf], generador.uniform(30, 150, n)])
+            ruta = _exacto_ventanas(tiempos, abre, cierra, 540, 30)
+
+            mejor = None
+            for tamano in range(n, 0, -1):
+                for orden in permutations(range(1, n + 1), tamano):
+                    visitas = _simular(orden, tiempos, abre, cierra, 540, 30)
+                    if visitas is not None and (mejor is None or visitas[-1][1] < mejor):
+                        mejor = visitas[-1][1]
+                if mejor is not None:
+                    break
+            if mejor is None:
+                self.assertEqual(ruta, [])
+                continue
+            self.assertEqual(len(ruta), tamano)
+            self.assertAlmostEqual(_simular(ruta, tiempos, abre, cierra, 540, 30)[-1][1], mejor)
+
+    def test_ventanas_voraz_respeta_los_horarios(self):
+        n = MAX_PARADAS_EXACTO + 3
+        tabla = self._tabla({
+            cafe_id: ((9 + cafe_id % 4, 0), (11 + cafe_id % 4, 0), False) for cafe_id in range(1, n + 1)
+        })
+        ids = list(range(1, n + 1))
+        plan = self._planificar(ids, [0.3 * cafe_id for cafe_id in ids], tabla)
+        self.assertEqual(sorted(plan['orden'] + plan['omitidas']), ids)
+        for parada in plan['paradas']:
+            abre, cierra = tabla.ventana(parada['id'], self.dia)
+            comienzo = parada['llegada'] + timedelta(minutes=parada['espera_min'])
+            minutos = comienzo.hour * 60 + comienzo.minute
+            self.assertGreaterEqual(minutos, abre)
+            self.assertLessEqual(minutos + 30, cierra)
+
+
+class TablaHorariosTests(TestCase):
+
+    def test_cargar_desde_la_base_de_datos(self):
+        cafeteria = Cafeteria.objects.create(
+            nombre='Café Heritage', descripcion='', direccion='Calle Bolívar',
+            latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+        )
+        HorarioCafeteria.objects.create(cafeteria=cafeteria, dia_semana=0, hora_apertura=time(8), hora_cierre=time(1))
+        HorarioCafeteria.objects.create(cafeteria=cafeteria, dia_semana=6, cerrado=True)
+        with self.assertNumQueries(1):
+            tabla = TablaHorarios.cargar([cafeteria.pk])
+        self.assertEqual(tabla.ventana(cafeteria.pk, 0), (480, 25 * 60))
+        self.assertIsNone(tabla.ventana(cafeteria.pk, 6))
+        self.assertEqual(tabla.ventana(cafeteria.pk, 2), ventana_sin_horario())
+
+
+class HaversineTests(SimpleTestCase):
+
+    def setUp(self):
+        generador = np.random.default_rng(11)
+        self.lats = generador.uniform(-19.1, -19.0, 25)
+        self.lngs = generador.uniform(-65.3, -65.2, 25)
+
+    def test_distancia_conocida(self):
+        # Un grado de latitud sobre el meridiano
+        self.assertAlmostEqual(haversine_km(0, 0, 1, 0), 111.195, places=3)
+        self.assertEqual(haversine_km(-19.04, -65.26, -19.04, -65.26), 0.0)
+
+    def test_uno_a_muchos_coincide_con_el_escalar(self):
+        distancias = haversine_uno_a_muchos(-19.04, -65.26, self.lats, self.lngs)
+        esperadas = [haversine_km(-19.04, -65.26, lat, lng) for lat, lng in zip(self.lats, self.lngs)]
+        np.testing.assert_allclose(distancias, esperadas, rtol=1e-9)
+
+    def test_muchos_a_muchos_coincide_con_el_escalar(self):
+        matriz = haversine_muchos_a_muchos(self.lats, self.lngs)
+        esperada = [
+            [haversine_km(lat1, lng1, lat2, lng2) for lat2, lng2 in zip(self.lats, self.lngs)]
+            for lat1, lng1 in zip(self.lats, self.lngs)
+        ]
+        np.testing.assert_allclose(matriz, esperada, rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(
+            haversine_muchos_a_muchos(self.lats[:3], self.lngs[:3], self.lats, self.lngs), matriz[:3]
+        )
+
+    def test_vacios(self):
+        self.assertEqual(haversine_uno_a_muchos(-19.04, -65.26, [], []).shape, (0,))
+        self.assertEqual(haversine_muchos_a_muchos([], []).shape, (0, 0))
+
+    def test_top_k(self):
+        distancias = haversine_uno_a_muchos(-19.04, -65.26, self.lats, self.lngs)
+        for k in (1, 5, 25, 40):
+            np.testing.assert_array_equal(top_k(distancias, k), np.argsort(distancias, kind='stable')[:k])
+        self.assertEqual(len(top_k(distancias, 0)), 0)
+        self.assertEqual(len(top_k([], 3)), 0)
+
+    def test_coordenadas_cafeterias(self):
+        ids = list(range(100, 125))
+        coordenadas = CoordenadasCafeterias(ids, self.lats, self.lngs)
+        self.assertEqual(len(coordenadas), 25)
+        self.assertIn(110, coordenadas)
+        self.assertNotIn(99, coordenadas)
+        self.assertEqual(coordenadas.coordenadas_de(110), (self.lats[10], self.lngs[10]))
+        indices = coordenadas.indices_de([104, 999, 102])
+        np.testing.assert_array_equal(indices, [4, 2])
+        np.testing.assert_allclose(
+            coordenadas.distancias_desde(-19.04, -65.26, indices),
+            haversine_uno_a_muchos(-19.04, -65.26, self.lats[[4, 2]], self.lngs[[4, 2]]),
+        )
+        np.testing.assert_allclose(
+            coordenadas.matriz(indices), haversine_muchos_a_muchos(self.lats, self.lngs)[np.ix_([4, 2], [4, 2])]
+        )
+        self.assertEqual(len(CoordenadasCafeterias([], [], [])), 0)
+
+
+@override_settings(MATRIZ_DISTANCIAS_DIR='/nonexistent/matriz')
+class CafeteriasCercanasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cafeterias = [
+                Cafeteria.objects.create(
+                    nombre=f'Café {i}', descripcion='', direccion='Calle Bolívar',
+                    latitud=Decimal(f'{-19.04 - i * 0.004:.7f}'), longitud=Decimal('-65.2600000'),
+                )
+                for i in range(3)
+            ]
+
+    def _ids(self, respuesta):
+        self.assertEqual(respuesta.status_code, 200)
+        return [c['id'] for c in respuesta.json()['cafeterias']]
+
+    def test_ordenadas_por_distancia_con_k_mayor_que_el_total(self):
+        respuesta = self.client.get('/api/cercanas/', {'lat': -19.05, 'lng': -65.26, 'k': 10})
+        primera, segunda, tercera = (c.pk for c in self.cafeterias)
+        self.assertEqual(self._ids(respuesta), [tercera, segunda, primera])
+
+    def test_radio(self):
+        respuesta = self.client.get('/api/cercanas/', {'lat': -19.04, 'lng': -65.26, 'radius_km': 0.5})
+        self.assertEqual(self._ids(respuesta), [self.cafeterias[0].pk, self.cafeterias[1].pk])
+
+    def test_desde_otra_cafeteria_sin_matriz(self):
+        respuesta = self.client.get('/api/cercanas/', {'desde': self.cafeterias[0].pk, 'k': 5})
+        self.assertEqual(self._ids(respuesta), [self.cafeterias[1].pk, self.cafeterias[2].pk])
+        self.assertEqual(self.client.get('/api/cercanas/', {'desde': 999}).status_code, 404)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/api/cercanas/', {'lat': 'x', 'lng': -65.26}).status_code, 400)
+
+    def test_sin_cafeterias(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Cafeteria.objects.all().delete()
+        respuesta = self.client.get('/api/cercanas/', {'lat': -19.04, 'lng': -65.26})
+        self.assertEqual(self._ids(respuesta), [])
+
+
+class RutasTests(SimpleTestCase):
+
+    def _matriz(self, n, semilla):
+        puntos = np.random.default_rng(semilla).uniform(0, 2, size=(n + 1, 2))
+        return np.hypot(*(puntos[:, None, :] - puntos[None, :, :]).transpose(2, 0, 1))
+
+    def _fuerza_bruta(self, matriz):
+        n = matriz.shape[0] - 1
+        return min(distancia_ruta(matriz, orden) for orden in permutations(range(1, n + 1)))
+
+    def assertRutaValida(self, ruta, n):
+        self.assertEqual(sorted(ruta), list(range(1, n + 1)))
+
+    def test_exacto_coincide_con_fuerza_bruta(self):
+        for semilla in range(10):
+            for n in (2, 4, 7):
+                matriz = self._matriz(n, semilla)
+                ruta = exacto(matriz)
+                self.assertRutaValida(ruta, n)
+                self.assertAlmostEqual(distancia_ruta(matriz, ruta), self._fuerza_bruta(matriz))
+
+    def test_heuristicas_validas_y_no_peores_que_el_vecino_mas_cercano(self):
+        for semilla in range(5):
+            for n in (5, 20):
+                matriz = self._matriz(n, semilla)
+                voraz = distancia_ruta(matriz, vecino_mas_cercano(matriz))
+                for estrategia in ('2opt', 'oropt', 'auto'):
+                    ruta, distancia = optimizar_ruta(matriz, estrategia, limite_ms=1000)
+                    self.assertRutaValida(ruta, n)
+                    self.assertAlmostEqual(distancia, distancia_ruta(matriz, ruta))
+                    self.assertLessEqual(distancia, voraz + 1e-9)
+                if n <= 8:
+                    optima = self._fuerza_bruta(matriz)
+                    self.assertAlmostEqual(optimizar_ruta(matriz, 'oropt', limite_ms=1000)[1], optima, delta=optima * 0.1)
+
+    def test_dos_opt_deshace_un_cruce(self):
+        # Puntos sobre una recta visitados en zigzag
+        matriz = _matriz_en_linea([1.0, 3.0, 2.0, 4.0])
+        self.assertEqual(mejorar_dos_opt(matriz, [1, 3, 2, 4], float('inf')), [1, 3, 2, 4])
+        self.assertEqual(mejorar_dos_opt(matriz, [2, 1, 3, 4], float('inf')), [1, 3, 2, 4])
+
+    def test_or_opt_mueve_una_parada(self):
+        matriz = _matriz_en_linea([1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(mejorar_or_opt(matriz, [4, 1, 2, 3], float('inf')), [1, 2, 3, 4])
+
+    def test_rutas_vacias_y_de_una_parada(self):
+        for n in (0, 1):
+            matriz = self._matriz(n, 0)
+            for estrategia in ESTRATEGIAS:
+                self.assertEqual(optimizar_ruta(matriz, estrategia)[0], list(range(1, n + 1)))
+
+    def test_exacto_con_muchas_paradas_usa_or_opt(self):
+        matriz = self._matriz(MAX_PARADAS_EXACTO + 3, 0)
+        self.assertRutaValida(exacto(matriz, limite_ms=200), MAX_PARADAS_EXACTO + 3)
+
+    def test_estrategia_desconocida(self):
+        with self.assertRaises(ValueError):
+            optimizar_ruta(self._matriz(3, 0), 'genetico')
+
+    def test_matriz_con_origen(self):
+        matriz = matriz_con_origen([1.0, 2.0], [[0.0, 3.0], [3.0, 0.0]])
+        np.testing.assert_array_equal(matriz, [[0, 1, 2], [1, 0, 3], [2, 3, 0]])
+
+
+@override_settings(MATRIZ_DISTANCIAS_DIR='/nonexistent/matriz', HORARIO_SIN_CARGAR='00:00-23:59')
+class OrdenarRutaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ids = [
+                Cafeteria.objects.create(
+                    nombre=f'Café {i}', descripcion='', direccion='Calle Bolívar',
+                    latitud=Decimal(f'{-19.04 - km * 0.009:.7f}'), longitud=Decimal('-65.2600000'),
+                ).pk
+                for i, km in enumerate((3, 1, 2))
+            ]
+
+    def test_ordena_por_cercania(self):
+        respuesta = self.client.get('/api/ordenar-ruta/', {
+            'lat': -19.04, 'lng': -65.26, 'ids': self.ids + [999], 'hora_inicio': '10:00', 'estrategia': 'exacto',
+        })
+        datos = respuesta.json()
+        self.assertEqual(datos['orden'], [self.ids[1], self.ids[2], self.ids[0]])
+        self.assertEqual(datos['omitidas'], [])
+        self.assertAlmostEqual(datos['distancia_total_km'], 3 * 111.195 * 0.009 * settings.FACTOR_RODEO, places=1)
+
+    def test_parametros_invalidos(self):
+        for parametros in (
+            {'lat': 'x', 'lng': -65.26, 'ids': self.ids},
+            {'lat': -19.04, 'lng': -65.26, 'ids': self.ids, 'estrategia': 'genetico'},
+            {'lat': -19.04, 'lng': -65.26, 'ids': [999]},
+        ):
+            self.assertEqual(self.client.get('/api/ordenar-ruta/', parametros).status_code, 400)
+
+
+class DatosMapaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cafeteria = Cafeteria.objects.create(
+                nombre='Café Heritage', descripcion='', direccion='Calle Bolívar',
+                latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+            )
+
+    def test_geojson_con_etag(self):
+        respuesta = self.client.get('/api/cafeterias.geojson')
+        self.assertEqual(respuesta['Content-Type'], 'application/geo+json')
+        datos = json.loads(respuesta.content)
+        self.assertEqual(len(datos['features']), 1)
+        self.assertEqual(datos['features'][0]['geometry']['coordinates'], [-65.26, -19.04])
+        self.assertEqual(datos['features'][0]['properties']['nombre'], 'Café Heritage')
+
+        repetida = self.client.get('/api/cafeterias.geojson', HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+    def test_los_datos_se_construyen_una_vez_por_version(self):
+        primera = obtener_datos_mapa()
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_datos_mapa()['etag'], primera['etag'])
+
+        self.cafeteria.nombre = 'Café Origin'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cafeteria.save()
+        self.assertNotEqual(obtener_datos_mapa()['etag'], primera['etag'])
+
+    def test_comentarios_invalidan_el_mapa(self):
+        version = version_mapa()
+        with self.captureOnCommitCallbacks(execute=True):
+            Comentario.objects.create(
+                usuario=User.objects.create_user('ana'), cafeteria=self.cafeteria, comentario='Rico', calificacion=5
+            )
+        self.assertNotEqual(version_mapa(), version)
+        self.assertEqual(obtener_datos_mapa()['cafeterias'][0]['total_calificaciones'], 1)
+
+    def test_la_version_no_se_repite_al_vaciar_la_cache(self):
+        version = version_mapa()
+        cache.clear()
+        invalidar_mapa()
+        self.assertNotIn(version_mapa(), (0, version))
+
+
+def _cafeteria_mapa(i, lat, lng, calificacion=0.0, resenas=0):
+    return {
+        'id': i, 'nombre': f'Café {i}', 'latitud': lat, 'longitud': lng,
+        'calificacion_promedio': calificacion, 'total_calificaciones': resenas,
+    }
+
+
+class IndiceMapaTests(SimpleTestCase):
+
+    def setUp(self):
+        generador = np.random.default_rng(5)
+        self.cafeterias = [
+            _cafeteria_mapa(i, float(lat), float(lng), float(calificacion), int(resenas))
+            for i, (lat, lng, calificacion, resenas) in enumerate(zip(
+                generador.uniform(-19.08, -19.0, 80), generador.uniform(-65.3, -65.22, 80),
+                generador.uniform(1, 5, 80), generador.integers(0, 20, 80),
+            ))
+        ]
+        self.indice = IndiceMapa(self.cafeterias)
+        self.todo = (-180.0, -85.0, 180.0, 85.0)
+
+    def test_los_grupos_coinciden_con_la_grilla(self):
+        for zoom in (0, 10, 13, ZOOM_MAX_AGRUPADO):
+            x, y = _a_pixeles(self.indice.lats, self.indice.lngs, zoom)
+            celdas = {}
+            for i, celda in enumerate(zip(x // TAMANO_GRUPO_PX, y // TAMANO_GRUPO_PX)):
+                celdas.setdefault(celda, []).append(i)
+
+            cafeterias, grupos = self.indice.consultar(*self.todo, zoom)
+            self.assertEqual(len(cafeterias) + len(grupos), len(celdas))
+            self.assertEqual(len(cafeterias) + sum(g['total'] for g in grupos), len(self.cafeterias))
+            sueltas = {c['id'] for c in cafeterias}
+            self.assertEqual(sueltas, {m[0] for m in celdas.values() if len(m) == 1})
+
+            # Cada grupo se identifica por su centroide
+            por_centroide = {
+                (round(float(self.indice.lats[m].mean()), 9), round(float(self.indice.lngs[m].mean()), 9)): m
+                for m in celdas.values() if len(m) > 1
+            }
+            self.assertEqual(len(grupos), len(por_centroide))
+            for grupo in grupos:
+                miembros = por_centroide[(round(grupo['latitud'], 9), round(grupo['longitud'], 9))]
+                self.assertEqual(grupo['total'], len(miembros))
+                resenas = self.indice.resenas[miembros]
+                self.assertEqual(grupo['total_calificaciones'], int(resenas.sum()))
+                if resenas.sum():
+                    promedio = float((self.indice.calificaciones[miembros] * resenas).sum() / resenas.sum())
+                    self.assertAlmostEqual(grupo['calificacion_promedio'], round(promedio, 2))
+                self.assertEqual(grupo['limites'], [
+                    float(self.indice.lngs[miembros].min()), float(self.indice.lats[miembros].min()),
+                    float(self.indice.lngs[miembros].max()), float(self.indice.lats[miembros].max()),
+                ])
+
+    def test_con_zoom_alto_se_envian_las_cafeterias_de_la_vista(self):
+        vista = (-65.28, -19.06, -65.24, -19.02)
+        cafeterias, grupos = self.indice.consultar(*vista, ZOOM_MAX_AGRUPADO + 1)
+        self.assertEqual(grupos, [])
+        esperadas = {
+            c['id'] for c in self.cafeterias
+            if vista[1] <= c['latitud'] <= vista[3] and vista[0] <= c['longitud'] <= vista[2]
+        }
+        self.assertEqual({c['id'] for c in cafeterias}, esperadas)
+
+    def test_vista_que_cruza_el_antimeridiano(self):
+        indice = IndiceMapa([
+            _cafeteria_mapa(1, 10.0, 179.5), _cafeteria_mapa(2, 10.0, -179.5), _cafeteria_mapa(3, 10.0, 0.0),
+        ])
+        cafeterias, _ = indice.consultar(179.0, 0.0, -179.0, 20.0, 18)
+        self.assertEqual({c['id'] for c in cafeterias}, {1, 2})
+
+    def test_limites_y_mapa_vacio(self):
+        self.assertEqual(self.indice.limites(), [
+            float(self.indice.lngs.min()), float(self.indice.lats.min()),
+            float(self.indice.lngs.max()), float(self.indice.lats.max()),
+        ])
+        vacio = IndiceMapa([])
+        self.assertIsNone(vacio.limites())
+        self.assertEqual(vacio.consultar(*self.todo, 5), ([], []))
+
+
+class CafeteriasMapaApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Cafeteria.objects.create(
+                    nombre=f'Café {i}', descripcion='', direccion='Calle Bolívar',
+                    latitud=Decimal(f'{-19.04 - i * 0.0005:.7f}'), longitud=Decimal('-65.2600000'),
+                )
+
+    def test_agrupa_con_zoom_bajo_y_separa_con_zoom_alto(self):
+        respuesta = self.client.get('/api/mapa/', {'bbox': '-65.3,-19.1,-65.2,-19.0', 'zoom': 10}).json()
+        self.assertEqual((len(respuesta['cafeterias']), [g['total'] for g in respuesta['grupos']]), (0, [3]))
+        respuesta = self.client.get('/api/mapa/', {'bbox': '-65.3,-19.1,-65.2,-19.0', 'zoom': 18}).json()
+        self.assertEqual((len(respuesta['cafeterias']), respuesta['grupos']), (3, []))
+
+    def test_parametros_invalidos(self):
+        for parametros in ({}, {'bbox': '1,2,3', 'zoom': 5}, {'bbox': '1,2,3,4', 'zoom': 'x'}):
+            self.assertEqual(self.client.get('/api/mapa/', parametros).status_code, 400)
+
+
+class RecorridosDestacadosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.recorridos = [
+            Recorrido.objects.create(
+                nombre=f'Ruta {i}', descripcion='', duracion_estimada=60, distancia_total=Decimal('2.00'),
+            )
+            for i in range(6)
+        ]
+
+    def test_seleccion_reproducible_y_guardada(self):
+        elegidos = seleccionar_destacados(2026, 42)
+        self.assertEqual(len(elegidos), CANTIDAD_DESTACADOS)
+        self.assertEqual(
+            list(RecorridoDestacadoSemanal.objects.filter(anio=2026, semana=42).values_list('recorrido_id', flat=True)),
+            elegidos,
+        )
+        RecorridoDestacadoSemanal.objects.all().delete()
+        self.assertEqual(seleccionar_destacados(2026, 42), elegidos)
+
+    def test_la_seleccion_guardada_no_cambia(self):
+        elegidos = seleccionar_destacados(2026, 42)
+        Recorrido.objects.create(nombre='Nueva', descripcion='', duracion_estimada=30, distancia_total=Decimal('1.00'))
+        self.assertEqual(seleccionar_destacados(2026, 42), elegidos)
+        self.assertEqual(RecorridoDestacadoSemanal.objects.count(), CANTIDAD_DESTACADOS)
+
+    def test_reemplazar(self):
+        seleccionar_destacados(2026, 42)
+        Recorrido.objects.filter(pk__in=ids_destacados(2026, 42)).update(activo=False)
+        nuevos = seleccionar_destacados(2026, 42, reemplazar=True)
+        self.assertEqual(len(nuevos), CANTIDAD_DESTACADOS)
+        self.assertEqual(Recorrido.objects.filter(pk__in=nuevos, activo=True).count(), CANTIDAD_DESTACADOS)
+
+    def test_ids_desde_cache_sin_consultas(self):
+        anio, semana = semana_iso()
+        elegidos = ids_destacados()
+        with self.assertNumQueries(0):
+            self.assertEqual(ids_destacados(anio, semana), elegidos)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(ids_destacados(anio, semana), elegidos)
+
+    def test_se_omiten_los_recorridos_desactivados(self):
+        primero, segundo = ids_destacados()
+        Recorrido.objects.filter(pk=primero).update(activo=False)
+        self.assertEqual([r.pk for r in recorridos_destacados()], [segundo])
+
+    def test_sin_recorridos_activos(self):
+        Recorrido.objects.update(activo=False)
+        self.assertEqual(ids_destacados(2026, 42), [])
+        # La lista vacía también queda en caché: los pedidos siguientes no consultan
+        self.assertEqual(cache.get(CACHE_DESTACADOS.format(anio=2026, semana=42)), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(ids_destacados(2026, 42), [])
+
+    def test_comando(self):
+        salida = StringIO()
+        call_command('seleccionar_recorridos_destacados', '--semana', '2026-42', stdout=salida)
+        self.assertIn('2026-S42', salida.getvalue())
+        self.assertEqual(RecorridoDestacadoSemanal.objects.filter(anio=2026, semana=42).count(), CANTIDAD_DESTACADOS)
+        with self.assertRaises(CommandError):
+            call_command('seleccionar_recorridos_destacados', '--semana', '42', stdout=StringIO())
+
+
+class CalificacionesTests(TestCase):
+
+    def setUp(self):
+        self.cafeteria = Cafeteria.objects.create(
+            nombre='Café Heritage', descripcion='', direccion='Calle Bolívar',
+            latitud=Decimal('-19.0400000'), longitud=Decimal('-65.2600000'),
+        )
+        self.usuarios = [User.objects.create_user(f'usuario{i}') for i in range(4)]
+
+    def _comentar(self, usuario, calificacion):
+        return Comentario.objects.create(
+            usuario=usuario, cafeteria=self.cafeteria, comentario='Rico', calificacion=calificacion
+        )
+
+    def assertAgregadosDe(self, calificaciones):
+        self.cafeteria.refresh_from_db()
+        self.assertEqual(self.cafeteria.total_calificaciones, len(calificaciones))
+        self.assertEqual(self.cafeteria.suma_calificaciones, sum(calificaciones))
+        self.assertEqual(
+            self.cafeteria.histograma_calificaciones, {e: calificaciones.count(e) for e in range(1, 6)}
+        )
+        promedio = Decimal(sum(calificaciones)) / len(calificaciones) if calificaciones else Decimal(0)
+        self.assertEqual(self.cafeteria.calificacion_promedio, promedio.quantize(Decimal('0.01'), ROUND_HALF_UP))
+
+    def test_crear_editar_y_borrar_comentarios(self):
+        comentarios = [self._comentar(u, c) for u, c in zip(self.usuarios, (4, 5, 5, 2))]
+        self.assertAgregadosDe([4, 5, 5, 2])
+
+        comentarios[3].calificacion = 3
+        comentarios[3].save()
+        self.assertAgregadosDe([4, 5, 5, 3])
+
+        comentarios[0].delete()
+        self.assertAgregadosDe([5, 5, 3])
+        Comentario.objects.all().delete()
+        self.assertAgregadosDe([])
+
+    def test_nunca_por_debajo_de_cero(self):
+        comentario = self._comentar(self.usuarios[0], 4)
+        Cafeteria.objects.filter(pk=self.cafeteria.pk).update(
+            total_calificaciones=0, suma_calificaciones=0, calificaciones_4=0
+        )
+        comentario.delete()
+        self.assertAgregadosDe([])
+
+    def test_reconciliar_corrige_las_diferencias(self):
+        self._comentar(self.usuarios[0], 4)
+        self._comentar(self.usuarios[1], 5)
+        self.assertEqual(reconciliar_calificaciones(), 0)
+
+        Cafeteria.objects.filter(pk=self.cafeteria.pk).update(
+            total_calificaciones=7, calificaciones_1=3, calificacion_promedio=Decimal('2.00')
+        )
+        salida = StringIO()
+        call_command('reconciliar_calificaciones', str(self.cafeteria.pk), stdout=salida)
+        self.assertIn('1 cafeterías', salida.getvalue())
+        self.assertAgregadosDe([4, 5])
+
+    def test_reconciliar_respeta_el_promedio_sin_comentarios(self):
+        Cafeteria.objects.filter(pk=self.cafeteria.pk).update(calificacion_promedio=Decimal('4.50'))
+        self.assertEqual(reconciliar_calificaciones(), 0)
+        self.cafeteria.refresh_from_db()
+        self.assertEqual(self.cafeteria.calificacion_promedio, Decimal('4.50'))
@@ -27,6 +27,8 @@ urlpatterns = [
     path('mi-recorrido/<int:recorrido_id>/visitar/<int:cafeteria_id>/', 
          views.marcar_cafeteria_visitada, name='marcar_cafeteria_visitada'),
     path('estadisticas/', views.estadisticas, name='estadisticas'),
+    path('api/cafeterias.geojson', views.cafeterias_geojson, name='cafeterias_geojson'),
+    path('api/mapa/', views.cafeterias_mapa, name='cafeterias_mapa'),
     path('api/cercanas/', views.cafeterias_cercanas, name='cafeterias_cercanas'),
     path('api/ordenar-ruta/', views.ordenar_ruta_por_cercania, name='ordenar_ruta_por_cercania'),
 ]
@@ -3,21 +3,33 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-from django.db.models import Avg, Count
+from django.views.decorators.http import condition, require_http_methods
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.conf import settings
-import json
-import math
-import random
 import mimetypes
-from datetime import datetime
+import numpy as np
 from .models import (
     Cafeteria, Recorrido, RecorridoUsuario, Comentario, 
     MeGusta, PerfilUsuario, TipoCafe, Producto, DuenoCafeteria
 )
 from .forms import RegistroForm, PerfilForm, LoginForm, DuenoCafeteriaForm
+from .destacados import recorridos_destacados, semana_iso
+from .geo import obtener_coordenadas, obtener_indice, top_k
+from .mapa import obtener_datos_mapa, obtener_indice_mapa
+from .me_gusta import me_gusta_pendientes, total_me_gusta
+from .estadisticas import serie_actividad, totales_actividad
+from .planificador import interpretar_hora_inicio, planificar_recorrido
+from .matriz_distancias import matriz_recorrido, obtener_matriz
+from .rutas import ESTRATEGIAS
+
+
+# Máximo de resultados que puede pedir /api/cercanas/
+MAX_CAFETERIAS_CERCANAS = 50
 
 
 def validar_imagen(archivo):
@@ -51,60 +63,50 @@ def validar_imagen(archivo):
 
 def home(request):
     """Vista principal que muestra el mapa y las cafeterías"""
-    cafeterias = Cafeteria.objects.all()
-    
-    # Obtener todos los recorridos activos
-    recorridos_disponibles = list(Recorrido.objects.filter(activo=True))
-    
-    # Seleccionar 2 recorridos aleatorios que cambien cada semana
-    # Usar el número de semana del año como semilla para mantener consistencia
-    semana_actual = datetime.now().isocalendar()[1]  # Número de semana del año
-    year_actual = datetime.now().year
-    semilla = semana_actual + year_actual * 100  # Semilla única por semana y año
-    
-    # Establecer la semilla para reproducibilidad semanal
-    random.seed(semilla)
-    
-    # Seleccionar hasta 2 recorridos aleatorios
-    recorridos = []
-    if len(recorridos_disponibles) >= 2:
-        recorridos = random.sample(recorridos_disponibles, 2)
-    elif len(recorridos_disponibles) == 1:
-        recorridos = recorridos_disponibles
-    # Si no hay recorridos, la lista queda vacía
-    
-    # Preparar datos de cafeterías para el mapa JavaScript
-    cafeterias_json = []
-    for cafeteria in cafeterias:
-        cafeterias_json.append({
-            'id': cafeteria.id,
-            'nombre': cafeteria.nombre,
-            'descripcion': cafeteria.descripcion,
-            'direccion': cafeteria.direccion,
-            'latitud': float(cafeteria.latitud),
-            'longitud': float(cafeteria.longitud),
-            'telefono': cafeteria.telefono,
-            'horario': cafeteria.horario,
-            'precio_promedio': float(cafeteria.precio_promedio),
-            'wifi': cafeteria.wifi,
-            'terraza': cafeteria.terraza,
-            'estacionamiento': cafeteria.estacionamiento,
-            'zona': cafeteria.zona,
-            'calificacion_promedio': float(cafeteria.calificacion_promedio),
-            'total_calificaciones': cafeteria.total_calificaciones,
-            'total_me_gusta': cafeteria.total_me_gusta,
-        })
+    datos_mapa = obtener_datos_mapa()
     
     context = {
-        'cafeterias': cafeterias,
-        'recorridos': recorridos,
-        'cafeterias_json': json.dumps(cafeterias_json),
+        'cafeterias_destacadas': Cafeteria.objects.all()[:6],
+        'total_cafeterias': datos_mapa['total'],
+        'recorridos': recorridos_destacados(),
         'MAPBOX_ACCESS_TOKEN': getattr(settings, 'MAPBOX_ACCESS_TOKEN', ''),
-        'semana_actual': semana_actual,  # Para debug si es necesario
+        'semana_actual': semana_iso()[1],  # Para debug si es necesario
     }
     return render(request, 'core/home.html', context)
 
 
+@condition(etag_func=lambda request: obtener_datos_mapa()['etag'])
+def cafeterias_geojson(request):
+    """GeoJSON con todas las cafeterías; responde 304 si el navegador ya tiene esta versión"""
+    response = HttpResponse(obtener_datos_mapa()['geojson'], content_type='application/geo+json')
+    response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+@require_http_methods(["GET"])
+def cafeterias_mapa(request):
+    """
+    Cafeterías dentro de la vista del mapa.
+    Parámetros: bbox=oeste,sur,este,norte y zoom. Con zoom bajo las
+    cafeterías cercanas entre sí llegan agrupadas en `grupos`.
+    """
+    try:
+        oeste, sur, este, norte = (float(v) for v in request.GET.get('bbox', '').split(','))
+        zoom = int(request.GET.get('zoom'))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Parámetros bbox/zoom inválidos'}, status=400)
+
+    indice = obtener_indice_mapa()
+    cafeterias, grupos = indice.consultar(oeste, sur, este, norte, zoom)
+    return JsonResponse({
+        'success': True,
+        'zoom': zoom,
+        'cafeterias': cafeterias,
+        'grupos': grupos,
+        'limites': indice.limites(),
+    })
+
+
 def registro(request):
     """Vista para el registro de usuarios"""
     if request.method == 'POST':
@@ -199,26 +201,21 @@ def cafeteria_detail(request, cafeteria_id):
 @require_http_methods(["POST"])
 def toggle_me_gusta(request, cafeteria_id):
     """Toggle para me gusta de cafetería"""
-    cafeteria = get_object_or_404(Cafeteria, id=cafeteria_id)
-    
-    me_gusta, created = MeGusta.objects.get_or_create(
-        usuario=request.user,
-        cafeteria=cafeteria
-    )
-    
-    if not created:
-        me_gusta.delete()
-        cafeteria.total_me_gusta -= 1
-        liked = False
-    else:
-        cafeteria.total_me_gusta += 1
-        liked = True
-    
-    cafeteria.save()
+    cafeteria = get_object_or_404(Cafeteria.objects.only('id'), id=cafeteria_id)
+    
+    # Las señales de MeGusta solo tocan la columna total_me_gusta, con un UPDATE
+    # atómico o en lote (ver me_gusta.py)
+    with transaction.atomic():
+        eliminados, _ = MeGusta.objects.filter(usuario=request.user, cafeteria=cafeteria).delete()
+        if eliminados:
+            liked = False
+        else:
+            MeGusta.objects.get_or_create(usuario=request.user, cafeteria=cafeteria)
+            liked = True
     
     return JsonResponse({
         'liked': liked,
-        'total_likes': cafeteria.total_me_gusta
+        'total_likes': total_me_gusta(cafeteria.id)
     })
 
 
@@ -229,23 +226,21 @@ def agregar_comentario(request, cafeteria_id):
     cafeteria = get_object_or_404(Cafeteria, id=cafeteria_id)
     
     comentario_texto = request.POST.get('comentario')
-    calificacion = int(request.POST.get('calificacion'))
-    
-    if comentario_texto and calificacion:
-        comentario = Comentario.objects.create(
-            usuario=request.user,
-            cafeteria=cafeteria,
-            comentario=comentario_texto,
-            calificacion=calificacion
-        )
-        
-        # Actualizar calificación promedio
-        promedio = Comentario.objects.filter(cafeteria=cafeteria).aggregate(
-            avg=Avg('calificacion')
-        )['avg']
-        cafeteria.calificacion_promedio = round(promedio, 2)
-        cafeteria.total_calificaciones = Comentario.objects.filter(cafeteria=cafeteria).count()
-        cafeteria.save()
+    try:
+        calificacion = int(request.POST.get('calificacion'))
+    except (TypeError, ValueError):
+        calificacion = None
+    
+    if comentario_texto and calificacion in range(1, 6):
+        # La señal post_save actualiza los agregados de la cafetería con F()
+        with transaction.atomic():
+            comentario = Comentario.objects.create(
+                usuario=request.user,
+                cafeteria=cafeteria,
+                comentario=comentario_texto,
+                calificacion=calificacion
+            )
+        cafeteria.refresh_from_db(fields=['calificacion_promedio', 'total_calificaciones'])
         
         return JsonResponse({
             'success': True,
@@ -336,6 +331,7 @@ def marcar_cafeteria_visitada(request, recorrido_id, cafeteria_id):
     
     if visitadas >= total_cafeterias:
         recorrido_usuario.estado = 'C'
+        recorrido_usuario.fecha_completado = timezone.now()
         recorrido_usuario.save()
         return JsonResponse({
             'completado': True,
@@ -349,106 +345,184 @@ def marcar_cafeteria_visitada(request, recorrido_id, cafeteria_id):
     })
 
 
-def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calcula distancia Haversine en kilómetros entre dos coordenadas."""
-    R = 6371.0
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+def _cercanas_desde_cafeteria(cafe_id, k, radio_km, filtro):
+    """k cafeterías más cercanas a otra, leyendo su fila de la matriz precalculada"""
+    matriz = obtener_matriz()
+    fila = matriz.fila(cafe_id) if matriz is not None else None
+    if fila is None:
+        # Sin matriz: índice espacial desde las coordenadas de la cafetería
+        coordenadas = obtener_coordenadas()
+        if cafe_id not in coordenadas:
+            return None
+        lat, lng = coordenadas.coordenadas_de(cafe_id)
+        cercanas = obtener_indice().k_cercanos(lat, lng, k=k + 1, radio_km=radio_km, filtro=filtro)
+        return [(d, otro_id) for d, otro_id in cercanas if otro_id != cafe_id][:k]
+
+    ids, distancias = fila
+    validos = np.isfinite(distancias)
+    if radio_km is not None:
+        validos &= distancias <= radio_km
+    if filtro is not None:
+        validos &= np.isin(ids, list(filtro))
+    ids, distancias = ids[validos], distancias[validos]
+    return [(float(distancias[i]), int(ids[i])) for i in top_k(distancias, k)]
 
 
 @require_http_methods(["GET"])
 def cafeterias_cercanas(request):
-    """Devuelve las 4 cafeterías más cercanas a una ubicación dada (lat, lng)."""
+    """
+    Devuelve las k cafeterías más cercanas a una ubicación dada (lat, lng).
+    Parámetros opcionales: k (por defecto 4), radius_km y tipo.
+    Con desde=<id de cafetería> se usan las distancias a pie precalculadas
+    desde esa cafetería y no hace falta lat/lng.
+    """
     try:
-        lat = float(request.GET.get('lat'))
-        lng = float(request.GET.get('lng'))
+        desde = request.GET.get('desde')
+        desde = int(desde) if desde else None
+        if desde is None:
+            lat = float(request.GET.get('lat'))
+            lng = float(request.GET.get('lng'))
+        k = int(request.GET.get('k', 4))
+        radius_km = request.GET.get('radius_km')
+        radius_km = float(radius_km) if radius_km else None
     except (TypeError, ValueError):
         return JsonResponse({'success': False, 'error': 'Parámetros lat/lng inválidos'}, status=400)
 
-    tipo = request.GET.get('tipo')  # opcional
+    k = max(1, min(k, MAX_CAFETERIAS_CERCANAS))
 
-    cafeterias_qs = Cafeteria.objects.all()
+    tipo = request.GET.get('tipo')  # opcional
+    filtro = None
     if tipo:
-        cafeterias_qs = cafeterias_qs.filter(cafeteriatipocafe__tipo_cafe__nombre__iexact=tipo).distinct()
+        filtro = set(
+            Cafeteria.objects.filter(cafeteriatipocafe__tipo_cafe__nombre__iexact=tipo)
+            .values_list('id', flat=True)
+        )
 
-    cafeterias_list = []
-    for c in cafeterias_qs:
-        try:
-            d = _haversine_km(float(c.latitud), float(c.longitud), lat, lng)
-        except Exception:
-            continue
-        cafeterias_list.append((d, c))
+    if desde is not None:
+        cercanas = _cercanas_desde_cafeteria(desde, k, radius_km, filtro)
+        if cercanas is None:
+            return JsonResponse({'success': False, 'error': 'Cafetería no encontrada'}, status=404)
+    else:
+        cercanas = obtener_indice().k_cercanos(lat, lng, k=k, radio_km=radius_km, filtro=filtro)
+    cafeterias_por_id = Cafeteria.objects.in_bulk([cafe_id for _, cafe_id in cercanas])
 
-    cafeterias_list.sort(key=lambda x: x[0])
-    top4 = [c for _, c in cafeterias_list[:4]]
+    resultado = []
+    for distancia, cafe_id in cercanas:
+        c = cafeterias_por_id.get(cafe_id)
+        if c is None:
+            continue
+        resultado.append({
+            'id': c.id,
+            'nombre': c.nombre,
+            'direccion': c.direccion,
+            'latitud': float(c.latitud),
+            'longitud': float(c.longitud),
+            'calificacion': float(c.calificacion_promedio),
+            'me_gusta': c.total_me_gusta,
+            'distancia_km': round(distancia, 3),
+        })
 
     return JsonResponse({
         'success': True,
-        'cafeterias': [
-            {
-                'id': c.id,
-                'nombre': c.nombre,
-                'direccion': c.direccion,
-                'latitud': float(c.latitud),
-                'longitud': float(c.longitud),
-                'calificacion': float(c.calificacion_promedio),
-                'me_gusta': c.total_me_gusta,
-            } for c in top4
-        ]
+        'cafeterias': resultado
     })
 
 
 @require_http_methods(["GET"])
 def ordenar_ruta_por_cercania(request):
-    """Ordena una lista de cafeterías por cercanía incremental desde (lat,lng). Greedy NN."""
+    """
+    Ordena una lista de cafeterías para recorrerlas desde (lat,lng) con la menor distancia,
+    respetando los horarios de atención del día.
+    Parámetros opcionales: estrategia (auto, vecino, 2opt, oropt, exacto), limite_ms,
+    hora_inicio ('YYYY-MM-DDTHH:MM' o 'HH:MM', por defecto ahora) y velocidad_kmh.
+    """
     try:
         lat = float(request.GET.get('lat'))
         lng = float(request.GET.get('lng'))
         ids = request.GET.getlist('ids')
         ids = [int(x) for x in ids]
+        estrategia = request.GET.get('estrategia', 'auto')
+        limite_ms = min(int(request.GET.get('limite_ms', settings.RUTA_LIMITE_MS)), settings.RUTA_LIMITE_MS)
+        inicio = interpretar_hora_inicio(request.GET.get('hora_inicio'))
+        velocidad_kmh = float(request.GET.get('velocidad_kmh', settings.VELOCIDAD_CAMINATA_KMH))
+        if velocidad_kmh <= 0:
+            raise ValueError('velocidad_kmh debe ser positiva')
     except Exception:
         return JsonResponse({'success': False, 'error': 'Parámetros inválidos'}, status=400)
 
-    cafes = list(Cafeteria.objects.filter(id__in=ids))
-    if not cafes:
+    if estrategia not in ESTRATEGIAS:
+        return JsonResponse({'success': False, 'error': 'Estrategia inválida'}, status=400)
+
+    coordenadas = obtener_coordenadas()
+    ids_ruta = [cafe_id for cafe_id in dict.fromkeys(ids) if cafe_id in coordenadas]
+    if not ids_ruta:
         return JsonResponse({'success': False, 'error': 'Sin cafeterías'}, status=400)
 
-    ruta = []
-    current_lat, current_lng = lat, lng
-    remaining = cafes[:]
-    while remaining:
-        remaining.sort(key=lambda c: _haversine_km(current_lat, current_lng, float(c.latitud), float(c.longitud)))
-        nxt = remaining.pop(0)
-        ruta.append(nxt)
-        current_lat, current_lng = float(nxt.latitud), float(nxt.longitud)
+    plan = planificar_recorrido(
+        ids_ruta, matriz_recorrido(ids_ruta, lat, lng), inicio,
+        velocidad_kmh=velocidad_kmh, estrategia=estrategia, limite_ms=limite_ms,
+    )
 
     return JsonResponse({
         'success': True,
-        'orden': [c.id for c in ruta]
+        'orden': plan['orden'],
+        'omitidas': plan['omitidas'],
+        'paradas': [
+            {
+                'id': parada['id'],
+                'llegada': parada['llegada'].isoformat(timespec='minutes'),
+                'espera_min': parada['espera_min'],
+            } for parada in plan['paradas']
+        ],
+        'distancia_total_km': round(plan['distancia_km'], 3),
+        'duracion_min': plan['duracion_min'],
+        'estrategia': estrategia,
     })
 
 
 def estadisticas(request):
-    """Vista de estadísticas generales"""
-    total_cafeterias = Cafeteria.objects.count()
-    total_recorridos = RecorridoUsuario.objects.count()
-    recorridos_completados = RecorridoUsuario.objects.filter(estado='C').count()
+    """Vista de estadísticas generales (leídas de las filas diarias precalculadas)"""
+    totales = totales_actividad()
+    serie = serie_actividad()
     
     # Top 5 cafeterías más populares
-    top_cafeterias = Cafeteria.objects.annotate(
-        total_me_gusta_count=Count('megusta')
-    ).order_by('-total_me_gusta_count')[:5]
+    top_cafeterias = Cafeteria.objects.order_by('-total_me_gusta')[:5]
+    
+    # Distribución de calificaciones a partir de los histogramas de cada cafetería
+    histograma = Cafeteria.objects.aggregate(**{
+        str(estrellas): Coalesce(Sum(f'calificaciones_{estrellas}'), 0) for estrellas in range(1, 6)
+    })
+    total_calificaciones = sum(histograma.values())
+    distribucion_calificaciones = [
+        {
+            'estrellas': estrellas,
+            'total': histograma[str(estrellas)],
+            'porcentaje': round(100 * histograma[str(estrellas)] / total_calificaciones) if total_calificaciones else 0,
+        }
+        for estrellas in range(1, 6)
+    ]
+    
+    # Actividad = me gusta + comentarios + recorridos iniciados
+    actividad_diaria = [
+        sum(valores) for valores in zip(serie['me_gusta'], serie['comentarios'], serie['recorridos_iniciados'])
+    ]
+    actividad = {
+        'hoy': actividad_diaria[-1],
+        'ayer': actividad_diaria[-2],
+        'semana': sum(actividad_diaria[-7:]),
+    }
+    maximo = max(actividad.values()) or 1
+    actividad_porcentaje = {clave: round(100 * valor / maximo) for clave, valor in actividad.items()}
     
     context = {
-        'total_cafeterias': total_cafeterias,
-        'total_recorridos': total_recorridos,
-        'recorridos_completados': recorridos_completados,
+        'total_cafeterias': obtener_datos_mapa()['total'],
+        'total_recorridos': totales['recorridos_iniciados'],
+        'recorridos_completados': totales['recorridos_completados'],
         'top_cafeterias': top_cafeterias,
+        'distribucion_calificaciones': distribucion_calificaciones,
+        'actividad': actividad,
+        'actividad_porcentaje': actividad_porcentaje,
+        'serie': serie,
     }
     return render(request, 'core/estadisticas.html', context)
 
@@ -556,17 +630,22 @@ def panel_dueno(request):
     dueno = request.user.duenocafeteria
     cafeteria = dueno.cafeteria
     
-    # Estadísticas de la cafetería
-    total_productos = cafeteria.productos.count()
-    total_comentarios = cafeteria.comentario_set.count()
-    total_me_gusta = cafeteria.megusta_set.count()
+    # Estadísticas de la cafetería: contadores mantenidos al vuelo y filas diarias
+    productos = cafeteria.productos.aggregate(
+        total=Count('id'),
+        sin_imagen=Count('id', filter=Q(imagen__isnull=True)),
+    )
+    total_productos = productos['total']
+    total_comentarios = cafeteria.total_calificaciones
+    total_me_gusta = cafeteria.total_me_gusta + me_gusta_pendientes(cafeteria.id)
     calificacion_promedio = cafeteria.calificacion_promedio
+    totales = totales_actividad(cafeteria.id)
     
     # Comentarios recientes
-    comentarios_recientes = cafeteria.comentario_set.order_by('-fecha_creacion')[:5]
+    comentarios_recientes = cafeteria.comentario_set.select_related('usuario').order_by('-fecha_creacion')[:5]
     
     # Productos sin imagen
-    productos_sin_imagen = cafeteria.productos.filter(imagen__isnull=True).count()
+    productos_sin_imagen = productos['sin_imagen']
     
     context = {
         'dueno': dueno,
@@ -577,6 +656,9 @@ def panel_dueno(request):
         'calificacion_promedio': calificacion_promedio,
         'comentarios_recientes': comentarios_recientes,
         'productos_sin_imagen': productos_sin_imagen,
+        'recorridos_iniciados': totales['recorridos_iniciados'],
+        'recorridos_completados': totales['recorridos_completados'],
+        'serie': serie_actividad(cafeteria.id),
     }
     
     return render(request, 'dueno/panel.html', context)
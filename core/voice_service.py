@@ -4,9 +4,59 @@ Servicio de voz profesional usando Amazon Polly
 import boto3
 import base64
 import io
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from django.core.cache import cache
-import hashlib
+
+from .cache_audio import clave_audio, obtener_cache_audio
+
+
+MOTOR_POLLY = 'neural'
+
+# Bytes por parte al transmitir el audio de Polly
+TAMANO_PARTE = 16 * 1024
+
+# Las frases más cortas se unen a la siguiente (cada llamada a Polly tiene su demora)
+FRASE_MINIMA = 25
+
+# Fin de oración (también seguido del cierre de negrita **) o inicio de un título en
+# negrita: las respuestas del chat vienen en markdown y sus listas no llevan punto
+_FIN_DE_FRASE = re.compile(r'(?<=[.!?…])\s+|(?<=[.!?…:]\*\*)\s+|\s+(?=\*\*[A-ZÁÉÍÓÚÑ¿¡])')
+
+
+def dividir_en_frases(texto):
+    """Frases del texto en orden; las muy cortas se unen a la siguiente"""
+    frases, actual = [], ''
+    for frase in _FIN_DE_FRASE.split(texto.strip()):
+        actual = f'{actual} {frase}'.strip()
+        if len(actual) >= FRASE_MINIMA:
+            frases.append(actual)
+            actual = ''
+    if actual:
+        if frases:
+            frases[-1] = f'{frases[-1]} {actual}'
+        else:
+            frases.append(actual)
+    return frases
+
+
+def voces_permitidas():
+    """Voces que se pueden pedir: la de por defecto y las de POLLY_VOCES"""
+    return {settings.POLLY_VOICE_ID, *settings.POLLY_VOCES}
+
+
+_hilos_polly = None
+_hilos_polly_lock = threading.Lock()
+
+
+def _hilos():
+    """Hilos compartidos para generar frases: limita las llamadas simultáneas a Polly por proceso"""
+    global _hilos_polly
+    with _hilos_polly_lock:
+        if _hilos_polly is None:
+            _hilos_polly = ThreadPoolExecutor(max_workers=settings.TTS_HILOS, thread_name_prefix='polly')
+        return _hilos_polly
 
 
 class VoiceService:
@@ -51,33 +101,89 @@ class VoiceService:
             print(f"Error obteniendo voces: {e}")
             return []
     
-    def text_to_speech(self, text, voice_id=None):
+    def audio_mp3(self, text, voice_id=None):
         """
-        Convertir texto a audio usando Amazon Polly
-        Retorna: base64 del audio o None si hay error
+        MP3 del texto: del caché en disco si ya se generó con esa voz, si no
+        de Polly (y se guarda). Retorna None si Polly no está disponible.
         """
+        # Usar voz por defecto si no se especifica
+        if not voice_id:
+            voice_id = settings.POLLY_VOICE_ID
+        
+        cache_audio = obtener_cache_audio()
+        clave = clave_audio(text, voice_id, MOTOR_POLLY)
+        audio_data = cache_audio.leer(clave)
+        if audio_data is not None:
+            print(f"🎧 Audio desde caché: {len(audio_data)} bytes - sin llamar a Polly")
+            return audio_data
+        
         if not self.polly_client:
             print("❌ Polly client no disponible")
             return None
+        return b''.join(self.partes_mp3(text, voice_id))
+    
+    def partes_mp3(self, text, voice_id=None):
+        """
+        Llama a Polly y retorna un iterador con el MP3 por partes a medida que
+        llega; al terminar queda guardado en el caché de audio.
+        """
+        if not voice_id:
+            voice_id = settings.POLLY_VOICE_ID
+        
+        print(f"🔊 Generando audio con voz: {voice_id}")
+        print(f"📝 Texto: {text[:50]}...")
+        
+        # Generar audio con Polly (versión optimizada)
+        response = self.polly_client.synthesize_speech(
+            Text=text,
+            OutputFormat='mp3',  # MP3 es más compatible con navegadores
+            VoiceId=voice_id,
+            Engine=MOTOR_POLLY
+        )
+        return obtener_cache_audio().guardar_partes(
+            clave_audio(text, voice_id, MOTOR_POLLY), response['AudioStream'].iter_chunks(TAMANO_PARTE)
+        )
+    
+    def partes_mp3_por_frases(self, text, voice_id=None):
+        """
+        Como partes_mp3, pero genera cada frase por separado y en paralelo
+        (hasta TTS_HILOS a la vez) y las entrega en orden: la primera suena
+        mientras se generan las demás. Cada frase queda en el caché de audio,
+        así otras respuestas con la misma frase no llaman a Polly, y el audio
+        completo también se guarda al terminar.
+        """
+        if not voice_id:
+            voice_id = settings.POLLY_VOICE_ID
+        
+        frases = dividir_en_frases(text)
+        if len(frases) < 2:
+            return self.partes_mp3(text, voice_id)
         
+        print(f"🧩 Audio por frases: {len(frases)} partes en paralelo")
+        futuros = [_hilos().submit(self.audio_mp3, frase, voice_id) for frase in frases]
+        # Si la primera frase falla, el error sale antes de empezar a responder
+        primera = futuros[0].result()
+        if primera is None:
+            raise RuntimeError('Polly no generó audio')
+        
+        def partes():
+            yield primera
+            for futuro in futuros[1:]:
+                yield futuro.result()
+        
+        return obtener_cache_audio().guardar_partes(clave_audio(text, voice_id, MOTOR_POLLY), partes())
+    
+    def text_to_speech(self, text, voice_id=None):
+        """
+        Convertir texto a audio usando Amazon Polly (o el caché de audio)
+        Retorna: base64 del audio o None si hay error
+        """
         try:
-            # Usar voz por defecto si no se especifica
-            if not voice_id:
-                voice_id = settings.POLLY_VOICE_ID
-            
-            print(f"🔊 Generando audio con voz: {voice_id}")
-            print(f"📝 Texto: {text[:50]}...")
-            
-            # Generar audio con Polly (versión optimizada)
-            response = self.polly_client.synthesize_speech(
-                Text=text,
-                OutputFormat='mp3',  # MP3 es más compatible con navegadores
-                VoiceId=voice_id,
-                Engine='neural'
-            )
+            audio_data = self.audio_mp3(text, voice_id)
+            if audio_data is None:
+                return None
             
             # Convertir a base64
-            audio_data = response['AudioStream'].read()
             audio_base64 = base64.b64encode(audio_data).decode('utf-8')
             
             print(f"✅ Audio generado: {len(audio_base64)} caracteres")
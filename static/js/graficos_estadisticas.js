@@ -0,0 +1,37 @@
+// Gráficos de tendencia con las series diarias precalculadas en el servidor
+function graficarTendencia(canvasId, serie) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas || typeof Chart === 'undefined') {
+        console.log('⚠️ No se pudo dibujar el gráfico de tendencia');
+        return;
+    }
+    
+    const series = [
+        { clave: 'me_gusta', etiqueta: 'Me gusta', color: '#ef4444' },
+        { clave: 'comentarios', etiqueta: 'Comentarios', color: '#eab308' },
+        { clave: 'recorridos_iniciados', etiqueta: 'Recorridos iniciados', color: '#22c55e' },
+        { clave: 'recorridos_completados', etiqueta: 'Recorridos completados', color: '#3b82f6' }
+    ];
+    
+    new Chart(canvas, {
+        type: 'line',
+        data: {
+            labels: serie.fechas,
+            datasets: series.map(s => ({
+                label: s.etiqueta,
+                data: serie[s.clave],
+                borderColor: s.color,
+                backgroundColor: s.color,
+                tension: 0.3,
+                pointRadius: 2
+            }))
+        },
+        options: {
+            responsive: true,
+            interaction: { mode: 'index', intersect: false },
+            scales: {
+                y: { beginAtZero: true, ticks: { precision: 0 } }
+            }
+        }
+    });
+}
@@ -290,8 +290,9 @@ function inicializarMapa() {
         // Obtener ubicación del usuario
         obtenerUbicacionUsuario();
         
-        // Cargar cafeterías
+        // Cargar cafeterías de la vista actual y recargar al moverse
         cargarCafeterias();
+        map.on('moveend', programarCargaCafeterias);
         
     } catch (error) {
         console.error('❌ Error al inicializar el mapa:', error);
@@ -351,67 +352,144 @@ function obtenerUbicacionUsuario() {
     }
 }
 
-// Cargar todas las cafeterías
+// Crear el marcador de una cafetería con su popup
+function crearMarcadorCafeteria(cafeteria) {
+    const marker = L.marker(
+        [parseFloat(cafeteria.latitud), parseFloat(cafeteria.longitud)],
+        {
+            icon: cafeteriaIcon,
+            title: cafeteria.nombre
+        }
+    );
+    
+    // Popup con información de la cafetería
+    marker.bindPopup(`
+        <div class="max-w-sm">
+            <h3 class="font-bold text-lg text-coffee-700 mb-2">
+                ☕ ${cafeteria.nombre}
+            </h3>
+            <div class="text-sm text-gray-600 space-y-1">
+                <p><i class="fas fa-map-marker-alt mr-1"></i> ${cafeteria.direccion}</p>
+                <p><i class="fas fa-star mr-1 text-yellow-500"></i> ${cafeteria.calificacion_promedio} 
+                   <span class="text-xs">(${cafeteria.total_calificaciones} reseñas)</span></p>
+                <p><i class="fas fa-heart mr-1 text-red-500"></i> ${cafeteria.total_me_gusta} me gusta</p>
+                <p><i class="fas fa-clock mr-1"></i> ${cafeteria.horario}</p>
+                <p><i class="fas fa-phone mr-1"></i> ${cafeteria.telefono || 'No disponible'}</p>
+            </div>
+            <div class="mt-3 flex space-x-2">
+                <button onclick="verDetalleCafeteria(${cafeteria.id})" 
+                        class="bg-coffee-600 hover:bg-coffee-700 text-white px-3 py-1 rounded text-xs transition duration-200">
+                    Ver Detalles
+                </button>
+                <button onclick="navegarACafeteria(${cafeteria.latitud}, ${cafeteria.longitud})" 
+                        class="bg-blue-600 hover:bg-blue-700 text-white px-3 py-1 rounded text-xs transition duration-200">
+                    <i class="fas fa-directions mr-1"></i> Ir
+                </button>
+            </div>
+        </div>
+    `);
+    
+    return marker;
+}
+
+// Crear el marcador de un grupo de cafeterías (calculado en el servidor)
+function crearMarcadorGrupo(grupo) {
+    const tamano = grupo.total < 10 ? 40 : grupo.total < 100 ? 48 : 56;
+    const icono = L.divIcon({
+        className: 'custom-cafeteria-cluster',
+        html: `
+            <div style="
+                background-color: #8B4513;
+                color: white;
+                width: ${tamano}px;
+                height: ${tamano}px;
+                border-radius: 50%;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                font-weight: bold;
+                font-size: 14px;
+                box-shadow: 0 3px 6px rgba(0,0,0,0.3);
+                border: 3px solid #ffffff;
+            ">
+                ${grupo.total}
+            </div>
+        `,
+        iconSize: [tamano, tamano],
+        iconAnchor: [tamano / 2, tamano / 2]
+    });
+    
+    const marker = L.marker([grupo.latitud, grupo.longitud], {
+        icon: icono,
+        title: `${grupo.total} cafeterías · ⭐ ${grupo.calificacion_promedio}`
+    });
+    
+    // Al hacer clic acercar el mapa hasta separar el grupo
+    marker.on('click', function() {
+        const [oeste, sur, este, norte] = grupo.limites;
+        map.fitBounds([[sur, oeste], [norte, este]], { padding: [40, 40] });
+    });
+    
+    return marker;
+}
+
+let limitesCafeterias = null;
+let solicitudMapa = null;
+let esperaMapa = null;
+
+// Cargar las cafeterías visibles (el servidor las agrupa según el zoom)
 function cargarCafeterias() {
-    // Obtener cafeterías desde la variable global (pasada desde Django)
-    if (typeof cafeteriasData !== 'undefined' && cafeteriasData.length > 0) {
-        console.log(`📍 Cargando ${cafeteriasData.length} cafeterías...`);
-        
-        // Limpiar marcadores anteriores
-        cafeteriasMarkers.forEach(marker => map.removeLayer(marker));
-        cafeteriasMarkers = [];
-        
-        // Agregar marcador para cada cafetería
-        cafeteriasData.forEach(cafeteria => {
-            try {
-                const marker = L.marker(
-                    [parseFloat(cafeteria.latitud), parseFloat(cafeteria.longitud)],
-                    {
-                        icon: cafeteriaIcon,
-                        title: cafeteria.nombre
-                    }
-                ).addTo(map);
-                
-                // Popup con información de la cafetería
-                marker.bindPopup(`
-                    <div class="max-w-sm">
-                        <h3 class="font-bold text-lg text-coffee-700 mb-2">
-                            ☕ ${cafeteria.nombre}
-                        </h3>
-                        <div class="text-sm text-gray-600 space-y-1">
-                            <p><i class="fas fa-map-marker-alt mr-1"></i> ${cafeteria.direccion}</p>
-                            <p><i class="fas fa-star mr-1 text-yellow-500"></i> ${cafeteria.calificacion_promedio} 
-                               <span class="text-xs">(${cafeteria.total_calificaciones} reseñas)</span></p>
-                            <p><i class="fas fa-heart mr-1 text-red-500"></i> ${cafeteria.total_me_gusta} me gusta</p>
-                            <p><i class="fas fa-clock mr-1"></i> ${cafeteria.horario}</p>
-                            <p><i class="fas fa-phone mr-1"></i> ${cafeteria.telefono || 'No disponible'}</p>
-                        </div>
-                        <div class="mt-3 flex space-x-2">
-                            <button onclick="verDetalleCafeteria(${cafeteria.id})" 
-                                    class="bg-coffee-600 hover:bg-coffee-700 text-white px-3 py-1 rounded text-xs transition duration-200">
-                                Ver Detalles
-                            </button>
-                            <button onclick="navegarACafeteria(${cafeteria.latitud}, ${cafeteria.longitud})" 
-                                    class="bg-blue-600 hover:bg-blue-700 text-white px-3 py-1 rounded text-xs transition duration-200">
-                                <i class="fas fa-directions mr-1"></i> Ir
-                            </button>
-                        </div>
-                    </div>
-                `);
-                
-                cafeteriasMarkers.push(marker);
-                
-            } catch (error) {
-                console.error(`❌ Error al crear marcador para ${cafeteria.nombre}:`, error);
+    const vista = map.getBounds().pad(0.2);
+    const params = new URLSearchParams({
+        bbox: [vista.getWest(), vista.getSouth(), vista.getEast(), vista.getNorth()]
+            .map(v => v.toFixed(6)).join(','),
+        zoom: map.getZoom()
+    });
+    
+    // Cancelar la petición anterior si el usuario siguió moviendo el mapa
+    if (solicitudMapa) {
+        solicitudMapa.abort();
+    }
+    solicitudMapa = new AbortController();
+    
+    fetch(`/api/mapa/?${params}`, { signal: solicitudMapa.signal })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error);
+            }
+            limitesCafeterias = data.limites;
+            
+            // Limpiar marcadores anteriores
+            cafeteriasMarkers.forEach(marker => map.removeLayer(marker));
+            cafeteriasMarkers = [];
+            
+            data.grupos.forEach(grupo => {
+                cafeteriasMarkers.push(crearMarcadorGrupo(grupo).addTo(map));
+            });
+            data.cafeterias.forEach(cafeteria => {
+                try {
+                    cafeteriasMarkers.push(crearMarcadorCafeteria(cafeteria).addTo(map));
+                } catch (error) {
+                    console.error(`❌ Error al crear marcador para ${cafeteria.nombre}:`, error);
+                }
+            });
+            
+            console.log(`✅ ${data.cafeterias.length} cafeterías y ${data.grupos.length} grupos en la vista (zoom ${data.zoom})`);
+        })
+        .catch(error => {
+            if (error.name === 'AbortError') {
+                return;
             }
+            console.error('❌ Error al cargar cafeterías:', error);
+            mostrarNotificacion('No se pudieron cargar las cafeterías en el mapa.', 'error');
         });
-        
-        console.log(`✅ ${cafeteriasMarkers.length} cafeterías cargadas en el mapa`);
-        
-    } else {
-        console.log('⚠️ No hay datos de cafeterías disponibles');
-        mostrarNotificacion('No se pudieron cargar las cafeterías en el mapa.', 'error');
-    }
+}
+
+// Recargar al mover o hacer zoom, esperando a que el mapa se detenga
+function programarCargaCafeterias() {
+    clearTimeout(esperaMapa);
+    esperaMapa = setTimeout(cargarCafeterias, 250);
 }
 
 // Función para ver detalles de una cafetería
@@ -477,9 +555,9 @@ function centrarEnUbicacionActual() {
 
 // Botón para mostrar todas las cafeterías
 function mostrarTodasLasCafeterias() {
-    if (cafeteriasMarkers.length > 0) {
-        const group = new L.featureGroup(cafeteriasMarkers);
-        map.fitBounds(group.getBounds().pad(0.1));
+    if (limitesCafeterias) {
+        const [oeste, sur, este, norte] = limitesCafeterias;
+        map.fitBounds(L.latLngBounds([sur, oeste], [norte, este]).pad(0.1));
     }
 }
 